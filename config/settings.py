@@ -182,6 +182,29 @@ AUTH_USER_MODEL = 'core.Usuario'
 
 # config/settings.py (al final del todo)
 
+# --- PDF GENERADOS EN EL SERVIDOR (core/services_pdf.py) ---
+# Caché en disco de recibos, estados de cuenta y reportes; se puede borrar sin perder nada.
+PDF_CACHE_DIR = os.environ.get('PDF_CACHE_DIR', os.path.join(BASE_DIR, 'cache_pdf'))
+
+# --- CACHÉ DE REPORTES (core/services_cache.py) ---
+# REPORTES_CACHE=memoria (por defecto): cada proceso guarda sus reportes.
+# REPORTES_CACHE=archivo: un directorio compartido por todos los procesos del servidor.
+# La invalidación no depende de esto: la versión de datos está en la base de datos.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'reportes': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('REPORTES_CACHE_DIR', os.path.join(BASE_DIR, 'cache_reportes')),
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    } if os.environ.get('REPORTES_CACHE') == 'archivo' else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'reportes',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+
 LOGIN_REDIRECT_URL = '/'  # Al loguearse, ir al inicio
 LOGOUT_REDIRECT_URL = '/accounts/login/' # Al salir, ir al login
 
@@ -4,7 +4,8 @@ from django.contrib.auth.admin import UserAdmin
 from .models import (
     Usuario, Residencial, Apartamento, AreaSocial, 
     Reserva, BloqueoFecha, Gasto, Factura, LecturaGas, Aviso, Incidencia, ReportePago, IngresoExtraordinario,
-    CategoriaMarketplace, ProductoMarketplace
+    CategoriaMarketplace, ProductoMarketplace, EjecucionRobot, MovimientoBancario, Pago, AsignacionPago, ResumenDeuda,
+    NotificacionPago, CierreMensual, MorosidadResidencial
 )
 
 # --- CONFIGURACIÓN DE USUARIO ---
@@ -115,3 +116,58 @@ class ProductoMarketplaceAdmin(admin.ModelAdmin):
     list_filter = ('estado', 'categoria', 'residencial')
     search_fields = ('titulo', 'descripcion', 'vendedor__username', 'residencial__nombre')
     readonly_fields = ('fecha_publicacion',)
+
+@admin.register(EjecucionRobot)
+class EjecucionRobotAdmin(admin.ModelAdmin):
+    list_display = ('fecha_corrida', 'residencial', 'fase', 'estado', 'filas_afectadas', 'duracion_ms')
+    list_filter = ('estado', 'fase', 'fecha_corrida')
+    search_fields = ('residencial__nombre',)
+
+@admin.register(MovimientoBancario)
+class MovimientoBancarioAdmin(admin.ModelAdmin):
+    list_display = ('fecha', 'referencia', 'monto', 'estado', 'usuario', 'residencial')
+    list_filter = ('estado', 'residencial')
+    search_fields = ('referencia', 'descripcion', 'usuario__username')
+
+class AsignacionPagoInline(admin.TabularInline):
+    model = AsignacionPago
+    extra = 0
+    raw_id_fields = ('factura',)
+
+@admin.register(Pago)
+class PagoAdmin(admin.ModelAdmin):
+    list_display = ('fecha', 'usuario', 'monto', 'tipo_pago', 'origen', 'credito_generado', 'credito_disponible', 'estado', 'residencial')
+    list_filter = ('estado', 'tipo_pago', 'origen', 'residencial')
+    search_fields = ('usuario__username',)
+    inlines = [AsignacionPagoInline]
+
+@admin.register(ResumenDeuda)
+class ResumenDeudaAdmin(admin.ModelAdmin):
+    # Lo mantienen los servicios de cobro; se corrige con `reconstruir_resumen_deuda`
+    list_display = ('usuario', 'residencial', 'deuda_mantenimiento', 'deuda_gas', 'deuda_vencida', 'facturas_pendientes', 'vencimiento_mas_antiguo')
+    list_filter = ('residencial',)
+    search_fields = ('usuario__username',)
+    readonly_fields = [f.name for f in ResumenDeuda._meta.fields]
+
+@admin.register(NotificacionPago)
+class NotificacionPagoAdmin(admin.ModelAdmin):
+    # Cola de la API de pagos; la vacía el comando `procesar_notificaciones_pago`
+    list_display = ('clave_idempotencia', 'residencial', 'apartamento', 'monto', 'tipo_pago', 'estado', 'fecha_recepcion', 'fecha_proceso')
+    list_filter = ('estado', 'tipo_pago', 'residencial')
+    search_fields = ('clave_idempotencia', 'referencia', 'apartamento')
+    readonly_fields = [f.name for f in NotificacionPago._meta.fields]
+
+@admin.register(CierreMensual)
+class CierreMensualAdmin(admin.ModelAdmin):
+    # Los arma el comando `cierre_mensual`; se borran solos si llega un movimiento atrasado
+    list_display = ('residencial', 'mes', 'ingresos_facturas', 'ingresos_extraordinarios', 'total_gastos', 'saldo_apertura', 'saldo_cierre')
+    list_filter = ('residencial',)
+    readonly_fields = [f.name for f in CierreMensual._meta.fields]
+
+@admin.register(MorosidadResidencial)
+class MorosidadResidencialAdmin(admin.ModelAdmin):
+    # Las toma el comando `foto_morosidad` cada noche
+    list_display = ('residencial', 'fecha', 'vecinos_con_deuda', 'dias_30', 'dias_60', 'dias_90', 'mas_90', 'total')
+    list_filter = ('residencial',)
+    date_hierarchy = 'fecha'
+    readonly_fields = [f.name for f in MorosidadResidencial._meta.fields]
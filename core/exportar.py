@@ -0,0 +1,169 @@
+import csv
+import re
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from pathlib import Path
+from xml.sax.saxutils import escape
+from django.http import FileResponse, StreamingHttpResponse
+
+
+# ---------------------------------------------------------
+# EXPORTACIÓN DE REPORTES (CSV / XLSX en streaming)
+# ---------------------------------------------------------
+# Las filas llegan de un generador (normalmente un .iterator() con cursor del
+# lado del servidor) y se envían al navegador a medida que se leen: la memoria
+# del worker no crece con el tamaño del reporte.
+
+FORMATOS = ('csv', 'xlsx')
+
+TIPOS_CONTENIDO = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def _texto(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, datetime):
+        return valor.strftime('%d/%m/%Y %H:%M')
+    if isinstance(valor, date):
+        return valor.strftime('%d/%m/%Y')
+    if isinstance(valor, Decimal):
+        # Montos siempre con dos decimales (SQLite devuelve 1000 en vez de 1000.00)
+        return f'{valor:.2f}'
+    return str(valor)
+
+
+class _Eco:
+    """Destino de csv.writer que devuelve la línea en vez de guardarla."""
+
+    def write(self, linea):
+        return linea
+
+
+def filas_csv(encabezados, filas):
+    escritor = csv.writer(_Eco())
+    # BOM para que Excel abra los acentos bien
+    yield '\ufeff' + escritor.writerow(encabezados)
+    for fila in filas:
+        yield escritor.writerow([_texto(valor) for valor in fila])
+
+
+class _Tubo:
+    """
+    Archivo de solo escritura y sin seek para zipfile: acumula lo comprimido
+    hasta que el generador lo saca. Sin seek, zipfile escribe en modo streaming
+    (tamaños al final de cada entrada).
+    """
+
+    def __init__(self):
+        self.partes = []
+        self.posicion = 0
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        self.posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self.posicion
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b''.join(self.partes)
+        self.partes = []
+        return datos
+
+
+# Caracteres de control que XML no admite
+_NO_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_XLSX_FIJOS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def _celda(valor):
+    if isinstance(valor, (int, float, Decimal)) and not isinstance(valor, bool):
+        return f'<c t="n"><v>{valor}</v></c>'
+    texto = escape(_NO_XML.sub('', _texto(valor)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{texto}</t></is></c>'
+
+
+def filas_xlsx(encabezados, filas, hoja='Reporte', filas_por_bloque=500):
+    """
+    Genera un .xlsx mínimo (una hoja, texto en línea, sin estilos) escrito con
+    zipfile directo al flujo de salida. Produce bytes cada `filas_por_bloque` filas.
+    """
+    tubo = _Tubo()
+    with zipfile.ZipFile(tubo, 'w', compression=zipfile.ZIP_DEFLATED) as libro:
+        for nombre, contenido in _XLSX_FIJOS.items():
+            libro.writestr(nombre, contenido)
+        libro.writestr('xl/workbook.xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets><sheet name="{escape(hoja[:31])}" sheetId="1" r:id="rId1"/></sheets></workbook>'
+        ))
+        yield tubo.vaciar()
+
+        with libro.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as hoja_xml:
+            hoja_xml.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            hoja_xml.write(('<row>' + ''.join(_celda(e) for e in encabezados) + '</row>').encode('utf-8'))
+            for i, fila in enumerate(filas, 1):
+                hoja_xml.write(('<row>' + ''.join(_celda(valor) for valor in fila) + '</row>').encode('utf-8'))
+                if i % filas_por_bloque == 0:
+                    yield tubo.vaciar()
+            hoja_xml.write(b'</sheetData></worksheet>')
+        yield tubo.vaciar()
+    yield tubo.vaciar()
+
+
+def respuesta_exportacion(formato, nombre, encabezados, filas):
+    """
+    StreamingHttpResponse con el reporte en `formato` ('csv' o 'xlsx').
+    `filas` debe ser un iterable perezoso; se consume mientras se envía.
+    """
+    if formato == 'xlsx':
+        contenido = filas_xlsx(encabezados, filas)
+    else:
+        formato = 'csv'
+        contenido = filas_csv(encabezados, filas)
+
+    respuesta = StreamingHttpResponse(contenido, content_type=TIPOS_CONTENIDO[formato])
+    respuesta['Content-Disposition'] = f'attachment; filename="{nombre}.{formato}"'
+    return respuesta
+
+
+def respuesta_pdf(ruta):
+    """FileResponse con un PDF de core/services_pdf.py, para verlo en el navegador."""
+    # En disco lleva la versión: 'recibo_000123-3fa9….pdf' se descarga como 'recibo_000123.pdf'
+    nombre = Path(ruta).stem.rsplit('-', 1)[0]
+    return FileResponse(open(ruta, 'rb'), content_type='application/pdf', filename=f'{nombre}.pdf')
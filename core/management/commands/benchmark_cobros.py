@@ -0,0 +1,212 @@
+import json
+import time
+import tracemalloc
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.models import Residencial, Apartamento, Usuario, Factura, LecturaGas, ReportePago
+from core.services import procesar_pago_fifo
+from core.services_deuda import recalcular_resumen_deuda
+from core.services_facturacion import (
+    generar_cuotas_mensuales, aplicar_moras, ejecutar_residenciales,
+    tareas_del_dia, pronosticar_corridas
+)
+
+
+def restar_meses(fecha, meses):
+    """Primer día del mes que está `meses` antes del de `fecha`."""
+    total = fecha.year * 12 + (fecha.month - 1) - meses
+    return fecha.replace(year=total // 12, month=total % 12 + 1, day=1)
+
+
+class ContadorConsultas:
+    """Cuenta las consultas ejecutadas sin guardarlas (no infla la medición de memoria)."""
+
+    def __init__(self):
+        self.total = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.total += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark del robot cobrador: genera N residenciales x M apartamentos x K meses de '
+        'facturas, pagos y lecturas de gas, y mide tiempo, consultas y memoria pico de cada ruta '
+        'de cobro. Todo corre dentro de una transacción que se revierte al final. '
+        'Usar sobre una base de datos de prueba.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--residenciales', type=int, default=5, help='Cantidad de residenciales sintéticos (N).')
+        parser.add_argument('--apartamentos', type=int, default=50, help='Apartamentos por residencial (M).')
+        parser.add_argument('--meses', type=int, default=12, help='Meses de historial de facturas (K).')
+        parser.add_argument('--pagos', type=int, default=100, help='Cantidad de pagos FIFO a medir.')
+        parser.add_argument('--salida', default='benchmark_cobros.json', help='Archivo JSON con los resultados.')
+
+    def handle(self, *args, **options):
+        hoy = timezone.now().date()
+        parametros = {
+            'residenciales': options['residenciales'],
+            'apartamentos': options['apartamentos'],
+            'meses': options['meses'],
+            'pagos': options['pagos'],
+        }
+
+        self.stdout.write(self.style.SUCCESS(
+            f"=== Benchmark de cobros: {parametros['residenciales']} residenciales x "
+            f"{parametros['apartamentos']} aptos x {parametros['meses']} meses ({connection.vendor}) ==="
+        ))
+
+        resultados = {
+            'fecha': timezone.now().isoformat(),
+            'motor': connection.vendor,
+            'parametros': parametros,
+            'rutas': {},
+        }
+
+        with transaction.atomic():
+            medicion, residenciales = self._medir(lambda: self._generar_datos(
+                hoy, parametros['residenciales'], parametros['apartamentos'], parametros['meses']
+            ))
+            resultados['generacion'] = medicion
+            self._reportar('generacion de datos', medicion)
+
+            ids = [r.id for r in residenciales]
+            duenos = list(Usuario.objects.filter(residencial_id__in=ids).order_by('id')[:parametros['pagos']])
+            deudas = dict(Factura.objects.filter(
+                usuario__in=duenos, estado='PENDIENTE', tipo='CUOTA'
+            ).values('usuario_id').annotate(
+                total=Sum(Coalesce('saldo_pendiente', 'monto'))
+            ).values_list('usuario_id', 'total'))
+
+            rutas = {
+                'tareas_del_dia': lambda: len([t for t in tareas_del_dia(hoy) if t[0] in ids]),
+                'pronosticar_corridas': lambda: sum(p['cuotas'] for p in pronosticar_corridas(residenciales, hoy).values()),
+                'robot_cobrador': lambda: len(list(ejecutar_residenciales(
+                    [(rid, ('CUOTAS', 'MORAS')) for rid in ids], hoy
+                ))),
+                'cron_cuotas': lambda: sum(generar_cuotas_mensuales(r, hoy)['generadas'] for r in residenciales),
+                'aplicar_moras': lambda: sum(aplicar_moras(r, hoy) for r in residenciales),
+                'procesar_pago_fifo': lambda: sum(
+                    procesar_pago_fifo(d, deudas.get(d.id, Decimal('0.00')) + Decimal('100.00'), 'MANTENIMIENTO')['facturas_pagadas']
+                    for d in duenos
+                ),
+            }
+
+            # Cada ruta parte de los mismos datos: se mide dentro de un savepoint que se revierte
+            for nombre, ruta in rutas.items():
+                with transaction.atomic():
+                    medicion, filas = self._medir(ruta)
+                    medicion['filas'] = filas
+                    transaction.set_rollback(True)
+                resultados['rutas'][nombre] = medicion
+                self._reportar(nombre, medicion)
+
+            transaction.set_rollback(True)
+
+        with open(options['salida'], 'w', encoding='utf-8') as archivo:
+            json.dump(resultados, archivo, indent=2, ensure_ascii=False)
+
+        self.stdout.write(self.style.SUCCESS(f"\n=== Resultados guardados en {options['salida']} (datos revertidos) ==="))
+
+    def _medir(self, funcion):
+        contador = ContadorConsultas()
+        tracemalloc.start()
+        inicio = time.perf_counter()
+        try:
+            with connection.execute_wrapper(contador):
+                valor = funcion()
+            segundos = time.perf_counter() - inicio
+            _, pico = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'segundos': round(segundos, 4),
+            'consultas': contador.total,
+            'memoria_pico_kb': round(pico / 1024, 1),
+        }, valor
+
+    def _reportar(self, nombre, medicion):
+        filas = f" filas={medicion['filas']}" if 'filas' in medicion else ''
+        self.stdout.write(
+            f"  {nombre:<22} {medicion['segundos']:>9.3f}s  consultas={medicion['consultas']:<7} "
+            f"memoria={medicion['memoria_pico_kb']:>10.1f} KB{filas}"
+        )
+
+    def _generar_datos(self, hoy, residenciales, apartamentos, meses):
+        """Carga el escenario sintético con inserciones masivas. Retorna los residenciales creados."""
+        marca = timezone.now().strftime('%H%M%S%f')
+
+        nuevos = Residencial.objects.bulk_create([
+            Residencial(
+                nombre=f"Benchmark {marca} #{i + 1}", direccion="Sintético",
+                dia_corte=hoy.day, dias_gracia=15, porcentaje_mora=Decimal('5.00')
+            )
+            for i in range(residenciales)
+        ])
+
+        aptos = Apartamento.objects.bulk_create([
+            Apartamento(residencial=r, numero=f"A-{a + 1}", monto_cuota=Decimal(1000 + (a % 5) * 250))
+            for r in nuevos for a in range(apartamentos)
+        ], batch_size=1000)
+
+        duenos = Usuario.objects.bulk_create([
+            Usuario(
+                username=f"bench{marca}_{apto.residencial_id}_{apto.numero}", password='!',
+                residencial_id=apto.residencial_id, apartamento=apto,
+                saldo_favor_mantenimiento=Decimal('300.00') if n % 7 == 0 else Decimal('0.00')
+            )
+            for n, apto in enumerate(aptos)
+        ], batch_size=1000)
+
+        facturas = []
+        lecturas = []
+        reportes = []
+        for k in range(meses, 0, -1):
+            periodo = restar_meses(hoy, k)
+            vencimiento = periodo + timedelta(days=15)
+            for n, dueno in enumerate(duenos):
+                monto = dueno.apartamento.monto_cuota
+                # ~2/3 de las cuotas pagadas; el resto queda en la cartera morosa
+                pagada = (n + k) % 3 != 0
+                facturas.append(Factura(
+                    residencial_id=dueno.residencial_id, usuario=dueno, tipo='CUOTA',
+                    concepto=f"Mantenimiento {periodo.strftime('%B %Y')}", monto=monto,
+                    fecha_emision=periodo, fecha_vencimiento=vencimiento, periodo=periodo,
+                    estado='PAGADO' if pagada else 'PENDIENTE',
+                    monto_pagado=monto if pagada else Decimal('0.00'),
+                    saldo_pendiente=Decimal('0.00') if pagada else monto,
+                    fecha_pago=vencimiento if pagada else None,
+                    fecha_proxima_mora=None if pagada else vencimiento + timedelta(days=1)
+                ))
+                if pagada:
+                    reportes.append(ReportePago(
+                        residencial_id=dueno.residencial_id, usuario=dueno, monto=monto,
+                        estado='APROBADO', tipo_pago='MANTENIMIENTO'
+                    ))
+
+                consumo = Decimal(8 + n % 6)
+                lecturas.append(LecturaGas(
+                    residencial_id=dueno.residencial_id, apartamento=dueno.apartamento, fecha_lectura=periodo,
+                    lectura_anterior=Decimal(k * 20), lectura_actual=Decimal(k * 20) + consumo,
+                    precio_galon_mes=Decimal('150.00'), factor_conversion=Decimal('1.20'),
+                    consumo_galones=consumo * Decimal('1.20'), total_a_pagar=consumo * Decimal('1.20') * Decimal('150.00')
+                ))
+
+        Factura.objects.bulk_create(facturas, batch_size=2000)
+        LecturaGas.objects.bulk_create(lecturas, batch_size=2000)
+        ReportePago.objects.bulk_create(reportes, batch_size=2000)
+        # Las inserciones masivas no pasan por los servicios: el resumen de deuda se arma aquí
+        for residencial in nuevos:
+            recalcular_resumen_deuda(residencial=residencial, hoy=hoy)
+
+        return nuevos
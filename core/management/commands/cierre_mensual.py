@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from core.models import Residencial
+from core.services_cierre import cerrar_meses
+
+
+class Command(BaseCommand):
+    help = (
+        'Cierra los meses terminados de cada residencial (CierreMensual). Es idempotente: '
+        'correrlo a diario solo arma los meses nuevos y los que se invalidaron por movimientos atrasados.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--residencial', type=int, help='Solo este residencial (ID). Por defecto, todos.')
+
+    def handle(self, *args, **options):
+        residenciales = Residencial.objects.order_by('id')
+        if options['residencial']:
+            residenciales = residenciales.filter(pk=options['residencial'])
+
+        total = 0
+        for residencial in residenciales:
+            cerrados = cerrar_meses(residencial)
+            total += cerrados
+            if cerrados:
+                self.stdout.write(f"  {residencial.nombre[:40]:<40} {cerrados} meses cerrados")
+
+        self.stdout.write(self.style.SUCCESS(f"=== Cierre mensual terminado: {total} meses cerrados ==="))
@@ -1,84 +1,55 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
-from core.models import Residencial, Apartamento, Factura
-from datetime import timedelta
-from decimal import Decimal
+from core.services_facturacion import ejecutar_residenciales, tareas_del_dia
 
 class Command(BaseCommand):
     help = 'Genera cuotas de mantenimiento automáticas si hoy es el día de corte'
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Cantidad de procesos en paralelo (cada residencial usa su propia conexión y transacción).'
+        )
+        parser.add_argument(
+            '--resume', action='store_true',
+            help='Retoma una corrida interrumpida: salta los residenciales que ya terminaron hoy.'
+        )
+
+    def handle(self, *args, **options):
         self.stdout.write("🤖 Iniciando robot de facturación automática...")
-        
+
         hoy = timezone.now().date()
-        residenciales = Residencial.objects.all()
-        
-        total_generadas = 0
+        workers = max(1, options['workers'])
 
-        for res in residenciales:
-            # Validamos que el residencial tenga configurado el día de corte
-            if not res.dia_corte:
-                continue
+        # LÓGICA DE ACTIVACIÓN:
+        # Se activa si hoy es IGUAL o MAYOR al día de corte (en meses cortos, el
+        # último día del mes cuenta como corte). El "Mayor" es por seguridad: si el
+        # servidor se apaga el día 15, el día 16 el robot se da cuenta que no facturó.
+        # La base de datos solo devuelve los residenciales cuyo mes aún no está
+        # facturado (`ultimo_periodo_facturado`), así que los demás no cuestan nada.
+        tareas = tareas_del_dia(hoy, fases=('CUOTAS',), atrasados=True, reanudar=options['resume'])
+        self.stdout.write(f"📋 Residenciales pendientes de facturar este mes: {len(tareas)}")
 
-            # LÓGICA DE ACTIVACIÓN:
-            # Se activa si hoy es IGUAL o MAYOR al día de corte.
-            # (El "Mayor" es por seguridad: si el servidor se apaga el día 15, 
-            # el día 16 el robot se da cuenta que no facturó y lo hace).
-            if hoy.day >= res.dia_corte:
-                
-                # REVISAR SI YA EXISTEN FACTURAS DE ESTE MES
-                # Para no cobrar doble si el script corre mañana también.
-                existe = Factura.objects.filter(
-                    residencial=res,
-                    tipo='CUOTA',
-                    fecha_emision__month=hoy.month,
-                    fecha_emision__year=hoy.year
-                ).exists()
+        total_generadas = 0
+        resultados = []
+
+        for resultado in ejecutar_residenciales(tareas, hoy, workers=workers):
+            resultados.append(resultado)
+            nombre = resultado['nombre'] or f"#{resultado['residencial_id']}"
 
-                if not existe:
-                    self.stdout.write(f"⚡ Generando facturas para: {res.nombre} (Corte día {res.dia_corte})")
-                    
-                    apartamentos = Apartamento.objects.filter(residencial=res, monto_cuota__gt=0)
-                    
-                    for apto in apartamentos:
-                        dueno = apto.habitantes.first()
-                        
-                        if dueno:
-                            # 1. Crear Factura PENDIENTE
-                            nueva_factura = Factura.objects.create(
-                                residencial=res,
-                                usuario=dueno,
-                                tipo='CUOTA',
-                                concepto=f"Mantenimiento {timezone.now().strftime('%B %Y')}",
-                                monto=apto.monto_cuota,
-                                fecha_vencimiento=hoy + timedelta(days=res.dias_gracia),
-                                estado='PENDIENTE',
-                                saldo_pendiente=apto.monto_cuota
-                            )
-                            
-                            # 2. APLICAR SALDO A FAVOR (AUTOMÁTICO)
-                            if dueno.saldo_a_favor and dueno.saldo_a_favor > 0:
-                                if dueno.saldo_a_favor >= nueva_factura.monto:
-                                    # Paga todo
-                                    dueno.saldo_a_favor -= nueva_factura.monto
-                                    nueva_factura.monto_pagado = nueva_factura.monto
-                                    nueva_factura.saldo_pendiente = 0
-                                    nueva_factura.estado = 'PAGADO'
-                                    nueva_factura.fecha_pago = hoy
-                                else:
-                                    # Paga parcial
-                                    abono = dueno.saldo_a_favor
-                                    dueno.saldo_a_favor = 0
-                                    nueva_factura.monto_pagado = abono
-                                    nueva_factura.saldo_pendiente = nueva_factura.monto - abono
-                                
-                                dueno.save()
-                                nueva_factura.save()
-                            
-                            total_generadas += 1
-                else:
-                    self.stdout.write(f"✅ {res.nombre}: Ya tiene facturas de este mes. Saltando.")
+            if resultado['estado'] == 'OMITIDO':
+                self.stdout.write(f"🔒 {nombre}: {resultado['error']} Saltando.")
+            elif resultado['estado'] == 'ERROR':
+                self.stdout.write(f"❌ {nombre}: {resultado['error']}")
+            elif resultado['cuotas_generadas'] > 0:
+                self.stdout.write(f"⚡ {nombre}: {resultado['cuotas_generadas']} facturas generadas.")
+                total_generadas += resultado['cuotas_generadas']
             else:
-                self.stdout.write(f"⏳ {res.nombre}: Aún no es día de corte (Día {res.dia_corte}).")
+                self.stdout.write(f"✅ {nombre}: Ya tiene facturas de este mes. Saltando.")
+
+        if resultados:
+            self.stdout.write("⏱️ Tiempos por residencial:")
+            for r in sorted(resultados, key=lambda r: r['duracion'], reverse=True):
+                self.stdout.write(f"   {r['nombre'] or r['residencial_id']}: {r['duracion']:.2f}s ({r['estado']})")
 
-        self.stdout.write(f"🏁 Proceso terminado. Facturas generadas hoy: {total_generadas}")
\ No newline at end of file
+        self.stdout.write(f"🏁 Proceso terminado. Facturas generadas hoy: {total_generadas}")
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from core.models import Residencial
+from core.services_morosidad import tomar_foto_morosidad
+
+
+class Command(BaseCommand):
+    help = (
+        'Toma la foto diaria de morosidad (deuda por antigüedad) de cada residencial. '
+        'Pensado para correr cada noche; repetirlo el mismo día reemplaza la foto.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--residencial', type=int, help='Solo este residencial (ID). Por defecto, todos.')
+
+    def handle(self, *args, **options):
+        residenciales = Residencial.objects.order_by('id')
+        if options['residencial']:
+            residenciales = residenciales.filter(pk=options['residencial'])
+
+        hoy = timezone.now().date()
+        fotos = 0
+        for residencial in residenciales:
+            foto = tomar_foto_morosidad(residencial, hoy)
+            fotos += 1
+            if foto.vecinos_con_deuda:
+                self.stdout.write(
+                    f"  {residencial.nombre[:40]:<40} {foto.vecinos_con_deuda} vecinos con deuda, ${foto.total:,.2f}"
+                )
+
+        self.stdout.write(self.style.SUCCESS(f"=== Foto de morosidad del {hoy:%d/%m/%Y}: {fotos} residenciales ==="))
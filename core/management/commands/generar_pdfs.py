@@ -0,0 +1,44 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from core.models import Residencial
+from core.services_pdf import lote_pdf
+
+
+class Command(BaseCommand):
+    help = (
+        'Impresión de fin de mes: genera en paralelo los recibos del mes o los estados de cuenta '
+        'de todos los vecinos de un residencial y los empaqueta en un .zip.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('residencial_id', type=int, help='ID del residencial.')
+        parser.add_argument('tipo', choices=['recibos', 'estados'], help='Recibos pagados en el mes o estados de cuenta (a hoy).')
+        parser.add_argument('--mes', help='Mes de los recibos, AAAA-MM. Por defecto, el mes actual.')
+        parser.add_argument('--procesos', type=int, help='Procesos en paralelo. Por defecto, uno por CPU.')
+        parser.add_argument('--salida', help='Ruta del .zip. Por defecto, dentro de PDF_CACHE_DIR.')
+
+    def handle(self, *args, **options):
+        try:
+            residencial = Residencial.objects.get(pk=options['residencial_id'])
+        except Residencial.DoesNotExist:
+            raise CommandError(f"No existe el residencial #{options['residencial_id']}.")
+
+        hoy = timezone.now().date()
+        try:
+            anio, mes = map(int, options['mes'].split('-')) if options['mes'] else (hoy.year, hoy.month)
+        except ValueError:
+            raise CommandError("--mes debe tener el formato AAAA-MM.")
+
+        inicio = time.perf_counter()
+        try:
+            resultado = lote_pdf(
+                residencial, options['tipo'], anio, mes,
+                procesos=options['procesos'], destino=options['salida']
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {resultado['documentos']} PDF en {time.perf_counter() - inicio:.1f}s -> {resultado['zip']}"
+        ))
@@ -0,0 +1,36 @@
+import csv
+from django.core.management.base import BaseCommand, CommandError
+from core.models import Residencial
+from core.services_banco import importar_estado_cuenta
+
+
+class Command(BaseCommand):
+    help = 'Importa un estado de cuenta (CSV) del banco: aplica los depósitos conciliados y envía el resto a revisión'
+
+    def add_arguments(self, parser):
+        parser.add_argument('residencial_id', type=int, help='ID del residencial dueño de la cuenta.')
+        parser.add_argument('archivo', help='Ruta del CSV del banco.')
+        parser.add_argument('--bloque', type=int, default=500, help='Líneas por transacción.')
+
+    def handle(self, *args, **options):
+        try:
+            residencial = Residencial.objects.get(pk=options['residencial_id'])
+        except Residencial.DoesNotExist:
+            raise CommandError(f"No existe el residencial #{options['residencial_id']}.")
+
+        self.stdout.write(f"🏦 Importando estado de cuenta para {residencial.nombre}...")
+
+        try:
+            with open(options['archivo'], encoding='utf-8-sig', newline='') as archivo:
+                resumen = importar_estado_cuenta(residencial, archivo, tamano_bloque=max(1, options['bloque']))
+        except (OSError, ValueError, csv.Error) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {resumen['aplicadas']} depósitos aplicados (${resumen['monto_aplicado']:,.2f})."
+        ))
+        if resumen['en_revision']:
+            self.stdout.write(self.style.WARNING(f"🕵️ {resumen['en_revision']} depósitos quedaron en revisión."))
+        self.stdout.write(
+            f"Líneas leídas: {resumen['leidas']} | Duplicadas: {resumen['duplicadas']} | Ignoradas: {resumen['ignoradas']}"
+        )
@@ -0,0 +1,41 @@
+import time
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from core.services_pasarela import procesar_notificaciones
+
+
+class Command(BaseCommand):
+    help = 'Worker de la API de pagos: aplica en lotes los avisos de la pasarela que están en cola'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500, help='Avisos por transacción.')
+        parser.add_argument(
+            '--continuo', action='store_true',
+            help='No termina al vaciar la cola: espera `--intervalo` segundos y vuelve a revisar.'
+        )
+        parser.add_argument('--intervalo', type=float, default=5, help='Segundos de espera con la cola vacía (modo continuo).')
+
+    def handle(self, *args, **options):
+        lote = max(1, options['lote'])
+        total = {"aplicadas": 0, "rechazadas": 0, "monto_aplicado": Decimal('0.00')}
+
+        while True:
+            resumen = procesar_notificaciones(limite=lote)
+            for campo in total:
+                total[campo] += resumen[campo]
+
+            procesadas = resumen['aplicadas'] + resumen['rechazadas']
+            if procesadas:
+                self.stdout.write(
+                    f"  > Lote: {resumen['aplicadas']} aplicados (${resumen['monto_aplicado']:,.2f}), "
+                    f"{resumen['rechazadas']} rechazados."
+                )
+            # Un lote incompleto significa que la cola quedó vacía
+            if procesadas < lote:
+                if not options['continuo']:
+                    break
+                time.sleep(options['intervalo'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {total['aplicadas']} pagos aplicados (${total['monto_aplicado']:,.2f}), {total['rechazadas']} rechazados."
+        ))
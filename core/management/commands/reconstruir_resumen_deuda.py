@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from core.models import Residencial
+from core.services_deuda import recalcular_resumen_deuda
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye desde las facturas el resumen de deuda por vecino (ResumenDeuda).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--residencial', type=int, help='Solo este residencial (ID). Por defecto, todos.')
+
+    def handle(self, *args, **options):
+        hoy = timezone.now().date()
+        residenciales = Residencial.objects.order_by('id')
+        if options['residencial']:
+            residenciales = residenciales.filter(pk=options['residencial'])
+
+        total = 0
+        for residencial in residenciales:
+            # Cada residencial en su transacción: nunca se ve un resumen a medio reconstruir
+            with transaction.atomic():
+                filas = recalcular_resumen_deuda(residencial=residencial, hoy=hoy)
+            total += filas
+            self.stdout.write(f"  {residencial.nombre[:40]:<40} {filas} vecinos")
+
+        self.stdout.write(self.style.SUCCESS(f"=== Resumen de deuda reconstruido: {total} vecinos ==="))
@@ -1,152 +1,118 @@
+from decimal import Decimal
 from django.core.management.base import BaseCommand
 from django.utils import timezone
-from datetime import timedelta
-from decimal import Decimal
-from django.db import transaction
-from core.models import Residencial, Apartamento, Factura, Bitacora
+from core.models import Residencial
+from core.services_facturacion import ejecutar_residenciales, tareas_del_dia, pronosticar_corridas
+from core.services_deuda import refrescar_vencimientos
 
 class Command(BaseCommand):
     help = 'Robot Cobrador: Generación de Cuotas y Aplicación de Moras Automáticas'
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Cantidad de procesos en paralelo (cada residencial usa su propia conexión y transacción).'
+        )
+        parser.add_argument(
+            '--resume', action='store_true',
+            help='Retoma una corrida interrumpida: salta las fases que ya terminaron hoy.'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Solo muestra el pronóstico por residencial (cuotas, saldo a favor y moras) sin escribir nada.'
+        )
+
+    def handle(self, *args, **options):
         hoy = timezone.now().date()
-        mes_actual = hoy.month
-        anio_actual = hoy.year
-        
-        self.stdout.write(self.style.SUCCESS(f'=== Iniciando Robot Cobrador: {hoy} ==='))
-        
-        residenciales = Residencial.objects.all()
-        
-        for residencial in residenciales:
-            self.stdout.write(f'\nProcesando Residencial: {residencial.nombre}')
-            
-            # ---------------------------------------------------------
-            # FASE A: GENERACIÓN DE CUOTAS
-            # ---------------------------------------------------------
-            if hoy.day == residencial.dia_corte:
-                self.stdout.write(f'  > Hoy es el día de corte ({residencial.dia_corte}). Generando cuotas...')
-                self._generar_cuotas_masivas(residencial, mes_actual, anio_actual, hoy)
-            else:
-                self.stdout.write(f'  > Hoy NO es el día de corte (Día corte: {residencial.dia_corte}). Saltando generación.')
-
-            # ---------------------------------------------------------
-            # FASE B: APLICACIÓN DE MORAS AUTOMÁTICAS
-            # ---------------------------------------------------------
-            self.stdout.write(f'  > Revisando moras pendientes...')
-            self._aplicar_moras_masivas(residencial, hoy)
-            
+        workers = max(1, options['workers'])
+
+        if options['dry_run']:
+            self._pronostico(hoy)
+            return
+
+        self.stdout.write(self.style.SUCCESS(f'=== Iniciando Robot Cobrador: {hoy} ({workers} workers) ==='))
+
+        # Solo se cargan los residenciales con trabajo hoy: CUOTAS el día de corte
+        # (en meses cortos, el último día) y MORAS si tienen cuotas por recargar
+        tareas = tareas_del_dia(hoy, reanudar=options['resume'])
+
+        if options['resume']:
+            self.stdout.write('  > Retomando corrida: se omiten las fases que ya terminaron hoy.')
+        self.stdout.write(f'  > {len(tareas)} residenciales con trabajo pendiente.')
+
+        resultados = []
+        for resultado in ejecutar_residenciales(tareas, hoy, workers=workers):
+            self._reportar(resultado)
+            resultados.append(resultado)
+
+        self._resumen_tiempos(resultados)
+
+        # Facturas que vencieron hoy: pasan a la deuda vencida del resumen de cada vecino
+        refrescados = refrescar_vencimientos(hoy)
+        self.stdout.write(f'  > Resumen de deuda actualizado para {refrescados} vecinos con facturas recién vencidas.')
+
         self.stdout.write(self.style.SUCCESS('\n=== Robot Cobrador Finalizó con Éxito ==='))
 
-    def _generar_cuotas_masivas(self, residencial, mes_actual, anio_actual, hoy):
-        apartamentos = Apartamento.objects.filter(residencial=residencial, monto_cuota__gt=0)
-        contador = 0
-        
-        with transaction.atomic():
-            for apto in apartamentos:
-                dueno = apto.habitantes.first()
-                if not dueno:
-                    continue
-                    
-                existe = Factura.objects.filter(
-                    residencial=residencial,
-                    usuario=dueno,
-                    tipo='CUOTA',
-                    fecha_emision__month=mes_actual,
-                    fecha_emision__year=anio_actual
-                ).exists()
-                
-                if not existe:
-                    nueva_factura = Factura.objects.create(
-                        residencial=residencial,
-                        usuario=dueno,
-                        tipo='CUOTA',
-                        concepto=f"Mantenimiento {timezone.now().strftime('%B %Y')}",
-                        monto=apto.monto_cuota,
-                        fecha_vencimiento=hoy + timedelta(days=residencial.dias_gracia),
-                        estado='PENDIENTE',
-                        saldo_pendiente=apto.monto_cuota
-                    )
-                    
-                    if dueno.saldo_favor_mantenimiento > 0:
-                        if dueno.saldo_favor_mantenimiento >= nueva_factura.monto:
-                            dueno.saldo_favor_mantenimiento -= nueva_factura.monto
-                            nueva_factura.monto_pagado = nueva_factura.monto
-                            nueva_factura.saldo_pendiente = 0
-                            nueva_factura.estado = 'PAGADO'
-                            nueva_factura.fecha_pago = hoy
-                        else:
-                            abono = dueno.saldo_favor_mantenimiento
-                            dueno.saldo_favor_mantenimiento = 0
-                            nueva_factura.monto_pagado = abono
-                            nueva_factura.saldo_pendiente = nueva_factura.monto - abono
-                            
-                        dueno.save()
-                        nueva_factura.save()
-                        
-                    contador += 1
-            
-            # FASE C: AUDITORÍA (BITÁCORA)
-            if contador > 0:
-                Bitacora.objects.create(
-                    residencial=residencial,
-                    usuario=None,
-                    modulo='FINANZAS/ROBOT',
-                    accion=f"El Sistema (Robot Cobrador) generó {contador} cuotas de mantenimiento para el mes.",
-                    nivel='INFO'
-                )
-                self.stdout.write(self.style.SUCCESS(f'    - Se generaron {contador} cuotas exitosamente.'))
-            else:
-                self.stdout.write('    - No hubo cuotas nuevas por generar.')
-
-    def _aplicar_moras_masivas(self, residencial, hoy):
-        porcentaje_str = str(residencial.porcentaje_mora or 0)
-        porcentaje = Decimal(porcentaje_str)
-        
-        if porcentaje <= 0:
-            self.stdout.write('    - El residencial no tiene configurado un porcentaje de mora.')
+    def _reportar(self, resultado):
+        if resultado['estado'] == 'OMITIDO':
+            self.stdout.write(self.style.WARNING(f"\nResidencial #{resultado['residencial_id']}: {resultado['error']} Saltando."))
             return
 
-        with transaction.atomic():
-            facturas_pendientes = Factura.objects.filter(
-                residencial=residencial,
-                tipo='CUOTA',
-                estado='PENDIENTE',
-                fecha_vencimiento__lt=hoy
+        self.stdout.write(f"\nProcesando Residencial: {resultado['nombre']}")
+
+        if resultado['estado'] == 'ERROR':
+            self.stdout.write(self.style.ERROR(f"  > Error: {resultado['error']} (se revirtieron sus cambios)"))
+            return
+
+        if resultado['cuotas_generadas'] is None:
+            self.stdout.write('  > No corresponde generar cuotas en esta corrida. Saltando generación.')
+        elif resultado['cuotas_generadas'] > 0:
+            self.stdout.write(self.style.SUCCESS(f"  > Se generaron {resultado['cuotas_generadas']} cuotas exitosamente."))
+        else:
+            self.stdout.write('  > No hubo cuotas nuevas por generar.')
+
+        if resultado['moras_aplicadas']:
+            self.stdout.write(self.style.WARNING(f"  > Se aplicó mora a {resultado['moras_aplicadas']} cuotas vencidas."))
+        else:
+            self.stdout.write('  > No se encontraron moras pendientes por aplicar.')
+
+    def _resumen_tiempos(self, resultados):
+        if not resultados:
+            return
+
+        self.stdout.write('\n--- Tiempos por Residencial ---')
+        for r in sorted(resultados, key=lambda r: r['duracion'], reverse=True):
+            nombre = r['nombre'] or f"#{r['residencial_id']}"
+            self.stdout.write(
+                f"  {nombre[:30]:<30} {r['estado']:<8} cuotas={r['cuotas_generadas'] or 0:<6} "
+                f"moras={r['moras_aplicadas'] or 0:<6} {r['duracion']:.2f}s"
             )
-            
-            contador_aplicadas = 0
-            
-            for factura in facturas_pendientes:
-                aplicar = False
-                
-                if factura.fecha_ultima_mora is None:
-                    aplicar = True
-                else:
-                    if factura.fecha_ultima_mora.month != hoy.month or factura.fecha_ultima_mora.year != hoy.year:
-                        dias_pasados = (hoy - factura.fecha_ultima_mora).days
-                        if dias_pasados >= 20: 
-                            aplicar = True
-                            
-                if aplicar:
-                    recargo = factura.saldo_pendiente * (porcentaje / Decimal('100'))
-                    
-                    factura.monto += recargo
-                    factura.saldo_pendiente += recargo
-                    factura.concepto += f" (+{porcentaje}% Mora)"
-                    factura.fecha_ultima_mora = hoy 
-                    
-                    factura.save()
-                    contador_aplicadas += 1
-                    
-            # FASE C: AUDITORÍA (BITÁCORA)
-            if contador_aplicadas > 0:
-                Bitacora.objects.create(
-                    residencial=residencial,
-                    usuario=None,
-                    modulo='FINANZAS/ROBOT',
-                    accion=f"El Sistema (Robot Cobrador) aplicó mora automáticamente a {contador_aplicadas} cuotas vencidas.",
-                    nivel='WARNING'
-                )
-                self.stdout.write(self.style.WARNING(f'    - Se aplicó mora a {contador_aplicadas} cuotas vencidas.'))
-            else:
-                self.stdout.write('    - No se encontraron moras pendientes por aplicar.')
+        total = sum(r['duracion'] for r in resultados)
+        self.stdout.write(f"  Tiempo acumulado: {total:.2f}s en {len(resultados)} residenciales")
+
+    def _pronostico(self, hoy):
+        self.stdout.write(self.style.SUCCESS(f'=== Pronóstico del Robot Cobrador (dry-run): {hoy} ==='))
+
+        residenciales = list(Residencial.objects.only('id', 'nombre', 'dia_corte', 'porcentaje_mora'))
+        pronostico = pronosticar_corridas(residenciales, hoy)
+
+        total_cuotas = total_moras = 0
+        total_monto = total_mora = Decimal('0.00')
+        for residencial in residenciales:
+            p = pronostico[residencial.id]
+            if not p['cuotas'] and not p['moras']:
+                continue
+            self.stdout.write(
+                f"  {residencial.nombre[:30]:<30} cuotas={p['cuotas']:<5} ${p['monto_cuotas']:>12,.2f}  "
+                f"saldo a favor=${p['saldo_favor_consumido']:>10,.2f}  "
+                f"moras={p['moras']:<5} ${p['monto_moras']:>10,.2f}"
+            )
+            total_cuotas += p['cuotas']
+            total_moras += p['moras']
+            total_monto += p['monto_cuotas']
+            total_mora += p['monto_moras']
+
+        self.stdout.write(
+            f"\n  Total: {total_cuotas} cuotas (${total_monto:,.2f}) y {total_moras} moras (${total_mora:,.2f})"
+        )
+        self.stdout.write(self.style.WARNING('=== Dry-run: no se escribió nada en la base de datos ==='))
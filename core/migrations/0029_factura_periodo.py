@@ -0,0 +1,48 @@
+# Generated by Django 5.2.10 on 2026-10-16 09:12
+
+from django.db import migrations, models
+
+
+def asignar_periodos(apps, schema_editor):
+    """
+    Rellena el periodo de las cuotas existentes con el mes de su fecha de emisión.
+    Si un vecino tiene más de una cuota en el mismo mes, solo la primera recibe
+    el periodo para no violar la restricción única.
+    """
+    Factura = apps.get_model('core', 'Factura')
+
+    pendientes = []
+    vistos = set()
+    facturas = Factura.objects.filter(tipo='CUOTA').order_by('usuario_id', 'fecha_emision', 'id').only('id', 'usuario_id', 'fecha_emision')
+
+    for factura in facturas.iterator(chunk_size=2000):
+        periodo = factura.fecha_emision.replace(day=1)
+        clave = (factura.usuario_id, periodo)
+        if clave in vistos:
+            continue
+        vistos.add(clave)
+        factura.periodo = periodo
+        pendientes.append(factura)
+
+        if len(pendientes) >= 2000:
+            Factura.objects.bulk_update(pendientes, ['periodo'])
+            pendientes = []
+
+    if pendientes:
+        Factura.objects.bulk_update(pendientes, ['periodo'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0028_plansuscripcion_precio_modulo_seguridad_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='factura',
+            name='periodo',
+            field=models.DateField(blank=True, help_text='Mes facturado (primer día del mes)', null=True),
+        ),
+        migrations.RunPython(asignar_periodos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.10 on 2026-10-16 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0029_factura_periodo'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='factura',
+            constraint=models.UniqueConstraint(fields=('usuario', 'tipo', 'periodo'), name='factura_unica_por_periodo'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.10 on 2026-10-16 10:05
+
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def calcular_proxima_mora(apps, schema_editor):
+    """Precalcula la próxima fecha de mora de las cuotas pendientes existentes."""
+    Factura = apps.get_model('core', 'Factura')
+
+    pendientes = []
+    facturas = Factura.objects.filter(tipo='CUOTA', estado='PENDIENTE').only('id', 'fecha_vencimiento', 'fecha_ultima_mora')
+
+    for factura in facturas.iterator(chunk_size=2000):
+        ultima = factura.fecha_ultima_mora
+        if ultima is None:
+            factura.fecha_proxima_mora = factura.fecha_vencimiento + timedelta(days=1)
+        else:
+            if ultima.month == 12:
+                primer_dia_siguiente = ultima.replace(year=ultima.year + 1, month=1, day=1)
+            else:
+                primer_dia_siguiente = ultima.replace(month=ultima.month + 1, day=1)
+            factura.fecha_proxima_mora = max(primer_dia_siguiente, ultima + timedelta(days=20))
+        pendientes.append(factura)
+
+        if len(pendientes) >= 2000:
+            Factura.objects.bulk_update(pendientes, ['fecha_proxima_mora'])
+            pendientes = []
+
+    if pendientes:
+        Factura.objects.bulk_update(pendientes, ['fecha_proxima_mora'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0030_factura_unica_por_periodo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='factura',
+            name='fecha_proxima_mora',
+            field=models.DateField(blank=True, help_text='Próxima fecha en que aplica mora', null=True),
+        ),
+        migrations.RunPython(calcular_proxima_mora, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='factura',
+            index=models.Index(condition=models.Q(('estado', 'PENDIENTE'), ('tipo', 'CUOTA')), fields=['residencial', 'fecha_proxima_mora'], name='factura_proxima_mora_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.10 on 2026-10-16 20:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0031_factura_fecha_proxima_mora'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EjecucionRobot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha_corrida', models.DateField(help_text='Día de facturación que se procesó')),
+                ('fase', models.CharField(choices=[('CUOTAS', 'Generación de Cuotas'), ('MORAS', 'Aplicación de Moras')], max_length=10)),
+                ('estado', models.CharField(choices=[('COMPLETADO', 'Completado'), ('ERROR', 'Error (cambios revertidos)')], max_length=20)),
+                ('filas_afectadas', models.IntegerField(default=0)),
+                ('duracion_ms', models.PositiveIntegerField(default=0, help_text='Duración de la fase en milisegundos')),
+                ('mensaje_error', models.TextField(blank=True, default='')),
+                ('fecha_registro', models.DateTimeField(auto_now=True)),
+                ('residencial', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ejecuciones_robot', to='core.residencial')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('residencial', 'fecha_corrida', 'fase'), name='ejecucion_unica_por_fase')],
+            },
+        ),
+    ]
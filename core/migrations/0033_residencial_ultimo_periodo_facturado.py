@@ -0,0 +1,35 @@
+# Generated by Django 5.2.10 on 2026-10-16 20:52
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def calcular_ultimo_periodo(apps, schema_editor):
+    """Toma el periodo más reciente de las cuotas ya emitidas de cada residencial."""
+    Residencial = apps.get_model('core', 'Residencial')
+    Factura = apps.get_model('core', 'Factura')
+
+    ultimos = Factura.objects.filter(tipo='CUOTA', periodo__isnull=False, residencial__isnull=False).values('residencial_id').annotate(
+        ultimo=Max('periodo')
+    )
+    residenciales = []
+    for fila in ultimos:
+        residenciales.append(Residencial(id=fila['residencial_id'], ultimo_periodo_facturado=fila['ultimo']))
+
+    Residencial.objects.bulk_update(residenciales, ['ultimo_periodo_facturado'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0032_ejecucionrobot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='residencial',
+            name='ultimo_periodo_facturado',
+            field=models.DateField(blank=True, help_text='Primer día del último mes facturado', null=True),
+        ),
+        migrations.RunPython(calcular_ultimo_periodo, migrations.RunPython.noop),
+    ]
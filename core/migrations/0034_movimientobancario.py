@@ -0,0 +1,34 @@
+# Generated by Django 5.2.10 on 2026-10-16 20:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0033_residencial_ultimo_periodo_facturado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovimientoBancario',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('referencia', models.CharField(blank=True, default='', max_length=100)),
+                ('descripcion', models.CharField(blank=True, default='', max_length=255)),
+                ('monto', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('estado', models.CharField(choices=[('APLICADO', 'Aplicado'), ('REVISION', 'Pendiente de Revisión'), ('DESCARTADO', 'Descartado')], default='REVISION', max_length=20)),
+                ('motivo', models.CharField(blank=True, default='', help_text='Por qué quedó en revisión o cómo se concilió', max_length=255)),
+                ('fecha_registro', models.DateTimeField(auto_now_add=True)),
+                ('reporte', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimientos_bancarios', to='core.reportepago')),
+                ('residencial', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movimientos_bancarios', to='core.residencial')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimientos_bancarios', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('referencia', ''), _negated=True), fields=('residencial', 'fecha', 'referencia', 'monto'), name='movimiento_unico_por_referencia')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.10 on 2026-10-16 20:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0034_movimientobancario'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Pago',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('monto', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('tipo_pago', models.CharField(choices=[('MANTENIMIENTO', 'Cuota / Mantenimiento'), ('GAS', 'Consumo de Gas')], default='MANTENIMIENTO', max_length=20)),
+                ('credito_generado', models.DecimalField(decimal_places=2, default=0.0, help_text='Sobrante enviado al saldo a favor', max_digits=10)),
+                ('estado', models.CharField(choices=[('APLICADO', 'Aplicado'), ('ANULADO', 'Anulado')], default='APLICADO', max_length=10)),
+                ('fecha', models.DateTimeField(auto_now_add=True)),
+                ('fecha_anulacion', models.DateTimeField(blank=True, null=True)),
+                ('residencial', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pagos', to='core.residencial')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pagos', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AsignacionPago',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('monto', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('factura', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='asignaciones', to='core.factura')),
+                ('pago', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='asignaciones', to='core.pago')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['factura', 'pago', 'monto'], name='asignacion_factura_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.10 on 2026-10-16 21:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0035_pago_asignacionpago'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenDeuda',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('deuda_mantenimiento', models.DecimalField(decimal_places=2, default=0.0, help_text='Cuotas y extraordinarias pendientes', max_digits=12)),
+                ('deuda_gas', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('deuda_vencida', models.DecimalField(decimal_places=2, default=0.0, help_text='Pendiente con fecha de vencimiento pasada', max_digits=12)),
+                ('facturas_pendientes', models.IntegerField(default=0)),
+                ('vencimiento_mas_antiguo', models.DateField(blank=True, help_text='Vencimiento de la factura impaga más vieja', null=True)),
+                ('proximo_vencimiento', models.DateField(blank=True, db_index=True, null=True)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+                ('residencial', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_deuda', to='core.residencial')),
+                ('usuario', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='resumen_deuda', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.10 on 2026-10-16 22:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0036_resumendeuda'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='residencial',
+            name='token_pasarela',
+            field=models.CharField(blank=True, help_text='Token con el que la pasarela de pagos se identifica ante la API (Authorization: Bearer ...)', max_length=64, null=True, unique=True),
+        ),
+        migrations.CreateModel(
+            name='NotificacionPago',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave_idempotencia', models.CharField(max_length=100)),
+                ('apartamento', models.CharField(help_text='Número de apartamento tal como lo envió la pasarela', max_length=20)),
+                ('monto', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('tipo_pago', models.CharField(choices=[('MANTENIMIENTO', 'Cuota / Mantenimiento'), ('GAS', 'Consumo de Gas')], default='MANTENIMIENTO', max_length=20)),
+                ('referencia', models.CharField(blank=True, default='', max_length=100)),
+                ('datos', models.JSONField(default=dict, help_text='Cuerpo original del aviso')),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'En Cola'), ('APLICADO', 'Aplicado'), ('RECHAZADO', 'Rechazado')], default='PENDIENTE', max_length=20)),
+                ('motivo', models.CharField(blank=True, default='', max_length=255)),
+                ('fecha_recepcion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_proceso', models.DateTimeField(blank=True, null=True)),
+                ('pago', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='notificaciones', to='core.pago')),
+                ('residencial', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notificaciones_pago', to='core.residencial')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='notificaciones_pago', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('estado', 'PENDIENTE')), fields=['id'], name='notificacion_en_cola_idx')],
+                'constraints': [models.UniqueConstraint(fields=('residencial', 'clave_idempotencia'), name='notificacion_unica_por_clave')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.10 on 2026-10-16 22:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0037_notificacionpago'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CierreMensual',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField(help_text='Primer día del mes cerrado')),
+                ('ingresos_por_tipo', models.JSONField(default=dict, help_text='Facturas pagadas en el mes, por tipo')),
+                ('ingresos_facturas', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('ingresos_extraordinarios', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('gastos_por_categoria', models.JSONField(default=dict)),
+                ('total_gastos', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('saldo_apertura', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('saldo_cierre', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('fecha_cierre', models.DateTimeField(auto_now=True)),
+                ('residencial', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cierres_mensuales', to='core.residencial')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('residencial', 'mes'), name='cierre_unico_por_mes')],
+            },
+        ),
+    ]
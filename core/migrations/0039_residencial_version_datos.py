@@ -0,0 +1,19 @@
+# Generated by Django 5.2.10 on 2026-10-16 22:35
+
+import time
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0038_cierremensual'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='residencial',
+            name='version_datos',
+            field=models.BigIntegerField(default=time.time_ns, editable=False),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.10 on 2026-10-16 22:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0039_residencial_version_datos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MorosidadResidencial',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('al_dia', models.DecimalField(decimal_places=2, default=0.0, help_text='Emitido y aún sin vencer', max_digits=12)),
+                ('dias_30', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('dias_60', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('dias_90', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('mas_90', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('total', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('vecinos_con_deuda', models.IntegerField(default=0)),
+                ('fecha_foto', models.DateTimeField(auto_now=True)),
+                ('residencial', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='morosidad_historial', to='core.residencial')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('residencial', 'fecha'), name='morosidad_residencial_unica_por_dia')],
+            },
+        ),
+        migrations.CreateModel(
+            name='MorosidadVecino',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('al_dia', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('dias_30', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('dias_60', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('dias_90', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('mas_90', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('total', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('residencial', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='morosidad_vecinos', to='core.residencial')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='morosidad_historial', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['residencial', 'fecha', '-total'], name='morosidad_vecino_foto_idx')],
+                'constraints': [models.UniqueConstraint(fields=('usuario', 'fecha'), name='morosidad_vecino_unica_por_dia')],
+            },
+        ),
+    ]
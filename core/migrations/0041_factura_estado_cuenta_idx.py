@@ -0,0 +1,17 @@
+# Generated by Django 5.2.10 on 2026-10-16 22:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0040_morosidad_historial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='factura',
+            index=models.Index(fields=['usuario', 'fecha_emision', 'id'], name='factura_estado_cuenta_idx'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.10 on 2026-10-16 22:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0041_factura_estado_cuenta_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bitacora',
+            index=models.Index(fields=['residencial', '-fecha'], name='bitacora_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='factura',
+            index=models.Index(condition=models.Q(('estado', 'PAGADO')), fields=['residencial', 'fecha_pago', 'id'], name='factura_pagada_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='factura',
+            index=models.Index(condition=models.Q(('estado', 'PENDIENTE')), fields=['usuario', 'tipo', 'fecha_vencimiento', 'id'], name='factura_pendiente_fifo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='factura',
+            index=models.Index(condition=models.Q(('estado', 'PENDIENTE')), fields=['residencial', 'tipo', 'fecha_vencimiento'], name='factura_pendiente_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='factura',
+            index=models.Index(fields=['residencial', 'tipo', 'fecha_emision'], name='factura_emision_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='gasto',
+            index=models.Index(fields=['residencial', 'fecha_gasto'], name='gasto_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lecturagas',
+            index=models.Index(fields=['residencial', 'fecha_lectura'], name='lectura_gas_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lecturagas',
+            index=models.Index(fields=['apartamento', 'fecha_lectura'], name='lectura_gas_apto_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(fields=['residencial', 'estado', 'fecha_solicitud'], name='reserva_estado_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(fields=['area_social', 'fecha_solicitud'], name='reserva_area_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visita',
+            index=models.Index(fields=['residencial', 'fecha_esperada'], name='visita_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visita',
+            index=models.Index(fields=['residente', '-fecha_esperada'], name='visita_residente_fecha_idx'),
+        ),
+    ]
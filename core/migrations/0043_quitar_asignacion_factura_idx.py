@@ -0,0 +1,17 @@
+# Generated by Django 5.2.10 on 2026-10-16 22:53
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0042_indices_consultas_frecuentes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='asignacionpago',
+            name='asignacion_factura_idx',
+        ),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 5.2.10 on 2026-10-16 23:01
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Sum, Q, Value, DecimalField
+from django.db.models.functions import Coalesce
+
+
+def completar_ledger(apps, schema_editor):
+    """
+    1. Reparte el saldo a favor actual de cada vecino entre sus pagos con
+       sobrante, del más nuevo al más viejo: lo que ya no está en el bolsillo
+       se da por aplicado.
+    2. Lo pagado en cada factura que el ledger no explica (pagos anteriores al
+       ledger y saldo a favor aplicado al emitir) queda en un Pago HISTORICO
+       con su asignación.
+    """
+    Pago = apps.get_model('core', 'Pago')
+    AsignacionPago = apps.get_model('core', 'AsignacionPago')
+    Factura = apps.get_model('core', 'Factura')
+    Usuario = apps.get_model('core', 'Usuario')
+
+    con_sobrante = Pago.objects.filter(estado='APLICADO', credito_generado__gt=0).order_by('usuario_id', '-fecha', '-id')
+    bolsillos = {
+        u['id']: {'MANTENIMIENTO': u['saldo_favor_mantenimiento'], 'GAS': u['saldo_favor_gas']}
+        for u in Usuario.objects.filter(pagos__in=con_sobrante).values('id', 'saldo_favor_mantenimiento', 'saldo_favor_gas').distinct()
+    }
+    actualizados = []
+    for pago in con_sobrante.iterator():
+        bolsillo = bolsillos[pago.usuario_id]
+        pago.credito_disponible = max(min(pago.credito_generado, bolsillo[pago.tipo_pago]), Decimal('0.00'))
+        bolsillo[pago.tipo_pago] -= pago.credito_disponible
+        actualizados.append(pago)
+    Pago.objects.bulk_update(actualizados, ['credito_disponible'], batch_size=500)
+
+    sin_explicar = Factura.objects.filter(monto_pagado__gt=0).annotate(
+        pagado_ledger=Coalesce(
+            Sum('asignaciones__monto', filter=Q(asignaciones__pago__estado='APLICADO')),
+            Value(Decimal('0.00')),
+            output_field=DecimalField(max_digits=10, decimal_places=2)
+        )
+    ).values_list('id', 'residencial_id', 'usuario_id', 'tipo', 'monto_pagado', 'pagado_ledger')
+
+    historicos = []
+    for factura_id, residencial_id, usuario_id, tipo, monto_pagado, pagado_ledger in sin_explicar.iterator():
+        diferencia = monto_pagado - pagado_ledger
+        if diferencia <= 0:
+            continue
+        pago = Pago(
+            residencial_id=residencial_id, usuario_id=usuario_id, monto=diferencia,
+            tipo_pago='GAS' if tipo == 'GAS' else 'MANTENIMIENTO', origen='HISTORICO'
+        )
+        historicos.append((pago, factura_id, diferencia))
+
+    Pago.objects.bulk_create([pago for pago, _, _ in historicos], batch_size=500)
+    AsignacionPago.objects.bulk_create([
+        AsignacionPago(pago=pago, factura_id=factura_id, monto=diferencia)
+        for pago, factura_id, diferencia in historicos
+    ], batch_size=500)
+
+
+def quitar_historicos(apps, schema_editor):
+    apps.get_model('core', 'Pago').objects.filter(origen='HISTORICO').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0043_quitar_asignacion_factura_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pago',
+            name='credito_disponible',
+            field=models.DecimalField(decimal_places=2, default=0.0, help_text='Parte del sobrante que aún no se aplica a ninguna factura', max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='pago',
+            name='origen',
+            field=models.CharField(choices=[('RECIBIDO', 'Dinero recibido'), ('SALDO_PREVIO', 'Saldo a favor sin pago registrado'), ('HISTORICO', 'Abono anterior al ledger')], default='RECIBIDO', max_length=15),
+        ),
+        migrations.AddIndex(
+            model_name='asignacionpago',
+            index=models.Index(fields=['factura', 'pago', 'monto'], name='asignacion_factura_idx'),
+        ),
+        migrations.RunPython(completar_ledger, quitar_historicos),
+    ]
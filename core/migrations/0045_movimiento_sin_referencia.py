@@ -0,0 +1,39 @@
+# Generated by Django 5.2.10 on 2026-10-16 23:03
+
+from django.db import migrations, models
+
+
+def numerar_repetidos(apps, schema_editor):
+    """Numera, en orden de importación, los depósitos sin referencia que ya estaban repetidos."""
+    MovimientoBancario = apps.get_model('core', 'MovimientoBancario')
+
+    vistos = {}
+    repetidos = []
+    for movimiento in MovimientoBancario.objects.filter(referencia='').order_by('id').iterator():
+        clave = (movimiento.residencial_id, movimiento.fecha, movimiento.descripcion, movimiento.monto)
+        vistos[clave] = vistos.get(clave, 0) + 1
+        if vistos[clave] > 1:
+            movimiento.ocurrencia = vistos[clave]
+            repetidos.append(movimiento)
+
+    MovimientoBancario.objects.bulk_update(repetidos, ['ocurrencia'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0044_ledger_credito_aplicado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movimientobancario',
+            name='ocurrencia',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.RunPython(numerar_repetidos, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='movimientobancario',
+            constraint=models.UniqueConstraint(condition=models.Q(('referencia', '')), fields=('residencial', 'fecha', 'descripcion', 'monto', 'ocurrencia'), name='movimiento_unico_sin_referencia'),
+        ),
+    ]
@@ -1,7 +1,9 @@
+import time
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.core.exceptions import ValidationError
 from django.utils import timezone
+from datetime import timedelta
 from decimal import Decimal # <--- IMPORTANTE: Necesario para cálculos financieros
 
 # ---------------------------------------------------------
@@ -27,6 +29,9 @@ class Residencial(models.Model):
     # Porcentaje de recargo (ej: 5.00%)
     porcentaje_mora = models.DecimalField(max_digits=5, decimal_places=2, default=5.00, help_text="% de Recargo por mora")
 
+    # Último mes con cuotas generadas (lo mantiene el robot; evita revisar facturas cada día)
+    ultimo_periodo_facturado = models.DateField(null=True, blank=True, help_text="Primer día del último mes facturado")
+
     saldo_inicial = models.DecimalField(max_digits=12, decimal_places=2, default=0.00, help_text="Dinero en banco antes de usar el sistema")
 
     # --- NUEVO CAMPO AGREGADO (SIN ROMPER NADA) ---
@@ -39,6 +44,17 @@ class Residencial(models.Model):
     # --- MÓDULO DE SEGURIDAD ---
     modulo_seguridad_activo = models.BooleanField(default=False, help_text="Activa el control de visitas y garita virtual")
 
+    # --- API DE PAGOS (pasarela / webhook del banco) ---
+    token_pasarela = models.CharField(
+        max_length=64, unique=True, null=True, blank=True,
+        help_text="Token con el que la pasarela de pagos se identifica ante la API (Authorization: Bearer ...)"
+    )
+
+    # --- CACHÉ DE REPORTES (core/services_cache.py) ---
+    # Marca de tiempo (ns) del último cambio en facturas, gastos, ingresos, gas o saldos.
+    # Forma parte de la clave de los reportes en caché: al cambiar, los guardados dejan de servir.
+    version_datos = models.BigIntegerField(default=time.time_ns, editable=False)
+
     def __str__(self):
         return self.nombre
 
@@ -118,6 +134,14 @@ class Reserva(models.Model):
     estado = models.CharField(max_length=10, choices=ESTADOS, default='PENDIENTE')
     motivo_rechazo = models.TextField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # Solicitudes pendientes, aprobadas futuras y eventos del día
+            models.Index(fields=['residencial', 'estado', 'fecha_solicitud'], name='reserva_estado_fecha_idx'),
+            # Área ocupada en una fecha (validación de cada reserva)
+            models.Index(fields=['area_social', 'fecha_solicitud'], name='reserva_area_fecha_idx'),
+        ]
+
     def clean(self):
         try:
             self.usuario
@@ -126,14 +150,12 @@ class Reserva(models.Model):
 
         # 1. Una reserva al mes por apto
         if self.usuario.apartamento:
-            mes = self.fecha_solicitud.month
-            year = self.fecha_solicitud.year
+            from .services_cierre import rango_mes
             
             reservas_mes = Reserva.objects.filter(
                 residencial=self.residencial,
                 usuario__apartamento=self.usuario.apartamento,
-                fecha_solicitud__month=mes,
-                fecha_solicitud__year=year
+                fecha_solicitud__range=rango_mes(self.fecha_solicitud.year, self.fecha_solicitud.month)
             ).exclude(pk=self.pk).exclude(estado='RECHAZADA')
 
             if reservas_mes.exists():
@@ -201,6 +223,12 @@ class Gasto(models.Model):
     fecha_gasto = models.DateField()
     categoria = models.CharField(max_length=50, choices=CATEGORIAS, default='IMPREVISTOS')
 
+    class Meta:
+        indexes = [
+            # Gastos del mes / del año y los últimos registrados
+            models.Index(fields=['residencial', 'fecha_gasto'], name='gasto_fecha_idx'),
+        ]
+
     def __str__(self):
         return f"{self.descripcion} - ${self.monto}"
 
@@ -236,9 +264,149 @@ class Factura(models.Model):
     fecha_ultima_mora = models.DateField(null=True, blank=True, help_text="Fecha de la última aplicación de mora")
     # ---------------------------------------------
 
+    # Primer día del mes facturado. Solo lo llevan las cuotas mensuales y,
+    # junto al usuario y el tipo, impide facturar dos veces el mismo mes.
+    periodo = models.DateField(null=True, blank=True, help_text="Mes facturado (primer día del mes)")
+
+    # Fecha desde la cual la cuota puede recibir su próxima mora. Se calcula al
+    # crearla y cada vez que se le aplica un recargo, así el robot diario solo
+    # lee las facturas que vencen hoy en vez de toda la cartera morosa.
+    fecha_proxima_mora = models.DateField(null=True, blank=True, help_text="Próxima fecha en que aplica mora")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'tipo', 'periodo'], name='factura_unica_por_periodo'),
+        ]
+        indexes = [
+            models.Index(
+                fields=['residencial', 'fecha_proxima_mora'],
+                name='factura_proxima_mora_idx',
+                condition=models.Q(estado='PENDIENTE', tipo='CUOTA'),
+            ),
+            # Estado de cuenta: páginas por cursor (fecha_emision, id) de un vecino
+            models.Index(fields=['usuario', 'fecha_emision', 'id'], name='factura_estado_cuenta_idx'),
+            # Cobros por fecha de pago: reportes mensual y anual, cierres, lotes de recibos y pagos recientes
+            models.Index(
+                fields=['residencial', 'fecha_pago', 'id'],
+                name='factura_pagada_idx',
+                condition=models.Q(estado='PAGADO'),
+            ),
+            # Cola FIFO de cada vecino (pagos) y cuotas vencidas de un vecino (bloqueo de morosos)
+            models.Index(
+                fields=['usuario', 'tipo', 'fecha_vencimiento', 'id'],
+                name='factura_pendiente_fifo_idx',
+                condition=models.Q(estado='PENDIENTE'),
+            ),
+            # Cartera abierta del residencial: cuentas por cobrar y cuotas vencidas
+            models.Index(
+                fields=['residencial', 'tipo', 'fecha_vencimiento'],
+                name='factura_pendiente_idx',
+                condition=models.Q(estado='PENDIENTE'),
+            ),
+            # Cuotas emitidas en el mes (reporte de transparencia)
+            models.Index(fields=['residencial', 'tipo', 'fecha_emision'], name='factura_emision_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.tipo == 'CUOTA' and self.fecha_vencimiento:
+            if self.fecha_ultima_mora is None:
+                # Una cuota sin recargos puede recibir mora desde el día siguiente a su
+                # vencimiento; se recalcula siempre, así editar el vencimiento la mueve
+                self.fecha_proxima_mora = self.fecha_vencimiento + timedelta(days=1)
+                update_fields = kwargs.get('update_fields')
+                if update_fields is not None and 'fecha_vencimiento' in update_fields:
+                    kwargs['update_fields'] = {*update_fields, 'fecha_proxima_mora'}
+            elif self.fecha_proxima_mora is None:
+                from .services_facturacion import proxima_fecha_mora
+                self.fecha_proxima_mora = proxima_fecha_mora(self.fecha_ultima_mora)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.concepto} - {self.usuario.username} (${self.monto})"
 
+class Pago(models.Model):
+    """
+    Dinero recibido de un vecino. Su reparto queda en AsignacionPago (qué factura
+    pagó y cuánto) y lo que sobró en `credito_generado`. Cuando ese sobrante se
+    aplica después a una factura nueva, también queda como asignación de este
+    pago, así anularlo deshace exactamente lo que hizo.
+
+    Los abonos que no vienen de un pago registrado tienen su propio Pago con
+    otro `origen`, para que el ledger sume siempre lo mismo que
+    `Factura.monto_pagado`.
+    """
+    TIPOS = [
+        ('MANTENIMIENTO', 'Cuota / Mantenimiento'),
+        ('GAS', 'Consumo de Gas'),
+    ]
+    ESTADOS = [
+        ('APLICADO', 'Aplicado'),
+        ('ANULADO', 'Anulado'),
+    ]
+    ORIGENES = [
+        ('RECIBIDO', 'Dinero recibido'),
+        ('SALDO_PREVIO', 'Saldo a favor sin pago registrado'),
+        ('HISTORICO', 'Abono anterior al ledger'),
+    ]
+
+    residencial = models.ForeignKey(Residencial, on_delete=models.CASCADE, related_name='pagos')
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='pagos')
+    monto = models.DecimalField(max_digits=10, decimal_places=2)
+    tipo_pago = models.CharField(max_length=20, choices=TIPOS, default='MANTENIMIENTO')
+    credito_generado = models.DecimalField(max_digits=10, decimal_places=2, default=0.00, help_text="Sobrante enviado al saldo a favor")
+    credito_disponible = models.DecimalField(max_digits=10, decimal_places=2, default=0.00, help_text="Parte del sobrante que aún no se aplica a ninguna factura")
+    origen = models.CharField(max_length=15, choices=ORIGENES, default='RECIBIDO')
+    estado = models.CharField(max_length=10, choices=ESTADOS, default='APLICADO')
+    fecha = models.DateTimeField(auto_now_add=True)
+    fecha_anulacion = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Pago ${self.monto} - {self.usuario.username} ({self.estado})"
+
+
+class AsignacionPago(models.Model):
+    """Parte de un Pago aplicada a una Factura."""
+    pago = models.ForeignKey(Pago, on_delete=models.CASCADE, related_name='asignaciones')
+    factura = models.ForeignKey(Factura, on_delete=models.CASCADE, related_name='asignaciones')
+    monto = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        indexes = [
+            # Suma de lo pagado por factura sin tocar la tabla de asignaciones completa
+            models.Index(fields=['factura', 'pago', 'monto'], name='asignacion_factura_idx'),
+        ]
+
+    def __str__(self):
+        return f"${self.monto} de pago #{self.pago_id} a factura #{self.factura_id}"
+
+
+class ResumenDeuda(models.Model):
+    """
+    Deuda pendiente de cada vecino, ya sumada. La mantienen los servicios de
+    facturación y pagos dentro de la misma transacción que cambia las facturas
+    (ver services_deuda), para que las pantallas lean una fila en vez de
+    recorrer Factura. Se puede reconstruir con `reconstruir_resumen_deuda`.
+    """
+    usuario = models.OneToOneField(Usuario, on_delete=models.CASCADE, related_name='resumen_deuda')
+    residencial = models.ForeignKey(Residencial, on_delete=models.CASCADE, related_name='resumenes_deuda')
+
+    deuda_mantenimiento = models.DecimalField(max_digits=12, decimal_places=2, default=0.00, help_text="Cuotas y extraordinarias pendientes")
+    deuda_gas = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    deuda_vencida = models.DecimalField(max_digits=12, decimal_places=2, default=0.00, help_text="Pendiente con fecha de vencimiento pasada")
+    facturas_pendientes = models.IntegerField(default=0)
+    vencimiento_mas_antiguo = models.DateField(null=True, blank=True, help_text="Vencimiento de la factura impaga más vieja")
+    # Próximo vencimiento aún no cumplido: cuando pasa, `deuda_vencida` debe recalcularse
+    proximo_vencimiento = models.DateField(null=True, blank=True, db_index=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    @property
+    def deuda_total(self):
+        return self.deuda_mantenimiento + self.deuda_gas
+
+    def __str__(self):
+        return f"{self.usuario.username}: ${self.deuda_total}"
+
+
 class LecturaGas(models.Model):
     residencial = models.ForeignKey(Residencial, on_delete=models.CASCADE)
     apartamento = models.ForeignKey(Apartamento, on_delete=models.CASCADE)
@@ -257,6 +425,14 @@ class LecturaGas(models.Model):
     
     factura_generada = models.ForeignKey(Factura, on_delete=models.SET_NULL, null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # Lecturas del mes del residencial (reporte de gas)
+            models.Index(fields=['residencial', 'fecha_lectura'], name='lectura_gas_fecha_idx'),
+            # Última lectura de un apartamento y el control de una lectura por mes
+            models.Index(fields=['apartamento', 'fecha_lectura'], name='lectura_gas_apto_fecha_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         # 1. Consumo m3
         consumo_m3 = self.lectura_actual - self.lectura_anterior
@@ -371,9 +547,213 @@ class Bitacora(models.Model):
     nivel = models.CharField(max_length=20, choices=NIVELES, default='INFO')
     fecha = models.DateTimeField(auto_now_add=True) # Guarda la fecha y hora exacta automáticamente
 
+    class Meta:
+        indexes = [
+            # Últimos movimientos del residencial (pantalla de auditoría)
+            models.Index(fields=['residencial', '-fecha'], name='bitacora_fecha_idx'),
+        ]
+
     def __str__(self):
         return f"{self.fecha.strftime('%d/%m/%Y %H:%M')} - {self.usuario} - {self.accion}"
 
+
+class EjecucionRobot(models.Model):
+    """Bitácora técnica de los robots nocturnos: una fila por residencial, día y fase."""
+    FASES = [
+        ('CUOTAS', 'Generación de Cuotas'),
+        ('MORAS', 'Aplicación de Moras'),
+    ]
+    ESTADOS = [
+        ('COMPLETADO', 'Completado'),
+        ('ERROR', 'Error (cambios revertidos)'),
+    ]
+
+    residencial = models.ForeignKey(Residencial, on_delete=models.CASCADE, related_name='ejecuciones_robot')
+    fecha_corrida = models.DateField(help_text="Día de facturación que se procesó")
+    fase = models.CharField(max_length=10, choices=FASES)
+    estado = models.CharField(max_length=20, choices=ESTADOS)
+    filas_afectadas = models.IntegerField(default=0)
+    duracion_ms = models.PositiveIntegerField(default=0, help_text="Duración de la fase en milisegundos")
+    mensaje_error = models.TextField(blank=True, default='')
+    fecha_registro = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['residencial', 'fecha_corrida', 'fase'], name='ejecucion_unica_por_fase'),
+        ]
+
+    def __str__(self):
+        return f"{self.residencial} - {self.fase} {self.fecha_corrida} ({self.estado})"
+
+class MovimientoBancario(models.Model):
+    """Depósito leído de un estado de cuenta del banco y su conciliación con un vecino."""
+    ESTADOS = [
+        ('APLICADO', 'Aplicado'),
+        ('REVISION', 'Pendiente de Revisión'),
+        ('DESCARTADO', 'Descartado'),
+    ]
+
+    residencial = models.ForeignKey(Residencial, on_delete=models.CASCADE, related_name='movimientos_bancarios')
+    fecha = models.DateField()
+    referencia = models.CharField(max_length=100, blank=True, default='')
+    descripcion = models.CharField(max_length=255, blank=True, default='')
+    monto = models.DecimalField(max_digits=10, decimal_places=2)
+    # Cuántas veces apareció esta misma línea (fecha, descripción, monto) sin referencia en el archivo
+    ocurrencia = models.PositiveIntegerField(default=1)
+
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='REVISION')
+    usuario = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, blank=True, related_name='movimientos_bancarios')
+    reporte = models.ForeignKey('ReportePago', on_delete=models.SET_NULL, null=True, blank=True, related_name='movimientos_bancarios')
+    motivo = models.CharField(max_length=255, blank=True, default='', help_text="Por qué quedó en revisión o cómo se concilió")
+    fecha_registro = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # Reimportar el mismo estado de cuenta no vuelve a aplicar los depósitos con referencia
+            models.UniqueConstraint(
+                fields=['residencial', 'fecha', 'referencia', 'monto'],
+                name='movimiento_unico_por_referencia',
+                condition=~models.Q(referencia='')
+            ),
+            # Sin referencia, la línea se reconoce por su contenido y su número de repetición
+            models.UniqueConstraint(
+                fields=['residencial', 'fecha', 'descripcion', 'monto', 'ocurrencia'],
+                name='movimiento_unico_sin_referencia',
+                condition=models.Q(referencia='')
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} ${self.monto} {self.referencia} ({self.estado})"
+
+
+class CierreMensual(models.Model):
+    """
+    Foto del cierre de un mes ya terminado: lo cobrado, lo gastado y el saldo
+    esperado en el banco. Los reportes parten del último cierre y solo suman
+    los movimientos posteriores (ver services_cierre). Lo arma el comando
+    `cierre_mensual`; si llega un movimiento con fecha de un mes cerrado, ese
+    cierre y los siguientes se borran y se vuelven a armar.
+    """
+    residencial = models.ForeignKey(Residencial, on_delete=models.CASCADE, related_name='cierres_mensuales')
+    mes = models.DateField(help_text="Primer día del mes cerrado")
+
+    ingresos_por_tipo = models.JSONField(default=dict, help_text="Facturas pagadas en el mes, por tipo")
+    ingresos_facturas = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    ingresos_extraordinarios = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    gastos_por_categoria = models.JSONField(default=dict)
+    total_gastos = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+
+    saldo_apertura = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    saldo_cierre = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    fecha_cierre = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['residencial', 'mes'], name='cierre_unico_por_mes'),
+        ]
+
+    def __str__(self):
+        return f"{self.residencial} - {self.mes:%m/%Y}: ${self.saldo_cierre}"
+
+
+class MorosidadResidencial(models.Model):
+    """
+    Foto de la cartera del residencial en un día: la deuda repartida por
+    antigüedad del vencimiento. La toma el comando `foto_morosidad` (cada noche)
+    junto con una MorosidadVecino por cada vecino con deuda; el reporte de
+    morosidad lee la foto del día y su historia, sin sumar facturas.
+    """
+    residencial = models.ForeignKey(Residencial, on_delete=models.CASCADE, related_name='morosidad_historial')
+    fecha = models.DateField()
+
+    al_dia = models.DecimalField(max_digits=12, decimal_places=2, default=0.00, help_text="Emitido y aún sin vencer")
+    dias_30 = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    dias_60 = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    dias_90 = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    mas_90 = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    vecinos_con_deuda = models.IntegerField(default=0)
+    fecha_foto = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['residencial', 'fecha'], name='morosidad_residencial_unica_por_dia'),
+        ]
+
+    def __str__(self):
+        return f"{self.residencial} - {self.fecha:%d/%m/%Y}: ${self.total}"
+
+
+class MorosidadVecino(models.Model):
+    """
+    Deuda de un vecino por antigüedad en el día de la foto. Del mes en curso se
+    guardan todas las fotos; de los meses anteriores solo la última de cada mes
+    (la que usa la tendencia).
+    """
+    residencial = models.ForeignKey(Residencial, on_delete=models.CASCADE, related_name='morosidad_vecinos')
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='morosidad_historial')
+    fecha = models.DateField()
+
+    al_dia = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    dias_30 = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    dias_60 = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    dias_90 = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    mas_90 = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'fecha'], name='morosidad_vecino_unica_por_dia'),
+        ]
+        indexes = [
+            models.Index(fields=['residencial', 'fecha', '-total'], name='morosidad_vecino_foto_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.usuario} - {self.fecha:%d/%m/%Y}: ${self.total}"
+
+
+class NotificacionPago(models.Model):
+    """
+    Aviso de pago recibido por la API (pasarela o webhook del banco). Se guarda
+    tal cual llega y el comando `procesar_notificaciones_pago` lo aplica después
+    con el servicio FIFO. La clave de idempotencia hace que un reenvío del mismo
+    aviso no cobre dos veces.
+    """
+    ESTADOS = [
+        ('PENDIENTE', 'En Cola'),
+        ('APLICADO', 'Aplicado'),
+        ('RECHAZADO', 'Rechazado'),
+    ]
+
+    residencial = models.ForeignKey(Residencial, on_delete=models.CASCADE, related_name='notificaciones_pago')
+    clave_idempotencia = models.CharField(max_length=100)
+    apartamento = models.CharField(max_length=20, help_text="Número de apartamento tal como lo envió la pasarela")
+    monto = models.DecimalField(max_digits=10, decimal_places=2)
+    tipo_pago = models.CharField(max_length=20, choices=Pago.TIPOS, default='MANTENIMIENTO')
+    referencia = models.CharField(max_length=100, blank=True, default='')
+    datos = models.JSONField(default=dict, help_text="Cuerpo original del aviso")
+
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='PENDIENTE')
+    usuario = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, blank=True, related_name='notificaciones_pago')
+    pago = models.ForeignKey(Pago, on_delete=models.SET_NULL, null=True, blank=True, related_name='notificaciones')
+    motivo = models.CharField(max_length=255, blank=True, default='')
+    fecha_recepcion = models.DateTimeField(auto_now_add=True)
+    fecha_proceso = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['residencial', 'clave_idempotencia'], name='notificacion_unica_por_clave'),
+        ]
+        indexes = [
+            # El worker solo lee la cola pendiente, en orden de llegada
+            models.Index(fields=['id'], name='notificacion_en_cola_idx', condition=models.Q(estado='PENDIENTE')),
+        ]
+
+    def __str__(self):
+        return f"{self.clave_idempotencia} ${self.monto} apto {self.apartamento} ({self.estado})"
+
 # ---------------------------------------------------------
 # 6. Módulo de Marketplace (Clasificados Globales)
 # ---------------------------------------------------------
@@ -599,5 +979,13 @@ class Visita(models.Model):
     
     fecha_registro = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Visitas del día en la garita
+            models.Index(fields=['residencial', 'fecha_esperada'], name='visita_fecha_idx'),
+            # Historial de visitas de un residente
+            models.Index(fields=['residente', '-fecha_esperada'], name='visita_residente_fecha_idx'),
+        ]
+
     def __str__(self):
         return f"{self.nombre_visitante} -> {self.apartamento.numero} ({self.get_estado_display()})"
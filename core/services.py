@@ -1,14 +1,59 @@
 from decimal import Decimal
 from django.utils import timezone
 from django.db import transaction
-from .models import Factura, Usuario, FacturaSaaS, Gasto, Residencial
-from django.db.models import Sum
+from .models import Factura, Usuario, FacturaSaaS, Gasto, Residencial, ReportePago, Bitacora, Pago, AsignacionPago
+from django.db.models import Sum, F, Q, Case, When, Value, DecimalField
+from django.db.models.functions import Coalesce
+from .services_deuda import recalcular_resumen_deuda
+from .services_cierre import invalidar_cierres
+from .services_cache import invalidar_reportes
+
+def _asignar_fifo(facturas, monto_disponible, hoy):
+    """
+    Reparte `monto_disponible` sobre `facturas` (ya ordenadas, más vieja primero)
+    modificándolas en memoria. No toca la base de datos.
+
+    Retorna (asignaciones, facturas_pagadas_count, sobrante), donde
+    asignaciones es una lista de (factura, monto_aplicado).
+    """
+    asignaciones = []
+    facturas_pagadas_count = 0
+
+    for factura in facturas:
+        if monto_disponible <= 0:
+            break
+
+        deuda = factura.saldo_pendiente if factura.saldo_pendiente is not None else factura.monto
+
+        if monto_disponible >= deuda:
+            aplicado = deuda
+            monto_disponible -= deuda
+            factura.saldo_pendiente = 0
+            factura.monto_pagado = (factura.monto_pagado or 0) + deuda
+            factura.estado = 'PAGADO'
+            factura.fecha_pago = hoy
+            facturas_pagadas_count += 1
+        else:
+            aplicado = monto_disponible
+            factura.saldo_pendiente = deuda - monto_disponible
+            factura.monto_pagado = (factura.monto_pagado or 0) + monto_disponible
+            monto_disponible = 0
+        asignaciones.append((factura, aplicado))
+
+    return asignaciones, facturas_pagadas_count, monto_disponible
+
 
 def procesar_pago_fifo(usuario: Usuario, monto: Decimal, tipo_pago: str) -> dict:
     """
     Procesa un abono/pago usando el algoritmo FIFO (First In, First Out).
     Aplica el monto a las facturas pendientes más antiguas primero.
     Si sobra dinero, lo guarda en el bolsillo correspondiente del usuario.
+
+    Es un lote de un solo pago (ver `procesar_pagos_lote`): las facturas se
+    bloquean, el reparto se calcula en memoria y se guarda con un UPDATE
+    masivo, y el sobrante se suma al bolsillo con una expresión F. Así dos
+    workers aprobando pagos del mismo vecino no se pisan, y saldar 24 meses
+    de atraso cuesta las mismas consultas que saldar uno.
     
     Retorna:
         dict: {
@@ -17,60 +62,346 @@ def procesar_pago_fifo(usuario: Usuario, monto: Decimal, tipo_pago: str) -> dict
             "bolsillo_afectado": str
         }
     """
+    resultado = procesar_pagos_lote([(usuario, monto, tipo_pago)])[0]
+
+    if resultado['sobrante'] > 0:
+        usuario.refresh_from_db(fields=['saldo_favor_gas' if tipo_pago == 'GAS' else 'saldo_favor_mantenimiento'])
+
+    return {
+        "facturas_pagadas": resultado['facturas_pagadas'],
+        "sobrante": resultado['sobrante'],
+        "bolsillo_afectado": resultado['bolsillo_afectado']
+    }
+
+
+def procesar_pagos_lote(pagos) -> list:
+    """
+    Aplica muchos pagos de una vez (ej: el estado de cuenta del banco a fin de mes).
+    `pagos` es una lista de (usuario, monto, tipo_pago); un mismo vecino puede
+    aparecer varias veces y sus pagos se aplican en el orden recibido.
+
+    Todo corre en una transacción con un número fijo de consultas:
+    1. Un SELECT ... FOR UPDATE con las facturas pendientes de todos los vecinos.
+    2. El reparto FIFO de cada línea, en memoria.
+    3. UPDATEs masivos de facturas y de bolsillos (CASE por vecino con F()), en bloques de 500,
+       y el ResumenDeuda de los vecinos tocados.
+    4. INSERTs masivos del Pago de cada línea y de sus asignaciones a facturas,
+       para que `anular_pago_registrado` pueda deshacerlo con exactitud. El
+       sobrante queda como `credito_disponible` del pago hasta que
+       `registrar_credito_aplicado` lo reparta en facturas nuevas.
+
+    Los bolsillos se actualizan en la base de datos; las instancias de usuario
+    recibidas no se refrescan.
+
+    Retorna una lista con el resultado de cada línea, en el mismo orden:
+        [{
+            "pago": Pago,
+            "usuario": Usuario,
+            "monto": Decimal,
+            "facturas_pagadas": int,
+            "sobrante": Decimal,
+            "bolsillo_afectado": str
+        }]
+    """
+    pagos = [(usuario, Decimal(monto), tipo_pago) for usuario, monto, tipo_pago in pagos]
+    if not pagos:
+        return []
+
+    hoy = timezone.now().date()
+
     with transaction.atomic():
-        monto_disponible = Decimal(monto)
-        
-        # 1. Determinar el tipo de factura a pagar
-        filtro_tipo = 'GAS' if tipo_pago == 'GAS' else 'CUOTA'
-        
-        # 2. Buscar facturas pendientes ordenadas por fecha de vencimiento (más vieja primero)
-        facturas_pendientes = Factura.objects.filter(
-            usuario=usuario,
+        # 1. Facturas pendientes de todos los vecinos del lote, bloqueadas.
+        # Se ordenan por vecino para que dos lotes simultáneos tomen los bloqueos en el mismo orden.
+        pendientes = {}
+        facturas = Factura.objects.select_for_update().filter(
+            usuario_id__in={usuario.pk for usuario, _, _ in pagos},
             estado='PENDIENTE',
-            tipo=filtro_tipo
-        ).order_by('fecha_vencimiento')
-        
-        facturas_pagadas_count = 0
-        
-        # 3. Algoritmo Mata-Deudas (FIFO)
-        for factura in facturas_pendientes:
-            if monto_disponible <= 0:
+            tipo__in=['CUOTA', 'GAS']
+        ).order_by('usuario_id', 'fecha_vencimiento', 'id')
+        for factura in facturas:
+            pendientes.setdefault((factura.usuario_id, factura.tipo), []).append(factura)
+
+        # 2. Algoritmo Mata-Deudas (FIFO) para cada línea, en memoria
+        modificadas = {}
+        bolsillos = {'saldo_favor_mantenimiento': {}, 'saldo_favor_gas': {}}
+        registros = []
+        resultados = []
+
+        for usuario, monto, tipo_pago in pagos:
+            filtro_tipo = 'GAS' if tipo_pago == 'GAS' else 'CUOTA'
+            cola = pendientes.get((usuario.pk, filtro_tipo), [])
+
+            asignaciones, pagadas, sobrante = _asignar_fifo(cola, monto, hoy)
+            for factura, _ in asignaciones:
+                modificadas[factura.pk] = factura
+            # Las que quedaron saldadas ya no participan en las siguientes líneas del mismo vecino
+            pendientes[(usuario.pk, filtro_tipo)] = [f for f in cola if f.estado == 'PENDIENTE']
+
+            bolsillo_nombre = ""
+            if sobrante > 0:
+                if tipo_pago == 'GAS':
+                    campo, bolsillo_nombre = 'saldo_favor_gas', "Gas"
+                else:
+                    campo, bolsillo_nombre = 'saldo_favor_mantenimiento', "Mantenimiento"
+                bolsillos[campo][usuario.pk] = bolsillos[campo].get(usuario.pk, Decimal('0.00')) + sobrante
+
+            pago = Pago(
+                residencial_id=usuario.residencial_id,
+                usuario=usuario,
+                monto=monto,
+                tipo_pago='GAS' if tipo_pago == 'GAS' else 'MANTENIMIENTO',
+                credito_generado=sobrante,
+                credito_disponible=sobrante
+            )
+            registros.append((pago, asignaciones))
+
+            resultados.append({
+                "pago": pago,
+                "usuario": usuario,
+                "monto": monto,
+                "facturas_pagadas": pagadas,
+                "sobrante": sobrante,
+                "bolsillo_afectado": bolsillo_nombre
+            })
+
+        # 3. Escrituras masivas
+        if modificadas:
+            Factura.objects.bulk_update(
+                list(modificadas.values()), ['saldo_pendiente', 'monto_pagado', 'estado', 'fecha_pago'], batch_size=500
+            )
+            recalcular_resumen_deuda(usuario_ids={f.usuario_id for f in modificadas.values()}, hoy=hoy)
+
+        for campo, sobrantes in bolsillos.items():
+            ids = list(sobrantes)
+            for inicio in range(0, len(ids), 500):
+                bloque = ids[inicio:inicio + 500]
+                abono = Case(
+                    *[When(pk=usuario_id, then=Value(sobrantes[usuario_id])) for usuario_id in bloque],
+                    default=Value(Decimal('0.00')),
+                    output_field=DecimalField(max_digits=10, decimal_places=2)
+                )
+                Usuario.objects.filter(pk__in=bloque).update(**{campo: F(campo) + abono})
+
+        # 4. Ledger de pagos (los IDs de los pagos vuelven del INSERT masivo)
+        Pago.objects.bulk_create([pago for pago, _ in registros], batch_size=500)
+        AsignacionPago.objects.bulk_create([
+            AsignacionPago(pago=pago, factura=factura, monto=aplicado)
+            for pago, asignaciones in registros
+            for factura, aplicado in asignaciones
+        ], batch_size=500)
+        invalidar_reportes(*{usuario.residencial_id for usuario, _, _ in pagos})
+
+    return resultados
+
+
+def registrar_credito_aplicado(aplicaciones, tipo_pago: str):
+    """
+    Deja en el ledger el saldo a favor que se aplicó al emitir facturas nuevas.
+    `aplicaciones` es una lista de (factura, monto) con las facturas ya
+    guardadas y el bolsillo ya descontado; debe llamarse en esa misma transacción.
+
+    El saldo se toma de los pagos del vecino que aún tienen sobrante, del más
+    viejo al más nuevo, y cada tramo queda como asignación de ese pago: así
+    anularlo también reabre lo que pagó su sobrante. Lo que ningún pago
+    respalda (saldo cargado a mano) queda en un Pago con origen SALDO_PREVIO.
+    """
+    aplicaciones = [(factura, monto) for factura, monto in aplicaciones if monto > 0]
+    if not aplicaciones:
+        return
+
+    tipo_pago = 'GAS' if tipo_pago == 'GAS' else 'MANTENIMIENTO'
+    con_sobrante = {}
+    for pago in Pago.objects.select_for_update().filter(
+        usuario_id__in={factura.usuario_id for factura, _ in aplicaciones},
+        tipo_pago=tipo_pago,
+        estado='APLICADO',
+        credito_disponible__gt=0
+    ).order_by('usuario_id', 'fecha', 'id'):
+        con_sobrante.setdefault(pago.usuario_id, []).append(pago)
+
+    modificados = {}
+    nuevos = []
+    asignaciones = []
+    for factura, monto in aplicaciones:
+        restante = monto
+        for pago in con_sobrante.get(factura.usuario_id, []):
+            if restante <= 0:
                 break
-                
-            deuda = factura.saldo_pendiente if factura.saldo_pendiente is not None else factura.monto
-            
-            if monto_disponible >= deuda:
-                monto_disponible -= deuda
-                factura.saldo_pendiente = 0
-                factura.monto_pagado = (factura.monto_pagado or 0) + deuda
-                factura.estado = 'PAGADO'
-                factura.fecha_pago = timezone.now().date()
-                factura.save()
-                facturas_pagadas_count += 1
-            else:
-                factura.saldo_pendiente = deuda - monto_disponible
-                factura.monto_pagado = (factura.monto_pagado or 0) + monto_disponible
-                monto_disponible = 0
-                factura.save()
-                
-        # 4. Guardar el sobrante en el bolsillo correcto
-        bolsillo_nombre = ""
-        if monto_disponible > 0:
-            if tipo_pago == 'GAS':
-                saldo_actual = usuario.saldo_favor_gas or Decimal(0)
-                usuario.saldo_favor_gas = saldo_actual + monto_disponible
-                bolsillo_nombre = "Gas"
-            else:
-                saldo_actual = usuario.saldo_favor_mantenimiento or Decimal(0)
-                usuario.saldo_favor_mantenimiento = saldo_actual + monto_disponible
-                bolsillo_nombre = "Mantenimiento"
-            usuario.save()
-            
-        return {
-            "facturas_pagadas": facturas_pagadas_count,
-            "sobrante": monto_disponible,
-            "bolsillo_afectado": bolsillo_nombre
+            tramo = min(pago.credito_disponible, restante)
+            if tramo <= 0:
+                continue
+            pago.credito_disponible -= tramo
+            restante -= tramo
+            modificados[pago.pk] = pago
+            asignaciones.append(AsignacionPago(pago=pago, factura=factura, monto=tramo))
+
+        if restante > 0:
+            pago = Pago(
+                residencial_id=factura.residencial_id,
+                usuario_id=factura.usuario_id,
+                monto=restante,
+                tipo_pago=tipo_pago,
+                origen='SALDO_PREVIO'
+            )
+            nuevos.append(pago)
+            asignaciones.append(AsignacionPago(pago=pago, factura=factura, monto=restante))
+
+    if modificados:
+        Pago.objects.bulk_update(list(modificados.values()), ['credito_disponible'], batch_size=500)
+    Pago.objects.bulk_create(nuevos, batch_size=500)
+    AsignacionPago.objects.bulk_create(asignaciones, batch_size=500)
+
+
+def anular_pago_registrado(pago, admin=None) -> dict:
+    """
+    Deshace exactamente un Pago: devuelve a cada factura lo que ese pago le
+    abonó (también las que se pagaron después con su sobrante) y descuenta del
+    bolsillo la parte del sobrante que sigue sin usarse. Todo en una
+    transacción con las filas bloqueadas.
+
+    Si el residente ya no tiene en el bolsillo ese sobrante (ej: se ajustó a
+    mano), no se puede anular y lanza ValueError.
+
+    Retorna:
+        dict: {
+            "facturas_reabiertas": int,
+            "monto_revertido": Decimal,
+            "credito_revertido": Decimal
         }
+    """
+    with transaction.atomic():
+        pago = Pago.objects.select_for_update().select_related('usuario').get(pk=pago.pk)
+        if pago.estado == 'ANULADO':
+            raise ValueError("Este pago ya fue anulado.")
+
+        asignaciones = list(pago.asignaciones.all())
+        facturas = Factura.objects.select_for_update().in_bulk([a.factura_id for a in asignaciones])
+
+        # Si alguna se había pagado en un mes ya cerrado, ese cierre deja de cuadrar
+        invalidar_cierres(pago.residencial_id, *(f.fecha_pago for f in facturas.values() if f.estado == 'PAGADO'))
+        invalidar_reportes(pago.residencial_id)
+
+        for asignacion in asignaciones:
+            factura = facturas[asignacion.factura_id]
+            factura.monto_pagado = (factura.monto_pagado or 0) - asignacion.monto
+            factura.saldo_pendiente = (factura.saldo_pendiente or 0) + asignacion.monto
+            factura.estado = 'PENDIENTE'
+            factura.fecha_pago = None
+        if facturas:
+            Factura.objects.bulk_update(list(facturas.values()), ['saldo_pendiente', 'monto_pagado', 'estado', 'fecha_pago'])
+            recalcular_resumen_deuda(usuario_ids=[pago.usuario_id])
+
+        credito = pago.credito_disponible
+        if credito > 0:
+            campo = 'saldo_favor_gas' if pago.tipo_pago == 'GAS' else 'saldo_favor_mantenimiento'
+            # Solo se descuenta si el saldo sigue ahí; si no, alguien lo ajustó fuera del ledger
+            descontado = Usuario.objects.filter(pk=pago.usuario_id, **{f"{campo}__gte": credito}).update(
+                **{campo: F(campo) - credito}
+            )
+            if not descontado:
+                raise ValueError(
+                    f"El residente ya no tiene los ${credito} de saldo a favor que generó este pago. "
+                    "Anúlalo manualmente ajustando el saldo del residente."
+                )
+
+        pago.estado = 'ANULADO'
+        pago.fecha_anulacion = timezone.now()
+        pago.credito_disponible = 0
+        pago.save(update_fields=['estado', 'fecha_anulacion', 'credito_disponible'])
+
+        vecino = pago.usuario
+        Bitacora.objects.create(
+            residencial=pago.residencial,
+            usuario=admin,
+            modulo='FINANZAS',
+            accion=(
+                f"Anuló el pago #{pago.id} de ${pago.monto} de {vecino.first_name} {vecino.last_name}: "
+                f"{len(facturas)} facturas reabiertas y ${credito} descontados del saldo a favor."
+            ),
+            nivel='WARNING'
+        )
+
+    return {
+        "facturas_reabiertas": len(facturas),
+        "monto_revertido": sum((a.monto for a in asignaciones), Decimal('0.00')),
+        "credito_revertido": credito
+    }
+
+
+def monto_pagado_por_factura(facturas):
+    """
+    Anota en un queryset de Factura lo realmente pagado según el ledger
+    (`pagado_ledger`), sumando las asignaciones de pagos no anulados.
+    """
+    return facturas.annotate(
+        pagado_ledger=Coalesce(
+            Sum('asignaciones__monto', filter=Q(asignaciones__pago__estado='APLICADO')),
+            Value(Decimal('0.00')),
+            output_field=DecimalField(max_digits=10, decimal_places=2)
+        )
+    )
+
+
+def resolver_reportes_pago(residencial, reporte_ids, accion: str, admin=None) -> dict:
+    """
+    Aprueba o rechaza de una vez varios reportes de pago pendientes.
+
+    Todo va en una transacción: los reportes se bloquean (los que ya no estén
+    pendientes se ignoran), los aprobados se aplican con `procesar_pagos_lote`
+    (las facturas de cada vecino se bloquean y reparten una sola vez, aunque
+    tenga varios reportes) y los cambios y la bitácora se escriben en lote.
+
+    Retorna:
+        dict: {
+            "procesados": [(ReportePago, dict resultado FIFO | None)],
+            "facturas_pagadas": int,
+            "monto_total": Decimal,
+            "omitidos": int
+        }
+    """
+    reporte_ids = set(reporte_ids)
+
+    with transaction.atomic():
+        reportes = list(ReportePago.objects.select_for_update(of=('self',)).filter(
+            residencial=residencial,
+            pk__in=reporte_ids,
+            estado='PENDIENTE'
+        ).select_related('usuario').order_by('usuario_id', 'fecha_reporte', 'id'))
+
+        if accion == 'aprobar':
+            resultados = procesar_pagos_lote([(r.usuario, r.monto, r.tipo_pago) for r in reportes])
+            for reporte, resultado in zip(reportes, resultados):
+                reporte.estado = 'APROBADO'
+                reporte.comentario_admin = f"Pago aplicado a {reporte.tipo_pago}. Se pagaron {resultado['facturas_pagadas']} facturas."
+            bitacora = [
+                Bitacora(
+                    residencial=residencial, usuario=admin, modulo='FINANZAS', nivel='INFO',
+                    accion=f"Aprobó un pago de ${r.monto} reportado por {r.usuario.first_name} {r.usuario.last_name}."
+                )
+                for r in reportes
+            ]
+        else:
+            resultados = [None] * len(reportes)
+            for reporte in reportes:
+                reporte.estado = 'RECHAZADO'
+            bitacora = [
+                Bitacora(
+                    residencial=residencial, usuario=admin, modulo='FINANZAS', nivel='WARNING',
+                    accion=f"Rechazó un comprobante de pago de ${r.monto} enviado por {r.usuario.first_name}."
+                )
+                for r in reportes
+            ]
+
+        ReportePago.objects.bulk_update(reportes, ['estado', 'comentario_admin'], batch_size=500)
+        Bitacora.objects.bulk_create(bitacora, batch_size=500)
+
+    return {
+        "procesados": list(zip(reportes, resultados)),
+        "facturas_pagadas": sum(r['facturas_pagadas'] for r in resultados if r),
+        "monto_total": sum((r.monto for r in reportes), Decimal('0.00')),
+        "omitidos": len(reporte_ids) - len(reportes)
+    }
+
 
 class AnaliticaSaaSService:
     @staticmethod
@@ -0,0 +1,320 @@
+import csv
+import re
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from django.db import transaction
+from .models import Usuario, ReportePago, MovimientoBancario, Bitacora
+from .services import procesar_pagos_lote
+
+
+# ---------------------------------------------------------
+# LECTURA DEL ESTADO DE CUENTA (CSV del banco)
+# ---------------------------------------------------------
+
+# Nombres de columna que usan los distintos bancos para cada dato
+COLUMNAS = {
+    'fecha': ('fecha', 'date', 'fecha transaccion', 'fecha valor'),
+    'monto': ('monto', 'credito', 'crédito', 'amount', 'importe', 'deposito', 'depósito'),
+    'referencia': ('referencia', 'ref', 'reference', 'no. referencia', 'numero referencia'),
+    'descripcion': ('descripcion', 'descripción', 'concepto', 'description', 'detalle'),
+}
+
+FORMATOS_FECHA = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%m/%d/%Y')
+
+
+def _leer_fecha(texto):
+    for formato in FORMATOS_FECHA:
+        try:
+            return datetime.strptime(texto.strip(), formato).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _leer_monto(texto):
+    try:
+        monto = Decimal(texto.replace('$', '').replace(',', '').strip())
+    except (InvalidOperation, AttributeError):
+        return None
+    # "NaN" o "Infinity" son Decimal válidos, pero no montos
+    return monto if monto.is_finite() else None
+
+
+def leer_estado_cuenta(archivo_texto):
+    """
+    Recorre un CSV del banco fila por fila (sin cargarlo completo en memoria).
+    Solo devuelve los créditos válidos; las demás filas se reportan como None
+    para que quien llama pueda contarlas.
+
+    Genera dicts: {"fecha", "monto", "referencia", "descripcion"} o None.
+    """
+    lector = csv.reader(archivo_texto)
+    encabezados = [h.strip().lower() for h in next(lector, [])]
+
+    posiciones = {}
+    for campo, alias in COLUMNAS.items():
+        for i, encabezado in enumerate(encabezados):
+            if encabezado in alias:
+                posiciones[campo] = i
+                break
+
+    if 'fecha' not in posiciones or 'monto' not in posiciones:
+        raise ValueError("El archivo debe tener al menos las columnas de fecha y monto.")
+
+    def columna(fila, campo):
+        i = posiciones.get(campo)
+        return fila[i].strip() if i is not None and i < len(fila) else ''
+
+    for fila in lector:
+        if not any(fila):
+            continue
+        fecha = _leer_fecha(columna(fila, 'fecha'))
+        monto = _leer_monto(columna(fila, 'monto'))
+        if fecha is None or monto is None or monto <= 0:
+            yield None
+            continue
+        yield {
+            "fecha": fecha,
+            "monto": monto.quantize(Decimal('0.01')),
+            "referencia": columna(fila, 'referencia')[:100],
+            "descripcion": columna(fila, 'descripcion')[:255],
+        }
+
+
+# ---------------------------------------------------------
+# CONCILIACIÓN (índices en memoria, una búsqueda por línea)
+# ---------------------------------------------------------
+
+def _normalizar_apto(texto):
+    return re.sub(r'[^0-9A-Z]', '', texto.upper())
+
+
+# Solo cuenta como apartamento lo que viene marcado como tal: "APTO 101", "APT. B-2"
+# o el formato bloque-número "A-101". Fechas, montos y referencias sueltas no.
+MARCAS_APTO = (
+    re.compile(r'(?:\bAPARTAMENTO|\bAPTO?)\b\.?\s*[:#.-]?\s*([A-Z]{0,2}-?\d{1,5}[A-Z]?)\b'),
+    re.compile(r'\b([A-Z]{1,2}-\d{1,5})\b'),
+)
+
+
+class IndiceConciliacion:
+    """
+    Índices hash de un residencial para conciliar depósitos sin consultar la
+    base de datos por cada línea: dueños por número de apartamento y reportes
+    de pago pendientes por monto y por (vecino, monto). Se arma con dos consultas.
+    """
+
+    def __init__(self, residencial):
+        self.duenos_por_apto = {}
+        for habitante in Usuario.objects.filter(
+            residencial=residencial, apartamento__isnull=False
+        ).select_related('apartamento').order_by('apartamento_id', 'id'):
+            self.duenos_por_apto.setdefault(_normalizar_apto(habitante.apartamento.numero), habitante)
+
+        self.reportes_por_monto = {}
+        self.reportes_por_vecino = {}
+        for reporte in ReportePago.objects.filter(
+            residencial=residencial, estado='PENDIENTE'
+        ).select_related('usuario').order_by('fecha_reporte'):
+            self.reportes_por_monto.setdefault(reporte.monto, []).append(reporte)
+            self.reportes_por_vecino.setdefault((reporte.usuario_id, reporte.monto), []).append(reporte)
+
+    def _tomar_reporte(self, reporte):
+        # Un reporte solo puede conciliar un depósito
+        self.reportes_por_monto[reporte.monto].remove(reporte)
+        self.reportes_por_vecino[(reporte.usuario_id, reporte.monto)].remove(reporte)
+        return reporte
+
+    def _aptos_marcados(self, texto):
+        texto = texto.upper()
+        return {
+            clave for patron in MARCAS_APTO for encontrado in patron.findall(texto)
+            if (clave := _normalizar_apto(encontrado)) in self.duenos_por_apto
+        }
+
+    def conciliar(self, linea):
+        """
+        Retorna (usuario, reporte, motivo). Solo se aplica solo (usuario no None)
+        un depósito que marca un apartamento y cuyo monto es la cuota de ese
+        apartamento o el de un reporte pendiente de su dueño; todo lo demás va a
+        revisión con `usuario` None y en `motivo` la razón (y la pista, si la hay).
+        """
+        aptos = self._aptos_marcados(f"{linea['referencia']} {linea['descripcion']}")
+
+        if len(aptos) > 1:
+            return None, None, f"Menciona varios apartamentos: {', '.join(sorted(aptos))}."
+
+        if len(aptos) == 1:
+            dueno = self.duenos_por_apto[aptos.pop()]
+            reportes = self.reportes_por_vecino.get((dueno.id, linea['monto']))
+            if reportes:
+                return dueno, self._tomar_reporte(reportes[0]), "Apartamento y monto coinciden con un reporte."
+            if linea['monto'] == dueno.apartamento.monto_cuota:
+                return dueno, None, f"Apartamento {dueno.apartamento.numero} y monto de su cuota."
+            return None, None, (
+                f"Menciona el apartamento {dueno.apartamento.numero}, pero el monto no es su cuota "
+                f"ni el de un reporte pendiente."
+            )
+
+        reportes = self.reportes_por_monto.get(linea['monto'], [])
+        if len(reportes) == 1:
+            usuario = reportes[0].usuario
+            return None, None, f"Sin apartamento; posible reporte de {usuario.first_name} {usuario.last_name} ({usuario.username}) con ese monto."
+        if reportes:
+            return None, None, f"{len(reportes)} reportes pendientes con el mismo monto."
+        return None, None, "No se encontró apartamento ni reporte que coincida."
+
+
+# ---------------------------------------------------------
+# IMPORTACIÓN
+# ---------------------------------------------------------
+
+def importar_estado_cuenta(residencial, archivo_texto, usuario=None, tamano_bloque=500) -> dict:
+    """
+    Importa un estado de cuenta del banco: concilia cada crédito con un vecino,
+    aplica los seguros con el servicio FIFO en lote y deja los ambiguos en la
+    cola de revisión (MovimientoBancario en estado REVISION).
+
+    Procesa el archivo en bloques de `tamano_bloque` líneas, cada uno en su
+    transacción, así la memoria no crece con el tamaño del archivo.
+    Los depósitos que ya se importaron antes se saltan: los que tienen
+    referencia por (fecha, referencia, monto) y los que no por
+    (fecha, descripción, monto) y cuántas veces se repitió esa línea en el
+    archivo, para que dos depósitos iguales del mismo día no se confundan.
+
+    Retorna:
+        dict: {
+            "leidas": int,
+            "aplicadas": int,
+            "en_revision": int,
+            "duplicadas": int,
+            "ignoradas": int,
+            "monto_aplicado": Decimal
+        }
+    """
+    resumen = {"leidas": 0, "aplicadas": 0, "en_revision": 0, "duplicadas": 0, "ignoradas": 0, "monto_aplicado": Decimal('0.00')}
+    indice = IndiceConciliacion(residencial)
+    repeticiones = {}
+
+    bloque = []
+    for linea in leer_estado_cuenta(archivo_texto):
+        resumen['leidas'] += 1
+        if linea is None:
+            resumen['ignoradas'] += 1
+            continue
+        if not linea['referencia']:
+            clave = (linea['fecha'], linea['descripcion'], linea['monto'])
+            repeticiones[clave] = linea['ocurrencia'] = repeticiones.get(clave, 0) + 1
+        bloque.append(linea)
+        if len(bloque) >= tamano_bloque:
+            _importar_bloque(residencial, bloque, indice, resumen)
+            bloque = []
+    if bloque:
+        _importar_bloque(residencial, bloque, indice, resumen)
+
+    if resumen['aplicadas'] or resumen['en_revision']:
+        Bitacora.objects.create(
+            residencial=residencial,
+            usuario=usuario,
+            modulo='FINANZAS/BANCO',
+            accion=(
+                f"Importó estado de cuenta: {resumen['aplicadas']} depósitos aplicados "
+                f"(${resumen['monto_aplicado']:,.2f}) y {resumen['en_revision']} enviados a revisión."
+            ),
+            nivel='INFO'
+        )
+
+    return resumen
+
+
+def _importar_bloque(residencial, lineas, indice, resumen):
+    with transaction.atomic():
+        # Depósitos que ya se habían importado (una consulta por bloque para cada clase)
+        existentes = set(MovimientoBancario.objects.filter(
+            residencial=residencial,
+            referencia__in={l['referencia'] for l in lineas if l['referencia']}
+        ).values_list('fecha', 'referencia', 'monto'))
+        sin_referencia = [l for l in lineas if not l['referencia']]
+        if sin_referencia:
+            existentes.update(MovimientoBancario.objects.filter(
+                residencial=residencial,
+                referencia='',
+                fecha__in={l['fecha'] for l in sin_referencia}
+            ).values_list('fecha', 'descripcion', 'monto', 'ocurrencia'))
+
+        conciliadas = []
+        vistos = set()
+        for linea in lineas:
+            if linea['referencia']:
+                clave = (linea['fecha'], linea['referencia'], linea['monto'])
+            else:
+                clave = (linea['fecha'], linea['descripcion'], linea['monto'], linea.get('ocurrencia', 1))
+            if clave in existentes or clave in vistos:
+                resumen['duplicadas'] += 1
+                continue
+            vistos.add(clave)
+            conciliadas.append((linea, *indice.conciliar(linea)))
+
+        # Los reportes vienen del índice armado al empezar: se bloquean y se
+        # vuelve a mirar su estado, por si un admin ya los aprobó mientras tanto
+        ids_reportes = [reporte.pk for _, _, reporte, _ in conciliadas if reporte]
+        vigentes = set(ReportePago.objects.select_for_update().filter(
+            pk__in=ids_reportes, estado='PENDIENTE'
+        ).values_list('pk', flat=True)) if ids_reportes else set()
+
+        movimientos = []
+        pagos = []
+        reportes = []
+        for linea, dueno, reporte, motivo in conciliadas:
+            if reporte and reporte.pk not in vigentes:
+                dueno, reporte = None, None
+                motivo = "El reporte de pago que coincidía ya fue procesado por otra vía."
+
+            movimiento = MovimientoBancario(
+                residencial=residencial, usuario=dueno, reporte=reporte, motivo=motivo[:255],
+                estado='APLICADO' if dueno else 'REVISION', **linea
+            )
+            movimientos.append(movimiento)
+
+            if dueno is None:
+                resumen['en_revision'] += 1
+                continue
+
+            pagos.append((dueno, linea['monto'], reporte.tipo_pago if reporte else 'MANTENIMIENTO'))
+            if reporte:
+                reporte.estado = 'APROBADO'
+                reporte.comentario_admin = f"Conciliado con el banco (ref. {linea['referencia'] or 's/n'} del {linea['fecha']:%d/%m/%Y})."
+                reportes.append(reporte)
+            resumen['aplicadas'] += 1
+            resumen['monto_aplicado'] += linea['monto']
+
+        if pagos:
+            procesar_pagos_lote(pagos)
+        if reportes:
+            ReportePago.objects.bulk_update(reportes, ['estado', 'comentario_admin'], batch_size=500)
+        MovimientoBancario.objects.bulk_create(movimientos, batch_size=500)
+
+
+def aplicar_movimiento(movimiento, usuario, tipo_pago='MANTENIMIENTO', admin=None) -> dict:
+    """Aplica manualmente un depósito de la cola de revisión al vecino indicado."""
+    with transaction.atomic():
+        movimiento = MovimientoBancario.objects.select_for_update().get(pk=movimiento.pk)
+        if movimiento.estado != 'REVISION':
+            raise ValueError("Este depósito ya fue procesado.")
+
+        resultado = procesar_pagos_lote([(usuario, movimiento.monto, tipo_pago)])[0]
+
+        movimiento.estado = 'APLICADO'
+        movimiento.usuario = usuario
+        movimiento.motivo = f"Asignado manualmente por {admin.username}." if admin else "Asignado manualmente."
+        movimiento.save()
+
+        Bitacora.objects.create(
+            residencial=movimiento.residencial,
+            usuario=admin,
+            modulo='FINANZAS/BANCO',
+            accion=f"Aplicó el depósito de ${movimiento.monto:,.2f} del {movimiento.fecha:%d/%m/%Y} a {usuario.first_name} {usuario.last_name}.",
+            nivel='INFO'
+        )
+
+    return resultado
@@ -0,0 +1,101 @@
+import time
+from django.core.cache import caches
+from django.db import transaction
+from .models import Residencial
+
+
+# ---------------------------------------------------------
+# CACHÉ DE REPORTES POR RESIDENCIAL
+# ---------------------------------------------------------
+# La clave de un reporte guardado lleva (residencial, reporte, parámetros,
+# Residencial.version_datos). Cuando cambia una factura, un gasto, un ingreso,
+# una lectura de gas, un apartamento, un saldo a favor o el propio residencial,
+# las señales (core/signals.py) y los servicios masivos ponen una versión nueva
+# y todos los reportes de ese residencial dejan de encontrarse. No hace falta
+# borrar nada: lo viejo caduca. La versión solo se escribe con un UPDATE
+# (`invalidar_reportes`), nunca a mano en el save() de una instancia.
+#
+# La versión vive en la base de datos (compartida por todos los procesos, y
+# llega gratis con request.user.residencial); los reportes viven en el alias
+# 'reportes' de CACHES: memoria local o archivos, sin servicios externos.
+
+ALIAS = 'reportes'
+
+# Los reportes guardados caducan aunque nadie los invalide
+DURACION = 6 * 60 * 60
+
+REPORTES = ('mensual', 'transparencia', 'balance')
+
+_FALTA = object()
+
+
+def invalidar_reportes(*residencial_ids):
+    """
+    Nueva versión de datos para los residenciales, al confirmarse la transacción
+    en curso (o de inmediato si no hay una): antes del commit otro request
+    podría guardar un reporte con los datos viejos bajo la versión nueva, y así
+    el UPDATE tampoco bloquea la fila del residencial mientras dura un lote.
+    """
+    ids = {r for r in residencial_ids if r is not None}
+    if ids:
+        transaction.on_commit(
+            lambda: Residencial.objects.filter(pk__in=ids).update(version_datos=time.time_ns())
+        )
+
+
+def _contar(reporte, evento):
+    cache = caches[ALIAS]
+    clave = f'reportes:contador:{reporte}:{evento}'
+    try:
+        cache.incr(clave)
+    except ValueError:
+        cache.set(clave, 1, timeout=None)
+
+
+def reporte_en_cache(residencial, reporte, calcular, **parametros):
+    """
+    Resultado de `calcular()` para el reporte con estos parámetros, leído de la
+    caché si ya existe para la versión actual de los datos del residencial.
+    `calcular` debe devolver algo que se pueda guardar con pickle.
+    """
+    cache = caches[ALIAS]
+    detalle = ':'.join(f'{nombre}={valor}' for nombre, valor in sorted(parametros.items()))
+    clave = f'reportes:{residencial.pk}:{reporte}:{residencial.version_datos}:{detalle}'
+
+    resultado = cache.get(clave, _FALTA)
+    if resultado is _FALTA:
+        _contar(reporte, 'fallos')
+        resultado = calcular()
+        cache.set(clave, resultado, timeout=DURACION)
+    else:
+        _contar(reporte, 'aciertos')
+    return resultado
+
+
+def _claves_contadores():
+    return [f'reportes:contador:{reporte}:{evento}' for reporte in REPORTES for evento in ('aciertos', 'fallos')]
+
+
+def estadisticas_cache() -> list:
+    """
+    Aciertos y fallos por reporte desde que arrancó la caché (con la caché en
+    memoria, los del proceso que atiende la consulta).
+    Retorna [{"reporte", "aciertos", "fallos", "porcentaje"}].
+    """
+    contadores = caches[ALIAS].get_many(_claves_contadores())
+    filas = []
+    for reporte in REPORTES:
+        aciertos = contadores.get(f'reportes:contador:{reporte}:aciertos', 0)
+        fallos = contadores.get(f'reportes:contador:{reporte}:fallos', 0)
+        total = aciertos + fallos
+        filas.append({
+            "reporte": reporte,
+            "aciertos": aciertos,
+            "fallos": fallos,
+            "porcentaje": (aciertos * 100 / total) if total else 0,
+        })
+    return filas
+
+
+def reiniciar_contadores():
+    caches[ALIAS].delete_many(_claves_contadores())
@@ -0,0 +1,188 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Sum, Min
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from .models import Residencial, Factura, IngresoExtraordinario, Gasto, CierreMensual
+
+
+# ---------------------------------------------------------
+# CIERRES MENSUALES (saldo histórico del banco sin recorrer la historia)
+# ---------------------------------------------------------
+
+CENTAVO = Decimal('0.01')
+
+
+def primer_dia(fecha):
+    return fecha.replace(day=1)
+
+
+def siguiente_mes(mes):
+    if mes.month == 12:
+        return mes.replace(year=mes.year + 1, month=1, day=1)
+    return mes.replace(month=mes.month + 1, day=1)
+
+
+def rango_mes(anio, mes):
+    """(primer día, último día) del mes, para filtrar con __range: a diferencia de __month, usa los índices por fecha."""
+    inicio = date(anio, mes, 1)
+    return inicio, siguiente_mes(inicio) - timedelta(days=1)
+
+
+def rango_anio(anio):
+    return date(anio, 1, 1), date(anio, 12, 31)
+
+
+def _fuentes(residencial, desde=None, hasta=None):
+    """Las tres fuentes de dinero del residencial con su campo de fecha, filtradas al rango [desde, hasta]."""
+    fuentes = [
+        (Factura.objects.filter(residencial=residencial, estado='PAGADO'), 'fecha_pago', 'tipo'),
+        (IngresoExtraordinario.objects.filter(Apartamento__residencial=residencial), 'fecha_pago', None),
+        (Gasto.objects.filter(residencial=residencial), 'fecha_gasto', 'categoria'),
+    ]
+    rango = []
+    for qs, campo_fecha, grupo in fuentes:
+        if desde is not None:
+            qs = qs.filter(**{f'{campo_fecha}__gte': desde})
+        if hasta is not None:
+            qs = qs.filter(**{f'{campo_fecha}__lte': hasta})
+        rango.append((qs, campo_fecha, grupo))
+    return rango
+
+
+def _sumas_por_mes(residencial, desde, hasta):
+    """
+    Movimientos de cada mes del rango en tres consultas agrupadas (una por fuente).
+    Retorna {mes: {"ingresos_por_tipo": {}, "ingresos_extraordinarios": Decimal, "gastos_por_categoria": {}}}.
+    """
+    meses = {}
+
+    def mes_de(m):
+        return meses.setdefault(m, {
+            "ingresos_por_tipo": {}, "ingresos_extraordinarios": Decimal('0.00'), "gastos_por_categoria": {}
+        })
+
+    facturas, extras, gastos = _fuentes(residencial, desde, hasta)
+    for (qs, campo_fecha, grupo), destino in ((facturas, 'ingresos_por_tipo'), (gastos, 'gastos_por_categoria')):
+        filas = qs.annotate(m=TruncMonth(campo_fecha)).values('m', grupo).annotate(total=Sum('monto')).order_by()
+        for fila in filas:
+            mes_de(fila['m'])[destino][fila[grupo]] = fila['total']
+
+    qs, campo_fecha, _ = extras
+    for fila in qs.annotate(m=TruncMonth(campo_fecha)).values('m').annotate(total=Sum('monto')).order_by():
+        mes_de(fila['m'])['ingresos_extraordinarios'] = fila['total']
+
+    return meses
+
+
+def _neto(residencial, desde=None, hasta=None):
+    """Ingresos menos gastos del rango (tres agregados)."""
+    facturas, extras, gastos = _fuentes(residencial, desde, hasta)
+    suma = lambda qs: qs.aggregate(total=Sum('monto'))['total'] or Decimal('0.00')
+    return suma(facturas[0]) + suma(extras[0]) - suma(gastos[0])
+
+
+def cerrar_meses(residencial, hasta=None) -> int:
+    """
+    Crea los cierres que faltan hasta el mes `hasta` (por defecto, el mes pasado;
+    el mes en curso nunca se cierra). Continúa desde el último cierre existente,
+    o desde el primer mes con movimientos si no hay ninguno.
+
+    Cuesta tres consultas agrupadas para todo el rango, no tres por mes.
+    Retorna cuántos meses se cerraron.
+    """
+    hoy = timezone.now().date()
+    ultimo_cerrable = primer_dia(primer_dia(hoy) - timedelta(days=1))
+    hasta = min(primer_dia(hasta), ultimo_cerrable) if hasta else ultimo_cerrable
+
+    with transaction.atomic():
+        # Un solo constructor de cierres por residencial a la vez
+        residencial = Residencial.objects.select_for_update().get(pk=residencial.pk)
+
+        ultimo = CierreMensual.objects.filter(residencial=residencial).order_by('-mes').first()
+        if ultimo:
+            desde, saldo = siguiente_mes(ultimo.mes), ultimo.saldo_cierre
+        else:
+            primeras = [
+                qs.aggregate(primera=Min(campo_fecha))['primera']
+                for qs, campo_fecha, _ in _fuentes(residencial)
+            ]
+            primeras = [f for f in primeras if f is not None]
+            if not primeras:
+                return 0
+            desde, saldo = primer_dia(min(primeras)), residencial.saldo_inicial
+
+        if desde > hasta:
+            return 0
+
+        sumas = _sumas_por_mes(residencial, desde, siguiente_mes(hasta) - timedelta(days=1))
+
+        cierres = []
+        mes = desde
+        while mes <= hasta:
+            datos = sumas.get(mes, {})
+            por_tipo = datos.get('ingresos_por_tipo', {})
+            por_categoria = datos.get('gastos_por_categoria', {})
+            ingresos_facturas = sum(por_tipo.values(), Decimal('0.00'))
+            extraordinarios = datos.get('ingresos_extraordinarios', Decimal('0.00'))
+            total_gastos = sum(por_categoria.values(), Decimal('0.00'))
+
+            cierre = CierreMensual(
+                residencial=residencial,
+                mes=mes,
+                ingresos_por_tipo={k: str(v.quantize(CENTAVO)) for k, v in por_tipo.items()},
+                ingresos_facturas=ingresos_facturas,
+                ingresos_extraordinarios=extraordinarios,
+                gastos_por_categoria={k: str(v.quantize(CENTAVO)) for k, v in por_categoria.items()},
+                total_gastos=total_gastos,
+                saldo_apertura=saldo,
+                saldo_cierre=saldo + ingresos_facturas + extraordinarios - total_gastos
+            )
+            cierres.append(cierre)
+            saldo = cierre.saldo_cierre
+            mes = siguiente_mes(mes)
+
+        CierreMensual.objects.bulk_create(cierres, batch_size=500)
+
+    return len(cierres)
+
+
+def invalidar_cierres(residencial_id, *fechas) -> int:
+    """
+    Un movimiento con fecha en un mes ya cerrado cambia ese cierre y todos los
+    siguientes (el saldo se arrastra): se borran para que `cierre_mensual` los
+    vuelva a armar. Mientras tanto los reportes siguen cuadrando, solo que suman
+    desde el último cierre que quedó.
+
+    Los movimientos del mes en curso no tocan la base de datos.
+    Retorna cuántos cierres se borraron.
+    """
+    mes_actual = primer_dia(timezone.now().date())
+    fechas = [f for f in fechas if f is not None and f < mes_actual]
+    if not fechas:
+        return 0
+    borrados, _ = CierreMensual.objects.filter(
+        residencial_id=residencial_id, mes__gte=primer_dia(min(fechas))
+    ).delete()
+    return borrados
+
+
+def saldo_banco_al(residencial, fecha):
+    """
+    Saldo esperado en el banco al final del día `fecha`: el último cierre que
+    termina antes (una lectura por índice) más los movimientos posteriores.
+    Sin cierres suma toda la historia, igual que antes.
+    """
+    # Cierres cuyo mes termina a más tardar en `fecha`
+    cierre = CierreMensual.objects.filter(
+        residencial=residencial, mes__lt=primer_dia(fecha + timedelta(days=1))
+    ).order_by('-mes').first()
+
+    if cierre is None:
+        return residencial.saldo_inicial + _neto(residencial, hasta=fecha)
+
+    desde = siguiente_mes(cierre.mes)
+    if desde > fecha:
+        return cierre.saldo_cierre
+    return cierre.saldo_cierre + _neto(residencial, desde=desde, hasta=fecha)
@@ -0,0 +1,121 @@
+from decimal import Decimal
+from django.db.models import Q, Sum, Count, Min, DecimalField
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import Usuario, ResumenDeuda
+
+
+# ---------------------------------------------------------
+# RESUMEN DE DEUDA POR VECINO (una fila por residente)
+# ---------------------------------------------------------
+
+CAMPOS_RESUMEN = [
+    'residencial', 'deuda_mantenimiento', 'deuda_gas', 'deuda_vencida',
+    'facturas_pendientes', 'vencimiento_mas_antiguo', 'proximo_vencimiento', 'fecha_actualizacion'
+]
+
+
+def recalcular_resumen_deuda(usuario_ids=None, residencial=None, hoy=None, crear=True) -> int:
+    """
+    Recalcula el ResumenDeuda de los vecinos indicados (o de todo un residencial)
+    a partir de sus facturas pendientes. Se llama dentro de la misma transacción
+    que modifica las facturas, así el resumen nunca queda desfasado.
+
+    Cuesta dos consultas sin importar cuántos vecinos sean: una agregación
+    agrupada por vecino y un INSERT ... ON CONFLICT DO UPDATE con todas las filas.
+    Los vecinos sin deuda quedan con su fila en cero. Con `crear=False` solo se
+    actualizan las filas que ya existen (ej: al borrar en cascada un vecino).
+
+    Retorna cuántas filas se escribieron.
+    """
+    hoy = hoy or timezone.now().date()
+
+    vecinos = Usuario.objects.filter(residencial__isnull=False)
+    if usuario_ids is not None:
+        usuario_ids = set(usuario_ids)
+        if not usuario_ids:
+            return 0
+        vecinos = vecinos.filter(id__in=usuario_ids)
+    if residencial is not None:
+        vecinos = vecinos.filter(residencial=residencial)
+    if not crear:
+        vecinos = vecinos.filter(resumen_deuda__isnull=False)
+
+    pendiente = Q(facturas__estado='PENDIENTE')
+    saldo = Coalesce('facturas__saldo_pendiente', 'facturas__monto')
+    cero = Decimal('0.00')
+
+    def suma(condicion):
+        return Coalesce(Sum(saldo, filter=pendiente & condicion), cero, output_field=DecimalField())
+
+    filas = vecinos.values('id', 'residencial_id').annotate(
+        mantenimiento=suma(~Q(facturas__tipo='GAS')),
+        gas=suma(Q(facturas__tipo='GAS')),
+        vencida=suma(Q(facturas__fecha_vencimiento__lt=hoy)),
+        cantidad=Count('facturas', filter=pendiente),
+        mas_antiguo=Min('facturas__fecha_vencimiento', filter=pendiente),
+        proximo=Min('facturas__fecha_vencimiento', filter=pendiente & Q(facturas__fecha_vencimiento__gte=hoy)),
+    ).order_by()
+
+    ahora = timezone.now()
+    resumenes = [
+        ResumenDeuda(
+            usuario_id=fila['id'],
+            residencial_id=fila['residencial_id'],
+            deuda_mantenimiento=fila['mantenimiento'],
+            deuda_gas=fila['gas'],
+            deuda_vencida=fila['vencida'],
+            facturas_pendientes=fila['cantidad'],
+            vencimiento_mas_antiguo=fila['mas_antiguo'],
+            proximo_vencimiento=fila['proximo'],
+            fecha_actualizacion=ahora
+        )
+        for fila in filas
+    ]
+    if not resumenes:
+        return 0
+
+    ResumenDeuda.objects.bulk_create(
+        resumenes,
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=['usuario'],
+        update_fields=CAMPOS_RESUMEN
+    )
+    return len(resumenes)
+
+
+def refrescar_vencimientos(hoy=None) -> int:
+    """
+    Las facturas no cambian cuando vencen, pero la `deuda_vencida` del resumen sí.
+    Recalcula solo a los vecinos con alguna factura que venció desde la última
+    actualización (búsqueda sobre el índice de `proximo_vencimiento`).
+    """
+    hoy = hoy or timezone.now().date()
+    ids = list(ResumenDeuda.objects.filter(proximo_vencimiento__lt=hoy).values_list('usuario_id', flat=True))
+    return recalcular_resumen_deuda(usuario_ids=ids, hoy=hoy) if ids else 0
+
+
+def duenos_por_apartamento(residencial):
+    """
+    Dueño de cada apartamento del residencial (el primer habitante) con su
+    ResumenDeuda ya cargado, en una sola consulta. Retorna {apartamento_id: Usuario}.
+    """
+    duenos = {}
+    for habitante in Usuario.objects.filter(
+        residencial=residencial, apartamento__isnull=False
+    ).select_related('resumen_deuda').order_by('apartamento_id', 'id'):
+        duenos.setdefault(habitante.apartamento_id, habitante)
+    return duenos
+
+
+def resumen_de(usuario):
+    """ResumenDeuda del vecino, o uno vacío (sin guardar) si aún no tiene fila."""
+    try:
+        return usuario.resumen_deuda
+    except ResumenDeuda.DoesNotExist:
+        cero = Decimal('0.00')
+        return ResumenDeuda(
+            usuario=usuario, residencial_id=usuario.residencial_id,
+            deuda_mantenimiento=cero, deuda_gas=cero, deuda_vencida=cero
+        )
@@ -0,0 +1,512 @@
+import calendar
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta
+from decimal import Decimal, ROUND_HALF_UP
+from django.db import transaction, connections
+from django.db.models import F, Q, Value, Exists, OuterRef, ExpressionWrapper, BooleanField
+from django.db.models.functions import Coalesce, Concat, Left
+from .models import Residencial, Factura, Usuario, Bitacora, EjecucionRobot
+from .services import registrar_credito_aplicado
+from .services_deuda import recalcular_resumen_deuda
+from .services_cache import invalidar_reportes
+
+
+def periodo_de(fecha):
+    """Devuelve el periodo de facturación (primer día del mes) de una fecha."""
+    return fecha.replace(day=1)
+
+
+def proxima_fecha_mora(fecha_mora):
+    """
+    Primer día en que una cuota recargada en `fecha_mora` vuelve a ser elegible:
+    debe ser otro mes y haber pasado al menos 20 días.
+    """
+    if fecha_mora.month == 12:
+        primer_dia_siguiente = fecha_mora.replace(year=fecha_mora.year + 1, month=1, day=1)
+    else:
+        primer_dia_siguiente = fecha_mora.replace(month=fecha_mora.month + 1, day=1)
+    return max(primer_dia_siguiente, fecha_mora + timedelta(days=20))
+
+
+def generar_cuotas_mensuales(residencial, hoy, usuario=None, marcar_periodo=False) -> dict:
+    """
+    Genera las cuotas de mantenimiento del mes de `hoy` para todo un residencial.
+    Es idempotente: la restricción única (usuario, tipo, periodo) garantiza que
+    correrla varias veces nunca cobra doble, y las que ya existen se saltan.
+
+    Solo la corrida programada del robot (`marcar_periodo=True`) deja el mes
+    como facturado: una generación manual antes del corte no debe impedir que
+    el robot facture los apartamentos que se agreguen hasta ese día.
+
+    Usa un número fijo de consultas sin importar cuántos apartamentos haya:
+    una lectura de dueños, una de cuotas existentes, un INSERT masivo, un
+    UPDATE masivo de saldos a favor y el registro en el ledger del saldo
+    aplicado (`registrar_credito_aplicado`).
+
+    Retorna:
+        dict: {
+            "generadas": int,
+            "saldo_aplicado": Decimal
+        }
+    """
+    periodo = periodo_de(hoy)
+
+    with transaction.atomic():
+        # 1. Dueños de los apartamentos con cuota (el primer habitante de cada apto).
+        # Se bloquean las filas para que dos corridas simultáneas no gasten el mismo saldo.
+        habitantes = Usuario.objects.select_for_update().filter(
+            apartamento__residencial=residencial,
+            apartamento__monto_cuota__gt=0
+        ).select_related('apartamento').order_by('apartamento_id', 'id')
+
+        duenos = {}
+        for habitante in habitantes:
+            duenos.setdefault(habitante.apartamento_id, habitante)
+
+        if not duenos:
+            if marcar_periodo:
+                _marcar_periodo_facturado(residencial, periodo)
+            return {"generadas": 0, "saldo_aplicado": Decimal('0.00')}
+
+        # 2. Quiénes ya tienen su cuota de este periodo (búsqueda por el índice único)
+        ya_facturados = set(Factura.objects.filter(
+            usuario_id__in=[d.id for d in duenos.values()],
+            tipo='CUOTA',
+            periodo=periodo
+        ).values_list('usuario_id', flat=True))
+
+        concepto = f"Mantenimiento {hoy.strftime('%B %Y')}"
+        fecha_vencimiento = hoy + timedelta(days=residencial.dias_gracia)
+
+        nuevas_facturas = []
+        duenos_con_saldo = []
+        abonos = []
+        saldo_aplicado = Decimal('0.00')
+
+        # 3. Armamos las facturas en memoria aplicando el saldo a favor de mantenimiento
+        for dueno in duenos.values():
+            if dueno.id in ya_facturados:
+                continue
+
+            monto = dueno.apartamento.monto_cuota
+            factura = Factura(
+                residencial=residencial,
+                usuario=dueno,
+                tipo='CUOTA',
+                concepto=concepto,
+                monto=monto,
+                fecha_emision=hoy,
+                fecha_vencimiento=fecha_vencimiento,
+                periodo=periodo,
+                fecha_proxima_mora=fecha_vencimiento + timedelta(days=1),
+                estado='PENDIENTE',
+                saldo_pendiente=monto
+            )
+
+            if dueno.saldo_favor_mantenimiento > 0:
+                abono = min(dueno.saldo_favor_mantenimiento, monto)
+                dueno.saldo_favor_mantenimiento -= abono
+                factura.monto_pagado = abono
+                factura.saldo_pendiente = monto - abono
+                if factura.saldo_pendiente == 0:
+                    factura.estado = 'PAGADO'
+                    factura.fecha_pago = hoy
+                saldo_aplicado += abono
+                duenos_con_saldo.append(dueno)
+                abonos.append((factura, abono))
+
+            nuevas_facturas.append(factura)
+
+        # 4. Insertar. Los dueños están bloqueados desde el paso 1, así que otra corrida
+        # no pudo facturarlos entretanto; si aun así choca con el índice único, el
+        # IntegrityError deshace todo (también el saldo a favor) en vez de saltar filas
+        Factura.objects.bulk_create(nuevas_facturas, batch_size=500)
+        if duenos_con_saldo:
+            Usuario.objects.bulk_update(duenos_con_saldo, ['saldo_favor_mantenimiento'], batch_size=500)
+            registrar_credito_aplicado(abonos, 'MANTENIMIENTO')
+        if nuevas_facturas:
+            recalcular_resumen_deuda(usuario_ids=[f.usuario_id for f in nuevas_facturas], hoy=hoy)
+            invalidar_reportes(residencial.id)
+
+        generadas = len(nuevas_facturas)
+        if marcar_periodo:
+            _marcar_periodo_facturado(residencial, periodo)
+
+        # 5. Auditoría
+        if generadas > 0:
+            if usuario is None:
+                accion = f"El Sistema (Robot Cobrador) generó {generadas} cuotas de mantenimiento para el mes."
+            else:
+                accion = f"Generó {generadas} cuotas de mantenimiento para el mes."
+            Bitacora.objects.create(
+                residencial=residencial,
+                usuario=usuario,
+                modulo='FINANZAS/ROBOT' if usuario is None else 'FINANZAS',
+                accion=accion,
+                nivel='INFO'
+            )
+
+    return {
+        "generadas": generadas,
+        "saldo_aplicado": saldo_aplicado
+    }
+
+
+def _marcar_periodo_facturado(residencial, periodo):
+    # Nunca retrocede: una generación manual de un mes viejo no reabre los siguientes
+    Residencial.objects.filter(pk=residencial.pk).filter(
+        Q(ultimo_periodo_facturado__isnull=True) | Q(ultimo_periodo_facturado__lt=periodo)
+    ).update(ultimo_periodo_facturado=periodo)
+    if residencial.ultimo_periodo_facturado is None or residencial.ultimo_periodo_facturado < periodo:
+        residencial.ultimo_periodo_facturado = periodo
+
+
+def aplicar_moras(residencial, hoy, usuario=None) -> int:
+    """
+    Aplica el recargo por mora a las cuotas vencidas del residencial con un
+    solo UPDATE calculado en la base de datos (sin traer facturas a Python).
+
+    Una factura recibe mora si nunca la tuvo, o si la última fue en otro mes
+    y hace al menos 20 días (evita cobrar el 31 y otra vez el día 1). Esa regla
+    ya está precalculada en `fecha_proxima_mora`, así que la búsqueda es un
+    rango sobre su índice y solo toca las facturas que vencen hoy.
+    El recargo es compuesto: se calcula sobre el saldo pendiente actual.
+
+    Retorna cuántas facturas fueron recargadas.
+    """
+    porcentaje = Decimal(str(residencial.porcentaje_mora or 0))
+    if porcentaje <= 0:
+        return 0
+
+    factor = porcentaje / Decimal('100')
+    saldo = Coalesce('saldo_pendiente', 'monto')
+
+    with transaction.atomic():
+        aplicadas = Factura.objects.filter(
+            residencial=residencial,
+            tipo='CUOTA',
+            estado='PENDIENTE',
+            fecha_proxima_mora__lte=hoy
+        ).update(
+            monto=F('monto') + saldo * factor,
+            saldo_pendiente=saldo * (1 + factor),
+            concepto=Left(Concat('concepto', Value(f" (+{porcentaje}% Mora)")), Factura._meta.get_field('concepto').max_length),
+            fecha_ultima_mora=hoy,
+            fecha_proxima_mora=proxima_fecha_mora(hoy)
+        )
+
+        # Un solo registro de auditoría con el resumen
+        if aplicadas > 0:
+            recalcular_resumen_deuda(residencial=residencial, hoy=hoy)
+            invalidar_reportes(residencial.id)
+            if usuario is None:
+                accion = f"El Sistema (Robot Cobrador) aplicó mora automáticamente a {aplicadas} cuotas vencidas."
+            else:
+                accion = f"Aplicó mora del {porcentaje}% a {aplicadas} cuotas vencidas."
+            Bitacora.objects.create(
+                residencial=residencial,
+                usuario=usuario,
+                modulo='FINANZAS/ROBOT' if usuario is None else 'FINANZAS/MORAS',
+                accion=accion,
+                nivel='WARNING'
+            )
+
+    return aplicadas
+
+
+# ---------------------------------------------------------
+# PROGRAMACIÓN (Qué residenciales tienen trabajo hoy)
+# ---------------------------------------------------------
+
+def filtro_dia_corte(hoy, atrasados=False):
+    """
+    Condición sobre `dia_corte` para los residenciales cuyo corte cae `hoy`.
+    En meses cortos el corte se corre al último día (dia_corte 31 → 28 de febrero).
+    Con `atrasados=True` también incluye los que ya pasaron su corte este mes.
+    """
+    ultimo_dia = calendar.monthrange(hoy.year, hoy.month)[1]
+    if hoy.day == ultimo_dia:
+        # El último día del mes le toca a todos los que tengan corte de hoy en adelante
+        return Q() if atrasados else Q(dia_corte__gte=hoy.day)
+    return Q(dia_corte__lte=hoy.day) if atrasados else Q(dia_corte=hoy.day)
+
+
+def tareas_del_dia(hoy, fases=('CUOTAS', 'MORAS'), atrasados=False, reanudar=False) -> list:
+    """
+    Pregunta a la base de datos, en una sola consulta, qué residenciales tienen
+    trabajo hoy y en qué fases. Los que no tienen nada que hacer no se cargan.
+
+    - CUOTAS: su corte es hoy (o ya pasó, con `atrasados`) y el mes aún no
+      está facturado según `ultimo_periodo_facturado`.
+    - MORAS: tienen mora configurada y alguna cuota pendiente que ya cumple
+      su `fecha_proxima_mora` (búsqueda sobre el índice parcial).
+    - Con `reanudar`, se excluyen las fases que el ledger ya marca completadas hoy.
+
+    Retorna una lista de (residencial_id, fases) lista para `ejecutar_residenciales`.
+    """
+    periodo = periodo_de(hoy)
+    condiciones = {}
+
+    if 'CUOTAS' in fases:
+        condiciones['CUOTAS'] = filtro_dia_corte(hoy, atrasados) & (
+            Q(ultimo_periodo_facturado__isnull=True) | Q(ultimo_periodo_facturado__lt=periodo)
+        )
+
+    if 'MORAS' in fases:
+        condiciones['MORAS'] = Q(porcentaje_mora__gt=0) & Exists(Factura.objects.filter(
+            residencial=OuterRef('pk'),
+            tipo='CUOTA',
+            estado='PENDIENTE',
+            fecha_proxima_mora__lte=hoy
+        ))
+
+    if reanudar:
+        for fase in condiciones:
+            condiciones[fase] &= ~Exists(EjecucionRobot.objects.filter(
+                residencial=OuterRef('pk'), fecha_corrida=hoy, fase=fase, estado='COMPLETADO'
+            ))
+
+    if not condiciones:
+        return []
+
+    alguna = Q()
+    for condicion in condiciones.values():
+        alguna |= condicion
+
+    nombres = list(condiciones)
+    residenciales = Residencial.objects.filter(alguna).annotate(**{
+        f"toca_{fase.lower()}": ExpressionWrapper(condiciones[fase], output_field=BooleanField())
+        for fase in nombres
+    }).order_by('id').values_list('id', *[f"toca_{fase.lower()}" for fase in nombres])
+
+    tareas = []
+    for residencial_id, *banderas in residenciales:
+        tareas.append((residencial_id, tuple(fase for fase, toca in zip(nombres, banderas) if toca)))
+    return tareas
+
+
+# ---------------------------------------------------------
+# PRONÓSTICO (Dry-run del robot, sin escribir nada)
+# ---------------------------------------------------------
+
+def proxima_fecha_corte(residencial, hoy):
+    """Próximo día de corte (hoy incluido). En meses cortos el corte cae el último día."""
+    dias_mes = calendar.monthrange(hoy.year, hoy.month)[1]
+    corte = hoy.replace(day=min(residencial.dia_corte, dias_mes))
+    if corte >= hoy:
+        return corte
+
+    siguiente = (hoy.replace(day=1) + timedelta(days=32)).replace(day=1)
+    dias_mes = calendar.monthrange(siguiente.year, siguiente.month)[1]
+    return siguiente.replace(day=min(residencial.dia_corte, dias_mes))
+
+
+def pronosticar_corridas(residenciales, fecha) -> dict:
+    """
+    Simula en memoria lo que haría el robot el día `fecha` para cada residencial,
+    sin escribir en la base de datos. Las cuotas solo se proyectan si `fecha`
+    es el día de corte del residencial; las moras se proyectan siempre (las
+    cuotas nuevas vencen después de los días de gracia y no entran ese día).
+
+    Toma una sola foto de los datos para todos los residenciales juntos
+    (dueños, cuotas ya emitidas del periodo y cuotas vencidas), así que cuesta
+    tres consultas sin importar cuántos residenciales o apartamentos haya.
+
+    Retorna:
+        dict: {residencial_id: {
+            "cuotas": int,
+            "monto_cuotas": Decimal,
+            "saldo_favor_consumido": Decimal,
+            "moras": int,
+            "monto_moras": Decimal
+        }}
+    """
+    residenciales = list(residenciales)
+    periodo = periodo_de(fecha)
+    cero = Decimal('0.00')
+
+    pronostico = {
+        r.id: {"cuotas": 0, "monto_cuotas": cero, "saldo_favor_consumido": cero, "moras": 0, "monto_moras": cero}
+        for r in residenciales
+    }
+    if not residenciales:
+        return pronostico
+
+    con_corte = [r.id for r in residenciales if proxima_fecha_corte(r, fecha) == fecha]
+    factores = {r.id: Decimal(str(r.porcentaje_mora or 0)) / Decimal('100') for r in residenciales}
+
+    def recargo(residencial_id, saldo):
+        # Mismo redondeo que aplica la base de datos al guardar el DecimalField
+        return (saldo * factores[residencial_id]).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+    # 1. Cuotas: dueños (primer habitante de cada apto) y quiénes ya tienen la del periodo
+    if con_corte:
+        habitantes = Usuario.objects.filter(
+            apartamento__residencial_id__in=con_corte,
+            apartamento__monto_cuota__gt=0
+        ).order_by('apartamento_id', 'id').values_list(
+            'id', 'apartamento_id', 'apartamento__residencial_id',
+            'apartamento__monto_cuota', 'saldo_favor_mantenimiento'
+        )
+
+        ya_facturados = set(Factura.objects.filter(
+            residencial_id__in=con_corte,
+            tipo='CUOTA',
+            periodo=periodo
+        ).values_list('usuario_id', flat=True))
+
+        aptos_vistos = set()
+        for usuario_id, apto_id, residencial_id, monto, saldo_favor in habitantes:
+            if apto_id in aptos_vistos:
+                continue
+            aptos_vistos.add(apto_id)
+            if usuario_id in ya_facturados:
+                continue
+
+            datos = pronostico[residencial_id]
+            abono = min(saldo_favor, monto) if saldo_favor > 0 else cero
+            datos['cuotas'] += 1
+            datos['monto_cuotas'] += monto
+            datos['saldo_favor_consumido'] += abono
+
+    # 2. Moras: cuotas pendientes que vencen para esa fecha (rango sobre el índice parcial)
+    con_mora = [rid for rid, factor in factores.items() if factor > 0]
+    if con_mora:
+        vencidas = Factura.objects.filter(
+            residencial_id__in=con_mora,
+            tipo='CUOTA',
+            estado='PENDIENTE',
+            fecha_proxima_mora__lte=fecha
+        ).values_list('residencial_id', 'saldo_pendiente', 'monto')
+
+        for residencial_id, saldo_pendiente, monto in vencidas.iterator():
+            datos = pronostico[residencial_id]
+            datos['moras'] += 1
+            datos['monto_moras'] += recargo(residencial_id, saldo_pendiente if saldo_pendiente is not None else monto)
+
+    return pronostico
+
+
+# ---------------------------------------------------------
+# EJECUCIÓN POR RESIDENCIAL (Robots nocturnos)
+# ---------------------------------------------------------
+
+def procesar_residencial(residencial_id, hoy, fases) -> dict:
+    """
+    Corre las fases indicadas ('CUOTAS', 'MORAS') para un residencial en su
+    propia transacción. La fila del residencial se bloquea con SKIP LOCKED:
+    si otra corrida ya lo está procesando, este se salta en vez de esperar.
+
+    Al terminar deja constancia de cada fase en EjecucionRobot (fuera de la
+    transacción, para que un error también quede registrado).
+
+    Es una función de módulo para poder enviarse a un pool de procesos.
+
+    Retorna:
+        dict: {
+            "residencial_id": int,
+            "nombre": str,
+            "estado": 'OK' | 'OMITIDO' | 'ERROR',
+            "cuotas_generadas": int | None,
+            "moras_aplicadas": int | None,
+            "duracion": float (segundos),
+            "duracion_fases": {fase: float},
+            "error": str
+        }
+    """
+    inicio = time.perf_counter()
+    resultado = {
+        "residencial_id": residencial_id,
+        "nombre": "",
+        "estado": 'OK',
+        "cuotas_generadas": None,
+        "moras_aplicadas": None,
+        "duracion": 0.0,
+        "duracion_fases": {},
+        "error": ""
+    }
+
+    try:
+        with transaction.atomic():
+            residencial = Residencial.objects.select_for_update(skip_locked=True).filter(pk=residencial_id).first()
+
+            if residencial is None:
+                resultado['estado'] = 'OMITIDO'
+                resultado['error'] = "Otra corrida está procesando este residencial."
+            else:
+                resultado['nombre'] = residencial.nombre
+                if 'CUOTAS' in fases:
+                    inicio_fase = time.perf_counter()
+                    resultado['cuotas_generadas'] = generar_cuotas_mensuales(residencial, hoy, marcar_periodo=True)['generadas']
+                    resultado['duracion_fases']['CUOTAS'] = time.perf_counter() - inicio_fase
+                if 'MORAS' in fases:
+                    inicio_fase = time.perf_counter()
+                    resultado['moras_aplicadas'] = aplicar_moras(residencial, hoy)
+                    resultado['duracion_fases']['MORAS'] = time.perf_counter() - inicio_fase
+    except Exception as e:
+        resultado['estado'] = 'ERROR'
+        resultado['error'] = str(e)
+
+    resultado['duracion'] = time.perf_counter() - inicio
+
+    if resultado['estado'] != 'OMITIDO':
+        _registrar_ejecucion(resultado, hoy, fases)
+
+    return resultado
+
+
+def _registrar_ejecucion(resultado, hoy, fases):
+    filas_por_fase = {
+        'CUOTAS': resultado['cuotas_generadas'],
+        'MORAS': resultado['moras_aplicadas'],
+    }
+    registros = []
+    for fase in fases:
+        error = resultado['estado'] == 'ERROR'
+        duracion = resultado['duracion'] if error else resultado['duracion_fases'].get(fase, 0)
+        registros.append(EjecucionRobot(
+            residencial_id=resultado['residencial_id'],
+            fecha_corrida=hoy,
+            fase=fase,
+            estado='ERROR' if error else 'COMPLETADO',
+            filas_afectadas=0 if error else (filas_por_fase[fase] or 0),
+            duracion_ms=int(duracion * 1000),
+            mensaje_error=resultado['error']
+        ))
+
+    # Si se reintenta el mismo día, la fila de la fase se actualiza en vez de duplicarse
+    EjecucionRobot.objects.bulk_create(
+        registros,
+        update_conflicts=True,
+        unique_fields=['residencial', 'fecha_corrida', 'fase'],
+        update_fields=['estado', 'filas_afectadas', 'duracion_ms', 'mensaje_error', 'fecha_registro']
+    )
+
+
+def _iniciar_worker():
+    # Cada proceso del pool abre su propia conexión a la base de datos
+    import django
+    django.setup()
+    connections.close_all()
+
+
+def ejecutar_residenciales(tareas, hoy, workers=1):
+    """
+    Ejecuta `procesar_residencial` para cada tarea (residencial_id, fases).
+    Con workers > 1 reparte los residenciales en un pool de procesos; cada
+    proceso usa su propia conexión y cada residencial su propia transacción.
+    Devuelve los resultados a medida que van terminando.
+    """
+    if workers <= 1:
+        for residencial_id, fases in tareas:
+            yield procesar_residencial(residencial_id, hoy, fases)
+        return
+
+    # Las conexiones abiertas no deben heredarse a los procesos hijos
+    connections.close_all()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_iniciar_worker) as pool:
+        futuros = [pool.submit(procesar_residencial, residencial_id, hoy, fases) for residencial_id, fases in tareas]
+        for futuro in as_completed(futuros):
+            yield futuro.result()
@@ -0,0 +1,112 @@
+import json
+from datetime import timedelta
+from decimal import Decimal
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dates import MONTHS_3
+from .models import Residencial, MorosidadResidencial, MorosidadVecino
+from .services_cierre import primer_dia
+from .services_reportes import morosidad_por_vecino
+
+
+# ---------------------------------------------------------
+# FOTOS DE MOROSIDAD (antigüedad de saldos día a día)
+# ---------------------------------------------------------
+
+TRAMOS = ('al_dia', 'dias_30', 'dias_60', 'dias_90', 'mas_90', 'total')
+
+
+def tomar_foto_morosidad(residencial, hoy=None) -> MorosidadResidencial:
+    """
+    Reparte la deuda de cada vecino por antigüedad (una consulta agrupada) y la
+    guarda como la foto de `hoy`: una MorosidadVecino por vecino con deuda y una
+    MorosidadResidencial con los totales. Si ya había foto de ese día, la reemplaza.
+    Retorna la foto del residencial.
+
+    La fila del residencial se bloquea antes de calcular: si el comando nocturno
+    y un "Actualizar" coinciden, el segundo espera y vuelve a tomar la foto
+    completa en vez de chocar con las filas del primero.
+    """
+    hoy = hoy or timezone.now().date()
+    campos = ('al_dia_calc', 'dias_30_calc', 'dias_60_calc', 'dias_90_calc', 'mas_90_calc', 'deuda_total_calc')
+
+    with transaction.atomic():
+        Residencial.objects.select_for_update().filter(pk=residencial.pk).exists()
+
+        fotos = [
+            MorosidadVecino(residencial=residencial, usuario_id=usuario_id, fecha=hoy, **dict(zip(TRAMOS, montos)))
+            for usuario_id, *montos in morosidad_por_vecino(residencial, hoy).values_list('id', *campos)
+        ]
+        totales = {tramo: sum((getattr(f, tramo) for f in fotos), Decimal('0.00')) for tramo in TRAMOS}
+
+        MorosidadVecino.objects.filter(residencial=residencial, fecha=hoy).delete()
+        MorosidadVecino.objects.bulk_create(fotos, batch_size=500)
+        foto, _ = MorosidadResidencial.objects.update_or_create(
+            residencial=residencial, fecha=hoy,
+            defaults={**totales, 'vecinos_con_deuda': len(fotos)}
+        )
+        _podar_fotos_vecinos(residencial, hoy)
+
+    return foto
+
+
+def _podar_fotos_vecinos(residencial, hoy):
+    """De los meses anteriores al actual deja solo la última foto de cada mes (la de la tendencia)."""
+    fechas = MorosidadVecino.objects.filter(
+        residencial=residencial, fecha__lt=primer_dia(hoy)
+    ).values_list('fecha', flat=True).distinct()
+
+    ultima_del_mes = {}
+    for fecha in fechas:
+        mes = primer_dia(fecha)
+        ultima_del_mes[mes] = max(ultima_del_mes.get(mes, fecha), fecha)
+
+    sobrantes = set(fechas) - set(ultima_del_mes.values())
+    if sobrantes:
+        MorosidadVecino.objects.filter(residencial=residencial, fecha__in=sobrantes).delete()
+
+
+def ultima_foto(residencial, hoy=None):
+    """
+    La foto más reciente hasta `hoy`, o None si aún no hay ninguna. No toma
+    una nueva: abrir la página no debe escribir ni sumar facturas. Si el comando
+    nocturno aún no corrió, la foto es de un día anterior y la página lo avisa.
+    """
+    hoy = hoy or timezone.now().date()
+    return MorosidadResidencial.objects.filter(residencial=residencial, fecha__lte=hoy).order_by('-fecha').first()
+
+
+def tendencia_morosidad(residencial, hoy=None, meses=24, usuario=None) -> dict:
+    """
+    La última foto de cada uno de los últimos `meses` meses (del residencial o,
+    con `usuario`, de ese vecino), lista para Chart.js. Un mes sin foto del
+    vecino cuenta como sin deuda: solo se guardan fotos de quien debe.
+
+    Retorna {"etiquetas": json, "series": {tramo: json}}.
+    """
+    hoy = hoy or timezone.now().date()
+    inicio = primer_dia(hoy)
+    for _ in range(meses - 1):
+        inicio = primer_dia(inicio - timedelta(days=1))
+
+    if usuario is None:
+        fotos = MorosidadResidencial.objects.filter(residencial=residencial, fecha__range=(inicio, hoy))
+    else:
+        fotos = MorosidadVecino.objects.filter(usuario=usuario, fecha__range=(inicio, hoy))
+
+    # Ordenadas por fecha: la última de cada mes pisa a las anteriores
+    por_mes = {}
+    for fila in fotos.order_by('fecha').values('fecha', *TRAMOS):
+        por_mes[primer_dia(fila['fecha'])] = fila
+
+    etiquetas = []
+    series = {tramo: [] for tramo in TRAMOS}
+    mes = inicio
+    while mes <= hoy:
+        etiquetas.append(f"{MONTHS_3[mes.month].capitalize()} {mes:%y}")
+        fila = por_mes.get(mes, {})
+        for tramo in TRAMOS:
+            series[tramo].append(float(fila.get(tramo, 0)))
+        mes = (mes + timedelta(days=32)).replace(day=1)
+
+    return {"etiquetas": json.dumps(etiquetas), "series": {tramo: json.dumps(v) for tramo, v in series.items()}}
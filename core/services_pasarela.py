@@ -0,0 +1,145 @@
+from decimal import Decimal, InvalidOperation
+from django.db import transaction, IntegrityError
+from django.utils import timezone
+from .models import Usuario, NotificacionPago, Bitacora
+from .services import procesar_pagos_lote
+from .services_banco import _normalizar_apto
+
+
+# ---------------------------------------------------------
+# RECEPCIÓN (lo único que corre dentro del request)
+# ---------------------------------------------------------
+
+TIPOS_PAGO = {tipo for tipo, _ in NotificacionPago._meta.get_field('tipo_pago').choices}
+
+
+def registrar_notificacion(residencial, datos) -> tuple:
+    """
+    Valida un aviso de pago recibido por la API y lo deja en la cola con un
+    solo INSERT; no toca facturas ni bloquea filas.
+
+    `datos` es el JSON de la pasarela: {"clave", "apartamento", "monto",
+    "tipo_pago" (opcional), "referencia" (opcional)}.
+
+    Si la clave ya se recibió antes, no se crea nada y se devuelve la
+    notificación original. Lanza ValueError si el aviso no es válido.
+
+    Retorna (notificacion, creada).
+    """
+    if not isinstance(datos, dict):
+        raise ValueError("El cuerpo debe ser un objeto JSON.")
+
+    clave = str(datos.get('clave') or '').strip()
+    if not clave or len(clave) > 100:
+        raise ValueError("Falta la clave de idempotencia (máximo 100 caracteres).")
+
+    apartamento = str(datos.get('apartamento') or '').strip()
+    if not apartamento or len(apartamento) > 20:
+        raise ValueError("Falta el número de apartamento.")
+
+    try:
+        monto = Decimal(str(datos.get('monto'))).quantize(Decimal('0.01'))
+    except (InvalidOperation, ValueError):
+        raise ValueError("El monto no es un número válido.")
+    if not monto.is_finite():
+        raise ValueError("El monto no es un número válido.")
+    if monto <= 0:
+        raise ValueError("El monto debe ser mayor que cero.")
+    # Lo máximo que cabe en el DecimalField de los pagos (10 dígitos, 2 decimales)
+    if monto >= Decimal('100000000'):
+        raise ValueError("El monto excede el máximo permitido.")
+
+    tipo_pago = str(datos.get('tipo_pago') or 'MANTENIMIENTO').upper()
+    if tipo_pago not in TIPOS_PAGO:
+        raise ValueError(f"tipo_pago debe ser uno de: {', '.join(sorted(TIPOS_PAGO))}.")
+
+    try:
+        with transaction.atomic():
+            notificacion = NotificacionPago.objects.create(
+                residencial=residencial,
+                clave_idempotencia=clave,
+                apartamento=apartamento,
+                monto=monto,
+                tipo_pago=tipo_pago,
+                referencia=str(datos.get('referencia') or '')[:100],
+                datos=datos
+            )
+        return notificacion, True
+    except IntegrityError:
+        # Reenvío de un aviso que ya está en la cola (o ya se aplicó)
+        return NotificacionPago.objects.get(residencial=residencial, clave_idempotencia=clave), False
+
+
+# ---------------------------------------------------------
+# PROCESAMIENTO (worker: comando procesar_notificaciones_pago)
+# ---------------------------------------------------------
+
+def procesar_notificaciones(limite=500) -> dict:
+    """
+    Aplica un lote de hasta `limite` notificaciones pendientes, en orden de llegada.
+
+    Las filas se toman con SELECT ... FOR UPDATE SKIP LOCKED, así varios workers
+    pueden vaciar la cola a la vez sin repartirse el mismo aviso. Los dueños se
+    buscan con una consulta y todos los pagos se aplican juntos con
+    `procesar_pagos_lote`; los avisos de un apartamento sin dueño se rechazan.
+    Todo el lote es una transacción: si algo falla, vuelve a la cola intacto.
+
+    Retorna:
+        dict: {"aplicadas": int, "rechazadas": int, "monto_aplicado": Decimal}
+    """
+    resumen = {"aplicadas": 0, "rechazadas": 0, "monto_aplicado": Decimal('0.00')}
+
+    with transaction.atomic():
+        lote = list(
+            NotificacionPago.objects.select_for_update(skip_locked=True)
+            .filter(estado='PENDIENTE').order_by('id')[:limite]
+        )
+        if not lote:
+            return resumen
+
+        duenos = {}
+        for habitante in Usuario.objects.filter(
+            residencial_id__in={n.residencial_id for n in lote}, apartamento__isnull=False
+        ).select_related('apartamento').order_by('apartamento_id', 'id'):
+            duenos.setdefault((habitante.residencial_id, _normalizar_apto(habitante.apartamento.numero)), habitante)
+
+        ahora = timezone.now()
+        aplicables = []
+        for notificacion in lote:
+            notificacion.fecha_proceso = ahora
+            dueno = duenos.get((notificacion.residencial_id, _normalizar_apto(notificacion.apartamento)))
+            if dueno is None:
+                notificacion.estado = 'RECHAZADO'
+                notificacion.motivo = f"El apartamento {notificacion.apartamento} no existe o no tiene dueño registrado."
+                resumen['rechazadas'] += 1
+                continue
+            notificacion.usuario = dueno
+            aplicables.append(notificacion)
+
+        resultados = procesar_pagos_lote([(n.usuario, n.monto, n.tipo_pago) for n in aplicables])
+
+        aplicadas_por_residencial = {}
+        for notificacion, resultado in zip(aplicables, resultados):
+            notificacion.estado = 'APLICADO'
+            notificacion.pago = resultado['pago']
+            notificacion.motivo = f"Pagó {resultado['facturas_pagadas']} facturas; sobrante ${resultado['sobrante']:,.2f}."
+            resumen['aplicadas'] += 1
+            resumen['monto_aplicado'] += notificacion.monto
+            total = aplicadas_por_residencial.setdefault(notificacion.residencial_id, [0, Decimal('0.00')])
+            total[0] += 1
+            total[1] += notificacion.monto
+
+        NotificacionPago.objects.bulk_update(
+            lote, ['estado', 'usuario', 'pago', 'motivo', 'fecha_proceso'], batch_size=500
+        )
+        Bitacora.objects.bulk_create([
+            Bitacora(
+                residencial_id=residencial_id,
+                modulo='FINANZAS/PASARELA',
+                accion=f"Aplicó {cantidad} pagos recibidos por la pasarela (${monto:,.2f}).",
+                nivel='INFO'
+            )
+            for residencial_id, (cantidad, monto) in aplicadas_por_residencial.items()
+        ])
+
+    return resumen
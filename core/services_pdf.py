@@ -0,0 +1,176 @@
+import hashlib
+import multiprocessing
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from django.conf import settings
+from django.db import connections
+from django.template.loader import render_to_string
+from django.utils import timezone
+from .models import Factura, Usuario
+from .services_cierre import rango_mes
+from .services_deuda import resumen_de
+from .services_reportes import datos_reporte_mensual, estado_cuenta
+
+
+# ---------------------------------------------------------
+# PDF EN EL SERVIDOR (recibos, estados de cuenta, reporte mensual)
+# ---------------------------------------------------------
+# Cada documento se arma con la misma plantilla HTML de la pantalla y se
+# convierte con WeasyPrint. El PDF queda en disco con el hash del HTML en el
+# nombre: mientras los datos no cambien se sirve el archivo guardado, y en
+# cuanto cambian (un pago, una anulación, otra plantilla) el hash es otro y se
+# vuelve a generar.
+
+# Documentos por tarea del pool: suficientes para repartir el trabajo sin
+# mandar una tarea por PDF.
+DOCUMENTOS_POR_TAREA = 50
+
+# Hojas de estilo y fuentes externas ya descargadas en este proceso
+_RECURSOS = {}
+
+
+def _descargar(url):
+    """url_fetcher de WeasyPrint con memoria: Bootstrap y las fuentes se bajan una vez por proceso, no una por documento."""
+    from weasyprint import default_url_fetcher
+
+    if url not in _RECURSOS:
+        recurso = default_url_fetcher(url)
+        if 'file_obj' in recurso:
+            recurso['string'] = recurso.pop('file_obj').read()
+        _RECURSOS[url] = recurso
+    return dict(_RECURSOS[url])
+
+
+def _html_a_pdf(html) -> bytes:
+    try:
+        from weasyprint import HTML
+    except (ImportError, OSError):
+        # OSError: WeasyPrint instalado pero sin las librerías del sistema (Pango)
+        raise ValueError("La generación de PDF no está disponible en este servidor (falta WeasyPrint).")
+    return HTML(string=html, url_fetcher=_descargar).write_pdf()
+
+
+def _en_cache(residencial_id, nombre, html) -> Path:
+    """Ruta del PDF de `html`; solo lo genera si esta versión no está ya en disco."""
+    version = hashlib.sha256(html.encode('utf-8')).hexdigest()[:16]
+    carpeta = Path(settings.PDF_CACHE_DIR) / str(residencial_id)
+    ruta = carpeta / f'{nombre}-{version}.pdf'
+    if ruta.exists():
+        return ruta
+
+    carpeta.mkdir(parents=True, exist_ok=True)
+    # Archivo temporal + os.replace: otro proceso nunca lee un PDF a medio escribir
+    temporal = carpeta / f'{nombre}-{version}.{os.getpid()}.tmp'
+    temporal.write_bytes(_html_a_pdf(html))
+    os.replace(temporal, ruta)
+
+    # Las versiones anteriores del mismo documento ya no sirven
+    for vieja in carpeta.glob(f'{nombre}-*.pdf'):
+        if vieja != ruta:
+            vieja.unlink(missing_ok=True)
+    return ruta
+
+
+def pdf_recibo(factura) -> Path:
+    html = render_to_string('core/recibo_print.html', {'factura': factura, 'pdf': True})
+    return _en_cache(factura.residencial_id, f'recibo_{factura.id:06d}', html)
+
+
+def pdf_estado_cuenta(vecino, hoy=None) -> Path:
+    """Estado de cuenta del vecino a la fecha `hoy` (por defecto, hoy): una versión por día como mínimo."""
+    completo = estado_cuenta(vecino, por_pagina=None)
+    html = render_to_string('core/reporte_estado_cuenta.html', {
+        'vecino_seleccionado': vecino,
+        'facturas': completo['facturas'],
+        'saldo_inicial': completo['saldo_inicial'],
+        'es_primera_pagina': True,
+        'total_deuda': resumen_de(vecino).deuda_total,
+        'hoy': hoy or timezone.now().date(),
+        'residencial': vecino.residencial,
+    })
+    return _en_cache(vecino.residencial_id, f'estado_cuenta_{vecino.id}', html)
+
+
+def pdf_reporte_mensual(residencial, anio, mes) -> Path:
+    html = render_to_string('core/reporte_mensual_dinamico.html', {
+        'mes_seleccionado': mes,
+        'anio_seleccionado': anio,
+        **datos_reporte_mensual(residencial, anio, mes)
+    })
+    return _en_cache(residencial.id, f'reporte_mensual_{anio}_{mes:02d}', html)
+
+
+# ---------------------------------------------------------
+# LOTES (impresión de fin de mes)
+# ---------------------------------------------------------
+
+def _documentos_del_lote(residencial, tipo, anio, mes):
+    """IDs de lo que entra en el lote: recibos pagados en el mes, o un estado de cuenta por vecino con apartamento."""
+    if tipo == 'recibos':
+        return list(Factura.objects.filter(
+            residencial=residencial, estado='PAGADO', fecha_pago__range=rango_mes(anio, mes)
+        ).order_by('usuario__apartamento__numero', 'id').values_list('id', flat=True))
+    if tipo == 'estados':
+        return list(Usuario.objects.filter(
+            residencial=residencial, apartamento__isnull=False
+        ).order_by('apartamento__numero', 'id').values_list('id', flat=True))
+    raise ValueError("El tipo de lote debe ser 'recibos' o 'estados'.")
+
+
+def _renderizar(tipo, ids, hoy=None):
+    """
+    Genera (o toma de la caché) los PDFs de `ids`. Corre dentro de un proceso
+    del pool o en el proceso actual. Retorna [(nombre_en_el_zip, ruta)].
+    """
+    archivos = []
+    if tipo == 'recibos':
+        facturas = Factura.objects.filter(id__in=ids).select_related('residencial', 'usuario__apartamento').order_by('id')
+        for factura in facturas:
+            apto = factura.usuario.apartamento.numero if factura.usuario and factura.usuario.apartamento else 'SA'
+            archivos.append((f'{apto}_recibo_{factura.id:06d}.pdf', pdf_recibo(factura)))
+    else:
+        for vecino in Usuario.objects.filter(id__in=ids).select_related('residencial', 'apartamento').order_by('id'):
+            archivos.append((f'{vecino.apartamento.numero}_estado_cuenta_{vecino.username}.pdf', pdf_estado_cuenta(vecino, hoy)))
+    return archivos
+
+
+def lote_pdf(residencial, tipo, anio, mes, procesos=None, destino=None) -> dict:
+    """
+    Todos los recibos del mes (`tipo='recibos'`) o los estados de cuenta de
+    todos los vecinos (`tipo='estados'`, a la fecha de hoy) en un solo .zip.
+
+    Los documentos se reparten en tareas de DOCUMENTOS_POR_TAREA entre
+    `procesos` procesos (por defecto, uno por CPU); con procesos=1 todo corre
+    aquí mismo. Los que ya están en la caché no se vuelven a generar.
+
+    Retorna {"zip": Path, "documentos": int}.
+    """
+    ids = _documentos_del_lote(residencial, tipo, anio, mes)
+    tareas = [ids[i:i + DOCUMENTOS_POR_TAREA] for i in range(0, len(ids), DOCUMENTOS_POR_TAREA)]
+    hoy = timezone.now().date()
+    procesos = procesos or os.cpu_count() or 1
+
+    if procesos == 1 or len(tareas) <= 1:
+        resultados = [_renderizar(tipo, tarea, hoy) for tarea in tareas]
+    else:
+        # Los hijos se crean con fork: no deben heredar la conexión abierta del padre
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context('fork')) as pool:
+            resultados = list(pool.map(_renderizar, [tipo] * len(tareas), tareas, [hoy] * len(tareas)))
+
+    destino = Path(destino) if destino else (
+        Path(settings.PDF_CACHE_DIR) / str(residencial.id) / 'lotes' / f'{tipo}_{anio}_{mes:02d}.zip'
+    )
+    destino.parent.mkdir(parents=True, exist_ok=True)
+
+    documentos = 0
+    # Los PDF ya vienen comprimidos: se guardan tal cual (ZIP_STORED)
+    with zipfile.ZipFile(destino, 'w', compression=zipfile.ZIP_STORED) as lote:
+        for archivos in resultados:
+            for nombre, ruta in archivos:
+                lote.write(ruta, arcname=nombre)
+                documentos += 1
+
+    return {"zip": destino, "documentos": documentos}
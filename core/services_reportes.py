@@ -0,0 +1,545 @@
+import calendar
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from decimal import Decimal
+from django.db import connection
+import json
+from django.db.models import Q, F, Sum, DecimalField, Value, Window
+from django.db.models.functions import Coalesce
+from django.utils.dates import MONTHS
+from .models import Usuario, Apartamento, Factura, IngresoExtraordinario, Gasto, MorosidadVecino
+from .services_cierre import saldo_banco_al, rango_mes, rango_anio
+from .services_deuda import duenos_por_apartamento, resumen_de
+
+
+# ---------------------------------------------------------
+# LIBRO DE BANCO (movimientos del periodo con saldo corrido)
+# ---------------------------------------------------------
+
+def _sql_libro_banco(paginado=True):
+    """
+    UNION ALL de facturas pagadas, ingresos extraordinarios y gastos, con el
+    saldo corrido (SUM() OVER) y el total de filas y el neto del periodo
+    (COUNT/SUM OVER ()) calculados por la base de datos antes de paginar.
+    Sin `paginado` devuelve el periodo completo (para exportar con cursor).
+    """
+    q = connection.ops.quote_name
+
+    def campo(modelo, nombre):
+        return q(modelo._meta.get_field(nombre).column)
+
+    factura, usuario, extra, apto, gasto = (
+        q(m._meta.db_table) for m in (Factura, Usuario, IngresoExtraordinario, Apartamento, Gasto)
+    )
+    extra_apto = campo(IngresoExtraordinario, 'Apartamento')
+
+    return f"""
+        WITH movimientos AS (
+            SELECT f.{campo(Factura, 'fecha_pago')} AS fecha, 0 AS fuente, f.id AS id, 'INGRESO' AS tipo,
+                   f.{campo(Factura, 'concepto')} AS concepto, f.{campo(Factura, 'monto')} AS monto,
+                   COALESCE(u.{campo(Usuario, 'username')}, 'Admin') AS usuario
+            FROM {factura} f
+            LEFT JOIN {usuario} u ON u.id = f.{campo(Factura, 'usuario')}
+            WHERE f.{campo(Factura, 'residencial')} = %(residencial)s
+              AND f.{campo(Factura, 'estado')} = 'PAGADO'
+              AND f.{campo(Factura, 'fecha_pago')} BETWEEN %(desde)s AND %(hasta)s
+
+            UNION ALL
+
+            SELECT e.{campo(IngresoExtraordinario, 'fecha_pago')}, 1, e.id, 'INGRESO',
+                   '💰 EXTRA: ' || e.{campo(IngresoExtraordinario, 'concepto_detalle')}, e.{campo(IngresoExtraordinario, 'monto')},
+                   -- El modelo no tiene usuario: se muestra el dueño (primer habitante) del apartamento
+                   COALESCE((
+                       SELECT d.{campo(Usuario, 'username')} FROM {usuario} d
+                       WHERE d.{campo(Usuario, 'apartamento')} = e.{extra_apto}
+                       ORDER BY d.id LIMIT 1
+                   ), 'Externo/Admin')
+            FROM {extra} e
+            JOIN {apto} a ON a.id = e.{extra_apto}
+            WHERE a.{campo(Apartamento, 'residencial')} = %(residencial)s
+              AND e.{campo(IngresoExtraordinario, 'fecha_pago')} BETWEEN %(desde)s AND %(hasta)s
+
+            UNION ALL
+
+            SELECT g.{campo(Gasto, 'fecha_gasto')}, 2, g.id, 'GASTO',
+                   g.{campo(Gasto, 'descripcion')}, g.{campo(Gasto, 'monto')}, 'Admin'
+            FROM {gasto} g
+            WHERE g.{campo(Gasto, 'residencial')} = %(residencial)s
+              AND g.{campo(Gasto, 'fecha_gasto')} BETWEEN %(desde)s AND %(hasta)s
+        )
+        SELECT fecha, tipo, concepto, monto, usuario,
+               SUM(CASE WHEN tipo = 'GASTO' THEN -monto ELSE monto END)
+                   OVER (ORDER BY fecha, fuente, id ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW) AS acumulado,
+               SUM(CASE WHEN tipo = 'GASTO' THEN -monto ELSE monto END) OVER () AS neto,
+               COUNT(*) OVER () AS total
+        FROM movimientos
+        ORDER BY fecha, fuente, id
+    """ + ("LIMIT %(limite)s OFFSET %(desplazamiento)s" if paginado else "")
+
+
+def _dinero(valor):
+    # SQLite devuelve los decimales calculados como float
+    return Decimal(str(valor or 0)).quantize(Decimal('0.01'))
+
+
+def _fecha(valor):
+    return date.fromisoformat(valor) if isinstance(valor, str) else valor
+
+
+def libro_banco(residencial, desde, hasta, saldo_apertura, pagina=1, por_pagina=50) -> dict:
+    """
+    Movimientos de banco entre `desde` y `hasta` (ambos incluidos), ordenados
+    por fecha, con el saldo después de cada uno partiendo de `saldo_apertura`.
+
+    Una sola consulta por página, sin importar cuántos movimientos tenga el
+    periodo: la base de datos arma la lista, el saldo corrido, el total de
+    filas y el neto del periodo, y solo devuelve la página pedida.
+
+    Retorna:
+        dict: {
+            "movimientos": [{"fecha", "concepto", "tipo", "monto", "saldo", "usuario"}],
+            "saldo_arrastre": Decimal (saldo antes del primer movimiento de la página),
+            "pagina": int, "paginas": int, "total": int,
+            "saldo_final": Decimal
+        }
+    """
+    try:
+        pagina = max(1, int(pagina))
+    except (TypeError, ValueError):
+        pagina = 1
+    sql = _sql_libro_banco()
+
+    def leer(pagina):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, {
+                'residencial': residencial.pk, 'desde': desde, 'hasta': hasta,
+                'limite': por_pagina, 'desplazamiento': (pagina - 1) * por_pagina
+            })
+            return cursor.fetchall()
+
+    filas = leer(pagina)
+    if not filas and pagina > 1:
+        # Página fuera de rango (ej: un enlace viejo): se muestra la primera
+        pagina = 1
+        filas = leer(pagina)
+
+    total = filas[0][7] if filas else 0
+    neto = _dinero(filas[0][6]) if filas else Decimal('0.00')
+
+    movimientos = [
+        {
+            "fecha": _fecha(fecha),
+            "tipo": tipo,
+            "concepto": concepto,
+            "monto": _dinero(monto),
+            "usuario": usuario,
+            "saldo": saldo_apertura + _dinero(acumulado),
+        }
+        for fecha, tipo, concepto, monto, usuario, acumulado, _, _ in filas
+    ]
+
+    # Saldo con el que arranca esta página (en la primera, el de apertura)
+    arrastre = saldo_apertura
+    if movimientos:
+        primero = movimientos[0]
+        arrastre = primero['saldo'] + (primero['monto'] if primero['tipo'] == 'GASTO' else -primero['monto'])
+
+    return {
+        "movimientos": movimientos,
+        "saldo_arrastre": arrastre,
+        "pagina": pagina,
+        "paginas": max(1, -(-total // por_pagina)),
+        "total": total,
+        "saldo_final": saldo_apertura + neto,
+    }
+
+
+def movimientos_libro_banco(residencial, desde, hasta, saldo_apertura):
+    """
+    Todos los movimientos del periodo con su saldo, leídos con un cursor del
+    lado del servidor: genera una tupla (fecha, tipo, concepto, usuario, monto,
+    saldo) a la vez, para exportar sin cargar el mes completo en memoria.
+    """
+    with connection.chunked_cursor() as cursor:
+        cursor.execute(_sql_libro_banco(paginado=False), {'residencial': residencial.pk, 'desde': desde, 'hasta': hasta})
+        while True:
+            filas = cursor.fetchmany(2000)
+            if not filas:
+                break
+            for fecha, tipo, concepto, monto, usuario, acumulado, _, _ in filas:
+                yield _fecha(fecha), tipo, concepto, usuario, _dinero(monto), saldo_apertura + _dinero(acumulado)
+
+
+# ---------------------------------------------------------
+# RESUMEN FINANCIERO ANUAL (agregación condicional, una consulta por fuente)
+# ---------------------------------------------------------
+
+CERO = Decimal('0.00')
+
+
+@dataclass
+class ResumenAnual:
+    """
+    Cifras del año de un residencial para los tableros. Las series mensuales
+    tienen siempre 12 posiciones (enero = 0), así el orden nunca depende de
+    qué meses tuvieron movimiento.
+    """
+    anio: int
+    saldo_apertura: Decimal | None
+    ingresos_por_tipo_mes: dict = field(default_factory=dict)  # {tipo de factura: [12 meses]}
+    ingresos_extra_por_mes: list = field(default_factory=lambda: [CERO] * 12)
+    gastos_por_mes: list = field(default_factory=lambda: [CERO] * 12)
+    gastos_por_categoria: dict = field(default_factory=dict)
+
+    @property
+    def ingresos_facturas_por_mes(self):
+        return [sum(meses, CERO) for meses in zip([CERO] * 12, *self.ingresos_por_tipo_mes.values())]
+
+    @property
+    def ingresos_por_mes(self):
+        return [f + e for f, e in zip(self.ingresos_facturas_por_mes, self.ingresos_extra_por_mes)]
+
+    @property
+    def ingresos_por_tipo(self):
+        """Total del año por tipo de factura, solo los que tuvieron cobros."""
+        totales = {tipo: sum(meses, CERO) for tipo, meses in self.ingresos_por_tipo_mes.items()}
+        return {tipo: total for tipo, total in totales.items() if total}
+
+    @property
+    def ingresos_facturas(self):
+        return sum(self.ingresos_facturas_por_mes, CERO)
+
+    @property
+    def ingresos_extraordinarios(self):
+        return sum(self.ingresos_extra_por_mes, CERO)
+
+    @property
+    def total_ingresos(self):
+        return self.ingresos_facturas + self.ingresos_extraordinarios
+
+    @property
+    def total_gastos(self):
+        return sum(self.gastos_por_mes, CERO)
+
+    @property
+    def balance(self):
+        return self.total_ingresos - self.total_gastos
+
+    @property
+    def saldo_cierre(self):
+        return self.saldo_apertura + self.balance
+
+    def ingresos_tipo_en(self, tipo, mes):
+        """Cobrado en facturas de `tipo` durante el mes (1-12)."""
+        return self.ingresos_por_tipo_mes.get(tipo, [CERO] * 12)[mes - 1]
+
+    @staticmethod
+    def nombres_meses(hasta=12):
+        return [str(MONTHS[m]).capitalize() for m in range(1, hasta + 1)]
+
+
+def _suma(condicion):
+    return Coalesce(Sum('monto', filter=condicion), CERO, output_field=DecimalField(max_digits=12, decimal_places=2))
+
+
+def _por_mes(campo_fecha, condicion=Q()):
+    """Doce sumas filtradas (una por mes) para un mismo aggregate()."""
+    return [_suma(condicion & Q(**{f'{campo_fecha}__month': m})) for m in range(1, 13)]
+
+
+def resumen_anual(residencial, anio, con_saldo_apertura=True) -> ResumenAnual:
+    """
+    Ingresos por tipo y mes, ingresos extraordinarios por mes y gastos por mes
+    y por categoría del año, con un solo aggregate() de sumas condicionales por
+    tabla (Factura, IngresoExtraordinario, Gasto), más el saldo de apertura al
+    1 de enero desde los cierres mensuales (se omite con `con_saldo_apertura=False`
+    y queda en None).
+    """
+    tipos = [tipo for tipo, _ in Factura.TIPOS]
+    categorias = [categoria for categoria, _ in Gasto.CATEGORIAS]
+
+    consultas = {}
+    for tipo in tipos:
+        consultas.update({f'{tipo}_{m}': suma for m, suma in enumerate(_por_mes('fecha_pago', Q(tipo=tipo)), 1)})
+    facturas = Factura.objects.filter(
+        residencial=residencial, estado='PAGADO', fecha_pago__range=rango_anio(anio)
+    ).aggregate(**consultas)
+
+    extras = IngresoExtraordinario.objects.filter(
+        Apartamento__residencial=residencial, fecha_pago__range=rango_anio(anio)
+    ).aggregate(**{f'mes_{m}': suma for m, suma in enumerate(_por_mes('fecha_pago'), 1)})
+
+    consultas = {f'mes_{m}': suma for m, suma in enumerate(_por_mes('fecha_gasto'), 1)}
+    consultas.update({categoria: _suma(Q(categoria=categoria)) for categoria in categorias})
+    gastos = Gasto.objects.filter(residencial=residencial, fecha_gasto__range=rango_anio(anio)).aggregate(**consultas)
+
+    return ResumenAnual(
+        anio=anio,
+        saldo_apertura=saldo_banco_al(residencial, date(anio - 1, 12, 31)) if con_saldo_apertura else None,
+        ingresos_por_tipo_mes={tipo: [facturas[f'{tipo}_{m}'] for m in range(1, 13)] for tipo in tipos},
+        ingresos_extra_por_mes=[extras[f'mes_{m}'] for m in range(1, 13)],
+        gastos_por_mes=[gastos[f'mes_{m}'] for m in range(1, 13)],
+        gastos_por_categoria={categoria: gastos[categoria] for categoria in categorias if gastos[categoria]},
+    )
+
+
+def datos_reporte_mensual(residencial, anio, mes) -> dict:
+    """
+    Números del reporte mensual (pantalla y PDF): ingresos por tipo, gastos del
+    mes y saldo esperado en el banco al cierre del mes.
+    """
+    resumen = resumen_anual(residencial, anio, con_saldo_apertura=False)
+    ingresos_mant = resumen.ingresos_tipo_en('CUOTA', mes)
+    ingresos_gas = resumen.ingresos_tipo_en('GAS', mes)
+    ingresos_extra = resumen.ingresos_extra_por_mes[mes - 1]
+    total_ingresos_periodo = ingresos_mant + ingresos_gas + ingresos_extra
+    total_gastos_periodo = resumen.gastos_por_mes[mes - 1]
+
+    fecha_corte = date(anio, mes, calendar.monthrange(anio, mes)[1])
+
+    return {
+        'nombre_periodo': f"{MONTHS[mes]} {anio}",
+        'ingresos_mant': ingresos_mant,
+        'ingresos_gas': ingresos_gas,
+        'ingresos_extra': ingresos_extra,
+        'total_ingresos_periodo': total_ingresos_periodo,
+        'gastos_detalle': list(Gasto.objects.filter(residencial=residencial, fecha_gasto__range=rango_mes(anio, mes))),
+        'total_gastos_periodo': total_gastos_periodo,
+        'balance_del_periodo': total_ingresos_periodo - total_gastos_periodo,
+        # Último cierre mensual + lo que se movió después (un mes cerrado es una sola lectura)
+        'balance_esperado_banco': saldo_banco_al(residencial, fecha_corte),
+    }
+
+
+def datos_transparencia(residencial, anio, mes) -> dict:
+    """Reporte de transparencia del mes: eficiencia de cobro de las cuotas y gastos por categoría."""
+    # 1. PROYECCIÓN VS RECAUDACIÓN (Eficiencia de Cobro): las cuotas generadas en ESTE mes
+    facturas_mes = Factura.objects.filter(
+        residencial=residencial, tipo='CUOTA', fecha_emision__range=rango_mes(anio, mes)
+    )
+    proyectado = facturas_mes.aggregate(Sum('monto'))['monto__sum'] or CERO
+
+    # Cuánto de ese monto facturado ya entró al banco
+    recaudado_pendientes = facturas_mes.filter(estado='PENDIENTE').aggregate(
+        suma=Coalesce(Sum(F('monto') - Coalesce('saldo_pendiente', 'monto')), CERO)
+    )['suma']
+    recaudado_pagados = facturas_mes.filter(estado='PAGADO').aggregate(suma=Coalesce(Sum('monto'), CERO))['suma']
+    recaudado = recaudado_pendientes + recaudado_pagados
+
+    eficiencia = (recaudado / proyectado) * 100 if proyectado > 0 else 0
+
+    # 2. GASTOS POR CATEGORÍA, agrupados en la base de datos
+    gastos_mes = Gasto.objects.filter(residencial=residencial, fecha_gasto__range=rango_mes(anio, mes))
+    total_gastos = gastos_mes.aggregate(Sum('monto'))['monto__sum'] or CERO
+    gastos_por_categoria = gastos_mes.values('categoria').annotate(total=Sum('monto')).order_by('-total')
+
+    cat_dict = dict(Gasto.CATEGORIAS)
+    chart_labels = []
+    chart_data = []
+    lista_gastos_tabla = []
+    for g in gastos_por_categoria:
+        # Nombre bonito ('Compra de Gas (Camión)') a partir del código ('GAS')
+        nombre = cat_dict.get(g['categoria'], g['categoria'])
+        total_cat = float(g['total'])
+        chart_labels.append(nombre)
+        chart_data.append(total_cat)
+        lista_gastos_tabla.append({
+            'nombre': nombre,
+            'monto': total_cat,
+            'porcentaje': (total_cat / float(total_gastos) * 100) if total_gastos > 0 else 0
+        })
+
+    return {
+        'proyectado': proyectado,
+        'recaudado': float(recaudado),
+        'eficiencia': float(eficiencia),
+        'faltante': float(proyectado) - float(recaudado),
+        'total_gastos': total_gastos,
+        'lista_gastos_tabla': lista_gastos_tabla,
+        'chart_labels': json.dumps(chart_labels),
+        'chart_data': json.dumps(chart_data),
+    }
+
+
+def datos_balance_residencial(residencial) -> dict:
+    """Deuda (de ResumenDeuda) y saldos a favor de mantenimiento y gas de cada apartamento, con los totales."""
+    duenos = duenos_por_apartamento(residencial)
+
+    data = []
+    total_deuda = total_mant = total_gas = 0
+    for apt in Apartamento.objects.filter(residencial=residencial).order_by('numero'):
+        dueno = duenos.get(apt.id)
+        deuda = saldo_mant = saldo_gas = 0
+        nombre_dueno = "--- Sin Asignar ---"
+
+        if dueno:
+            nombre_dueno = f"{dueno.first_name} {dueno.last_name}"
+            saldo_mant = dueno.saldo_favor_mantenimiento or 0
+            saldo_gas = dueno.saldo_favor_gas or 0
+            deuda = resumen_de(dueno).deuda_total
+
+        data.append({
+            'apto': apt.numero,
+            'dueno': nombre_dueno,
+            'deuda': deuda,
+            'saldo_mant': saldo_mant,
+            'saldo_gas': saldo_gas,
+            'estado': 'Moroso' if deuda > 0 else 'Al día'
+        })
+        total_deuda += deuda
+        total_mant += saldo_mant
+        total_gas += saldo_gas
+
+    return {'data': data, 'total_deuda': total_deuda, 'total_mant': total_mant, 'total_gas': total_gas}
+
+
+# ---------------------------------------------------------
+# ESTADO DE CUENTA (páginas por cursor, saldo acumulado en la base de datos)
+# ---------------------------------------------------------
+
+FACTURAS_POR_PAGINA = 50
+
+
+def cursor_estado_cuenta(texto):
+    """'AAAA-MM-DD.id' (el enlace a la página siguiente) -> (fecha_emision, id). ValueError si está mal formado."""
+    fecha, _, factura_id = (texto or '').partition('.')
+    try:
+        return date.fromisoformat(fecha), int(factura_id)
+    except ValueError:
+        raise ValueError("El enlace de la página no es válido.")
+
+
+def estado_cuenta(vecino, antes=None, por_pagina=FACTURAS_POR_PAGINA) -> dict:
+    """
+    Facturas del vecino de la más nueva a la más vieja, de `por_pagina` en
+    `por_pagina` (None = todas), empezando justo después del cursor `antes`
+    (fecha_emision, id) de la página anterior. Sin OFFSET: cada página lee
+    solo sus filas por el índice (usuario, fecha_emision, id).
+
+    Cada factura trae `saldo_acumulado`: lo pendiente de esa factura más todas
+    las anteriores. Sale de un solo agregado (lo pendiente hasta el inicio de la
+    página) menos una suma de ventana sobre las filas de la página.
+
+    Retorna:
+        dict: {"facturas": [Factura], "saldo_inicial": Decimal (saldo al inicio
+        de la página), "siguiente": 'AAAA-MM-DD.id' o None}
+    """
+    pendiente = Coalesce('saldo_pendiente', 'monto')
+    facturas = Factura.objects.filter(usuario=vecino)
+    if antes:
+        fecha, factura_id = antes
+        facturas = facturas.filter(Q(fecha_emision__lt=fecha) | Q(fecha_emision=fecha, id__lt=factura_id))
+
+    saldo_inicial = facturas.aggregate(saldo=Coalesce(Sum(pendiente), CERO))['saldo']
+
+    # Lo pendiente de las facturas más nuevas dentro de la página, esta incluida
+    posteriores = Window(Sum(pendiente), order_by=[F('fecha_emision').desc(), F('id').desc()])
+    pagina = facturas.annotate(
+        saldo_acumulado=Value(saldo_inicial, output_field=DecimalField()) - posteriores + pendiente
+    ).order_by('-fecha_emision', '-id')
+
+    if por_pagina is None:
+        return {"facturas": list(pagina), "saldo_inicial": saldo_inicial, "siguiente": None}
+
+    filas = list(pagina[:por_pagina + 1])
+    siguiente = None
+    if len(filas) > por_pagina:
+        filas = filas[:por_pagina]
+        siguiente = f"{filas[-1].fecha_emision.isoformat()}.{filas[-1].id}"
+    return {"facturas": filas, "saldo_inicial": saldo_inicial, "siguiente": siguiente}
+
+
+def buscar_vecinos(residencial, texto, limite=20) -> list:
+    """
+    Vecinos del residencial cuyo apartamento, nombre, apellido o usuario empieza
+    por `texto`, para el buscador del estado de cuenta.
+    Retorna [{"id", "apto", "nombre"}], como mucho `limite`.
+    """
+    texto = (texto or '').strip()
+    if not texto:
+        return []
+    vecinos = Usuario.objects.filter(residencial=residencial).filter(
+        Q(apartamento__numero__istartswith=texto) | Q(first_name__istartswith=texto)
+        | Q(last_name__istartswith=texto) | Q(username__istartswith=texto)
+    ).order_by('apartamento__numero', 'id').values(
+        'id', 'apartamento__numero', 'first_name', 'last_name', 'username'
+    )[:limite]
+    return [
+        {
+            "id": v['id'],
+            "apto": v['apartamento__numero'] or "N/A",
+            "nombre": f"{v['first_name']} {v['last_name']}".strip() or v['username'],
+        }
+        for v in vecinos
+    ]
+
+
+# ---------------------------------------------------------
+# ANTIGÜEDAD DE SALDOS (reporte de morosidad)
+# ---------------------------------------------------------
+
+def morosidad_por_vecino(residencial, hoy):
+    """
+    Vecinos con deuda pendiente, con la deuda repartida por antigüedad del
+    vencimiento (al día, 1-30, 31-60, 61-90 y más de 90 días), agrupada en la
+    base de datos. Ordenados de mayor a menor deuda.
+    """
+    hace_30 = hoy - timedelta(days=30)
+    hace_60 = hoy - timedelta(days=60)
+    hace_90 = hoy - timedelta(days=90)
+
+    # Deuda de cada factura: saldo_pendiente si existe, si no el monto
+    deuda_expr = Coalesce('facturas__saldo_pendiente', 'facturas__monto')
+
+    return Usuario.objects.filter(
+        residencial=residencial,
+        facturas__estado='PENDIENTE'
+    ).annotate(
+        deuda_total_calc=Coalesce(Sum(deuda_expr), CERO),
+        al_dia_calc=Coalesce(Sum(deuda_expr, filter=Q(facturas__fecha_vencimiento__gte=hoy)), CERO),
+        dias_30_calc=Coalesce(Sum(deuda_expr, filter=Q(facturas__fecha_vencimiento__lt=hoy, facturas__fecha_vencimiento__gte=hace_30)), CERO),
+        dias_60_calc=Coalesce(Sum(deuda_expr, filter=Q(facturas__fecha_vencimiento__lt=hace_30, facturas__fecha_vencimiento__gte=hace_60)), CERO),
+        dias_90_calc=Coalesce(Sum(deuda_expr, filter=Q(facturas__fecha_vencimiento__lt=hace_60, facturas__fecha_vencimiento__gte=hace_90)), CERO),
+        mas_90_calc=Coalesce(Sum(deuda_expr, filter=Q(facturas__fecha_vencimiento__lt=hace_90)), CERO)
+    ).filter(deuda_total_calc__gt=0).order_by('-deuda_total_calc')
+
+
+# ---------------------------------------------------------
+# FILAS PARA EXPORTAR (ver core/exportar.py)
+# ---------------------------------------------------------
+# Cada función devuelve (encabezados, filas): `filas` es un iterador perezoso
+# sobre un cursor del lado del servidor (.iterator), nunca una lista.
+
+def exportacion_cuentas_por_cobrar(residencial):
+    encabezados = ['Apto', 'Residente', 'Concepto', 'Tipo', 'Emisión', 'Vencimiento', 'Monto', 'Saldo Pendiente']
+    filas = Factura.objects.filter(residencial=residencial, estado='PENDIENTE').order_by(
+        'usuario__apartamento__numero', 'fecha_vencimiento', 'id'
+    ).values_list(
+        'usuario__apartamento__numero', 'usuario__username', 'concepto', 'tipo',
+        'fecha_emision', 'fecha_vencimiento', 'monto', Coalesce('saldo_pendiente', 'monto')
+    ).iterator(chunk_size=2000)
+    return encabezados, filas
+
+
+def exportacion_estado_cuenta(vecino):
+    encabezados = ['Emisión', 'Concepto', 'Tipo', 'Vencimiento', 'Monto', 'Pagado', 'Saldo Pendiente', 'Estado', 'Fecha de Pago']
+    filas = Factura.objects.filter(usuario=vecino).order_by('-fecha_emision', '-id').values_list(
+        'fecha_emision', 'concepto', 'tipo', 'fecha_vencimiento', 'monto', 'monto_pagado',
+        Coalesce('saldo_pendiente', 'monto'), 'estado', 'fecha_pago'
+    ).iterator(chunk_size=2000)
+    return encabezados, filas
+
+
+def exportacion_morosidad(residencial, fecha):
+    # La foto de `fecha` (MorosidadVecino), la misma que muestra el reporte en pantalla
+    encabezados = ['Apto', 'Residente', 'Al Día', '1-30 días', '31-60 días', '61-90 días', '+90 días', 'Total']
+    filas = MorosidadVecino.objects.filter(residencial=residencial, fecha=fecha).order_by('-total').values_list(
+        'usuario__apartamento__numero', 'usuario__username', 'al_dia', 'dias_30', 'dias_60',
+        'dias_90', 'mas_90', 'total'
+    ).iterator(chunk_size=2000)
+    return encabezados, filas
+
+
+def exportacion_libro_banco(residencial, desde, hasta, saldo_apertura):
+    encabezados = ['Fecha', 'Tipo', 'Concepto', 'Residente', 'Monto', 'Balance']
+    return encabezados, movimientos_libro_banco(residencial, desde, hasta, saldo_apertura)
@@ -0,0 +1,129 @@
+from django.db.models import F
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .models import Residencial, Apartamento, Factura, Gasto, IngresoExtraordinario, CierreMensual, LecturaGas, Usuario
+from .services_deuda import recalcular_resumen_deuda
+from .services_cierre import invalidar_cierres
+from .services_cache import invalidar_reportes
+
+
+# Las facturas que se guardan una por una (gas, extraordinarias, admin, anulaciones
+# manuales) mantienen el ResumenDeuda aquí, dentro de la misma transacción.
+# Los servicios masivos (bulk_create / bulk_update / update) no disparan señales
+# y recalculan el resumen ellos mismos.
+
+@receiver(post_save, sender=Factura)
+def actualizar_resumen_al_guardar(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    recalcular_resumen_deuda(usuario_ids=[instance.usuario_id])
+
+
+@receiver(post_delete, sender=Factura)
+def actualizar_resumen_al_borrar(sender, instance, **kwargs):
+    # Si se está borrando el vecino completo, su fila de resumen puede haberse ido ya
+    recalcular_resumen_deuda(usuario_ids=[instance.usuario_id], crear=False)
+
+
+# Movimientos con fecha de un mes ya cerrado: el CierreMensual de ese mes y los
+# siguientes se borran (ver services_cierre). Los del mes en curso no cuestan nada.
+
+@receiver(pre_save, sender=Factura)
+def invalidar_cierres_factura(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    fechas = [instance.fecha_pago if instance.estado == 'PAGADO' else None]
+    if instance.pk:
+        anterior = Factura.objects.filter(pk=instance.pk, estado='PAGADO').values_list('fecha_pago', flat=True).first()
+        fechas.append(anterior)
+    invalidar_cierres(instance.residencial_id, *fechas)
+
+
+@receiver(post_delete, sender=Factura)
+def invalidar_cierres_factura_borrada(sender, instance, **kwargs):
+    if instance.estado == 'PAGADO':
+        invalidar_cierres(instance.residencial_id, instance.fecha_pago)
+
+
+@receiver(pre_save, sender=Gasto)
+def invalidar_cierres_gasto(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    fechas = [instance.fecha_gasto]
+    if instance.pk:
+        fechas.append(Gasto.objects.filter(pk=instance.pk).values_list('fecha_gasto', flat=True).first())
+    invalidar_cierres(instance.residencial_id, *fechas)
+
+
+@receiver(post_delete, sender=Gasto)
+def invalidar_cierres_gasto_borrado(sender, instance, **kwargs):
+    invalidar_cierres(instance.residencial_id, instance.fecha_gasto)
+
+
+@receiver(pre_save, sender=IngresoExtraordinario)
+@receiver(post_delete, sender=IngresoExtraordinario)
+def invalidar_cierres_ingreso_extra(sender, instance, raw=False, **kwargs):
+    # Se fechan al crearse (auto_now_add): solo editar o borrar uno viejo toca un mes cerrado
+    if raw or not instance.pk or instance.fecha_pago is None:
+        return
+    invalidar_cierres(instance.Apartamento.residencial_id, instance.fecha_pago)
+
+
+@receiver(pre_save, sender=Residencial)
+def ajustar_cierres_saldo_inicial(sender, instance, raw=False, **kwargs):
+    # El saldo inicial entra en todos los cierres: se corren por la diferencia, sin reconstruir
+    if raw or not instance.pk:
+        return
+    anterior = Residencial.objects.filter(pk=instance.pk).values_list('saldo_inicial', flat=True).first()
+    if anterior is not None and anterior != instance.saldo_inicial:
+        # Cambia el saldo de todos los reportes: versión nueva para la caché
+        invalidar_reportes(instance.pk)
+        diferencia = instance.saldo_inicial - anterior
+        CierreMensual.objects.filter(residencial_id=instance.pk).update(
+            saldo_apertura=F('saldo_apertura') + diferencia,
+            saldo_cierre=F('saldo_cierre') + diferencia
+        )
+
+
+# Caché de reportes: cualquier cambio en los datos de un residencial deja sus
+# reportes guardados sin efecto (ver services_cache). Los servicios masivos
+# llaman a invalidar_reportes ellos mismos.
+
+@receiver(post_save, sender=Factura)
+@receiver(post_delete, sender=Factura)
+@receiver(post_save, sender=Gasto)
+@receiver(post_delete, sender=Gasto)
+@receiver(post_save, sender=LecturaGas)
+@receiver(post_delete, sender=LecturaGas)
+@receiver(post_save, sender=Apartamento)
+@receiver(post_delete, sender=Apartamento)
+def invalidar_reportes_residencial(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    invalidar_reportes(instance.residencial_id)
+
+
+@receiver(post_save, sender=IngresoExtraordinario)
+@receiver(post_delete, sender=IngresoExtraordinario)
+def invalidar_reportes_ingreso_extra(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    invalidar_reportes(instance.Apartamento.residencial_id)
+
+
+@receiver(post_save, sender=Usuario)
+def invalidar_reportes_usuario(sender, instance, raw=False, update_fields=None, **kwargs):
+    # El login guarda el usuario solo para last_login: eso no toca ningún reporte
+    if raw or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    invalidar_reportes(instance.residencial_id)
+
+
+@receiver(post_save, sender=Residencial)
+def invalidar_reportes_al_guardar_residencial(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # Un save() completo también escribe version_datos, que pudo leerse antes de la
+    # última invalidación (ej: la pantalla de configuración): se pone una nueva para
+    # no revivir reportes guardados con datos viejos
+    if raw or created or (update_fields and 'version_datos' not in update_fields):
+        return
+    invalidar_reportes(instance.pk)
@@ -1,3 +1,1465 @@
-from django.test import TestCase
+import json
+import sys
+import tempfile
+import types
+import zipfile
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock, skipIf, skipUnless
 
-# Create your tests here.
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection, IntegrityError, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .models import (
+    Residencial, Apartamento, Usuario, Factura, EjecucionRobot, ReportePago, MovimientoBancario, Bitacora, Pago, ResumenDeuda,
+    NotificacionPago, Gasto, CierreMensual, IngresoExtraordinario, MorosidadResidencial, MorosidadVecino,
+    LecturaGas, AreaSocial, Reserva, Visita
+)
+from .services import (
+    procesar_pago_fifo, procesar_pagos_lote, resolver_reportes_pago, anular_pago_registrado, monto_pagado_por_factura
+)
+from .services_banco import importar_estado_cuenta, IndiceConciliacion, _importar_bloque
+from .services_deuda import recalcular_resumen_deuda, refrescar_vencimientos
+from .services_pasarela import procesar_notificaciones
+from .services_cierre import cerrar_meses, saldo_banco_al, rango_mes
+from .services_reportes import libro_banco, resumen_anual
+from .services_pdf import pdf_recibo, lote_pdf
+from .services_cache import estadisticas_cache, reiniciar_contadores
+from .services_morosidad import tomar_foto_morosidad, tendencia_morosidad
+from .services_reportes import estado_cuenta, cursor_estado_cuenta
+from .services_facturacion import (
+    generar_cuotas_mensuales, periodo_de, aplicar_moras, pronosticar_corridas, tareas_del_dia, procesar_residencial,
+    ejecutar_residenciales
+)
+
+try:
+    import weasyprint  # noqa: F401
+    HAY_WEASYPRINT = True
+except (ImportError, OSError):
+    HAY_WEASYPRINT = False
+
+
+def crear_residencial(aptos=3, **kwargs):
+    """Crea un residencial con `aptos` apartamentos, cada uno con su dueño."""
+    residencial = Residencial.objects.create(nombre="Torre Prueba", direccion="Calle 1", **kwargs)
+    duenos = []
+    for i in range(aptos):
+        apto = Apartamento.objects.create(residencial=residencial, numero=f"A-{i + 1}", monto_cuota=Decimal('1000.00'))
+        duenos.append(Usuario.objects.create(
+            username=f"vecino{residencial.id}_{i}", residencial=residencial, apartamento=apto
+        ))
+    return residencial, duenos
+
+
+class RobotCobradorCuotasTests(TestCase):
+
+    def test_genera_cuotas_en_lote_aplicando_saldo_a_favor(self):
+        hoy = timezone.now().date()
+        residencial, duenos = crear_residencial(aptos=5, dia_corte=hoy.day)
+        duenos[0].saldo_favor_mantenimiento = Decimal('1500.00')
+        duenos[0].save()
+        duenos[1].saldo_favor_mantenimiento = Decimal('400.00')
+        duenos[1].save()
+
+        with CaptureQueriesContext(connection) as consultas:
+            call_command('robot_cobrador', stdout=StringIO())
+        primera_corrida = len(consultas)
+
+        self.assertEqual(Factura.objects.filter(residencial=residencial, tipo='CUOTA').count(), 5)
+        pagada = Factura.objects.get(usuario=duenos[0])
+        self.assertEqual(pagada.estado, 'PAGADO')
+        parcial = Factura.objects.get(usuario=duenos[1])
+        self.assertEqual(parcial.saldo_pendiente, Decimal('600.00'))
+        duenos[0].refresh_from_db()
+        duenos[1].refresh_from_db()
+        self.assertEqual(duenos[0].saldo_favor_mantenimiento, Decimal('500.00'))
+        self.assertEqual(duenos[1].saldo_favor_mantenimiento, Decimal('0.00'))
+
+        # Más apartamentos no deben significar más consultas
+        for i in range(20):
+            apto = Apartamento.objects.create(residencial=residencial, numero=f"B-{i}", monto_cuota=Decimal('800.00'))
+            Usuario.objects.create(username=f"extra{i}", residencial=residencial, apartamento=apto)
+        # El mes ya quedó marcado como facturado; se reabre para que el robot vuelva a pasar
+        Residencial.objects.filter(pk=residencial.pk).update(ultimo_periodo_facturado=None)
+        with CaptureQueriesContext(connection) as consultas:
+            call_command('robot_cobrador', stdout=StringIO())
+        self.assertLessEqual(len(consultas), primera_corrida + 2)
+        self.assertEqual(Factura.objects.filter(residencial=residencial, tipo='CUOTA').count(), 25)
+
+
+class GenerarCuotasMensualesTests(TestCase):
+
+    def test_reejecutar_cualquier_entrada_nunca_cobra_doble(self):
+        hoy = timezone.now().date()
+        residencial, duenos = crear_residencial(aptos=4, dia_corte=1)
+
+        primera = generar_cuotas_mensuales(residencial, hoy)
+        call_command('cron_cuotas', stdout=StringIO())
+        segunda = generar_cuotas_mensuales(residencial, hoy)
+
+        self.assertEqual(primera['generadas'], 4)
+        self.assertEqual(segunda['generadas'], 0)
+        self.assertEqual(Factura.objects.filter(tipo='CUOTA', periodo=periodo_de(hoy)).count(), 4)
+
+    def test_generacion_manual_antes_del_corte_no_cierra_el_mes(self):
+        from datetime import date
+        residencial, duenos = crear_residencial(aptos=2, dia_corte=10)
+        admin = Usuario.objects.create(username="admin_cuotas", residencial=residencial, rol='ADMIN_RESIDENCIAL')
+
+        self.assertEqual(generar_cuotas_mensuales(residencial, date(2026, 3, 5), usuario=admin)['generadas'], 2)
+        residencial.refresh_from_db()
+        self.assertIsNone(residencial.ultimo_periodo_facturado)
+
+        # Un apartamento nuevo antes del corte: el robot lo factura el día 10 y cierra el mes
+        apto = Apartamento.objects.create(residencial=residencial, numero="B-1", monto_cuota=Decimal('700.00'))
+        Usuario.objects.create(username="nuevo_b1", residencial=residencial, apartamento=apto)
+        self.assertEqual([r for r, _ in tareas_del_dia(date(2026, 3, 10), fases=('CUOTAS',))], [residencial.id])
+        resultado = procesar_residencial(residencial.id, date(2026, 3, 10), ('CUOTAS',))
+        self.assertEqual(resultado['cuotas_generadas'], 1)
+        residencial.refresh_from_db()
+        self.assertEqual(residencial.ultimo_periodo_facturado, date(2026, 3, 1))
+
+    def test_choque_con_el_indice_unico_no_consume_saldo(self):
+        hoy = timezone.now().date()
+        residencial, duenos = crear_residencial(aptos=1)
+        Usuario.objects.filter(pk=duenos[0].pk).update(saldo_favor_mantenimiento=Decimal('300.00'))
+        # La cuota del mes aparece después de leer las existentes (ej: otra corrida sin bloqueo)
+        original = Factura.objects.bulk_create
+
+        def con_carrera(facturas, **kwargs):
+            Factura.objects.create(
+                residencial=residencial, usuario=duenos[0], tipo='CUOTA', concepto="Otra corrida",
+                monto=Decimal('1000.00'), fecha_vencimiento=hoy, periodo=periodo_de(hoy)
+            )
+            return original(facturas, **kwargs)
+
+        with mock.patch.object(Factura.objects, 'bulk_create', side_effect=con_carrera):
+            with self.assertRaises(IntegrityError):
+                generar_cuotas_mensuales(residencial, hoy)
+        duenos[0].refresh_from_db()
+        self.assertEqual(duenos[0].saldo_favor_mantenimiento, Decimal('300.00'))
+
+    def test_restriccion_unica_por_periodo(self):
+        hoy = timezone.now().date()
+        residencial, duenos = crear_residencial(aptos=1)
+        generar_cuotas_mensuales(residencial, hoy)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Factura.objects.create(
+                residencial=residencial, usuario=duenos[0], tipo='CUOTA', concepto="Duplicada",
+                monto=Decimal('1.00'), fecha_vencimiento=hoy, periodo=periodo_de(hoy)
+            )
+
+
+class AplicarMorasTests(TestCase):
+
+    def crear_cuota(self, usuario, vencimiento, ultima_mora=None):
+        return Factura.objects.create(
+            residencial=usuario.residencial, usuario=usuario, tipo='CUOTA', concepto="Mantenimiento",
+            monto=Decimal('1000.00'), saldo_pendiente=Decimal('1000.00'),
+            fecha_vencimiento=vencimiento, fecha_ultima_mora=ultima_mora
+        )
+
+    def test_un_solo_update_respeta_la_regla_de_elegibilidad(self):
+        from datetime import date
+        hoy = date(2026, 4, 10)
+        residencial, duenos = crear_residencial(aptos=4, porcentaje_mora=Decimal('5.00'))
+
+        nunca = self.crear_cuota(duenos[0], date(2026, 3, 1))
+        mes_pasado = self.crear_cuota(duenos[1], date(2026, 2, 1), ultima_mora=date(2026, 3, 15))
+        este_mes = self.crear_cuota(duenos[2], date(2026, 2, 1), ultima_mora=date(2026, 4, 2))
+        reciente = self.crear_cuota(duenos[3], date(2026, 2, 1), ultima_mora=date(2026, 3, 31))
+
+        with CaptureQueriesContext(connection) as consultas:
+            aplicadas = aplicar_moras(residencial, hoy)
+
+        self.assertEqual(aplicadas, 2)
+        self.assertEqual(sum(1 for q in consultas if q['sql'].startswith('UPDATE')), 1)
+
+        nunca.refresh_from_db()
+        self.assertEqual(nunca.monto, Decimal('1050.00'))
+        self.assertEqual(nunca.saldo_pendiente, Decimal('1050.00'))
+        self.assertEqual(nunca.fecha_ultima_mora, hoy)
+        self.assertTrue(nunca.concepto.endswith("(+5.00% Mora)"))
+        self.assertEqual(nunca.fecha_proxima_mora, date(2026, 5, 1))
+
+        mes_pasado.refresh_from_db()
+        self.assertEqual(mes_pasado.fecha_ultima_mora, hoy)
+        este_mes.refresh_from_db()
+        self.assertEqual(este_mes.monto, Decimal('1000.00'))
+        reciente.refresh_from_db()
+        self.assertEqual(reciente.monto, Decimal('1000.00'))
+
+        # Repetir el mismo día no vuelve a recargar
+        self.assertEqual(aplicar_moras(residencial, hoy), 0)
+
+    def test_mover_el_vencimiento_mueve_la_proxima_mora(self):
+        from datetime import date
+        residencial, duenos = crear_residencial(aptos=1, porcentaje_mora=Decimal('5.00'))
+        cuota = self.crear_cuota(duenos[0], date(2026, 3, 1))
+
+        # Se le dio prórroga hasta el 20: el día 10 todavía no corresponde mora
+        cuota.fecha_vencimiento = date(2026, 3, 20)
+        cuota.save(update_fields=['fecha_vencimiento'])
+        cuota.refresh_from_db()
+        self.assertEqual(cuota.fecha_proxima_mora, date(2026, 3, 21))
+        self.assertEqual(aplicar_moras(residencial, date(2026, 3, 10)), 0)
+        self.assertEqual(aplicar_moras(residencial, date(2026, 3, 21)), 1)
+
+        # Con la mora ya aplicada, editar el vencimiento no adelanta la siguiente
+        cuota.refresh_from_db()
+        cuota.fecha_vencimiento = date(2026, 3, 1)
+        cuota.save()
+        cuota.refresh_from_db()
+        self.assertEqual(cuota.fecha_proxima_mora, date(2026, 4, 10))
+
+
+class RobotReanudableTests(TestCase):
+
+    def test_resume_salta_fases_completadas(self):
+        hoy = timezone.now().date()
+        residencial, duenos = crear_residencial(aptos=2, dia_corte=hoy.day)
+        Factura.objects.create(
+            residencial=residencial, usuario=duenos[0], tipo='CUOTA', concepto="Mantenimiento Atrasado",
+            monto=Decimal('1000.00'), fecha_vencimiento=hoy - timedelta(days=40)
+        )
+
+        call_command('robot_cobrador', stdout=StringIO())
+        ledger = EjecucionRobot.objects.filter(residencial=residencial, fecha_corrida=hoy)
+        self.assertEqual(set(ledger.values_list('fase', flat=True)), {'CUOTAS', 'MORAS'})
+        self.assertEqual(ledger.get(fase='CUOTAS').filas_afectadas, 2)
+
+        # Una corrida reanudada no vuelve a tocar este residencial
+        salida = StringIO()
+        call_command('robot_cobrador', '--resume', stdout=salida)
+        self.assertNotIn('Procesando Residencial', salida.getvalue())
+        self.assertEqual(ledger.count(), 2)
+
+
+class EjecutarResidencialesTests(TestCase):
+
+    def test_residencial_ya_procesado_no_factura_dos_veces(self):
+        from datetime import date
+        hoy = date(2026, 3, 10)
+        residencial, _ = crear_residencial(aptos=3, dia_corte=10)
+
+        primera = procesar_residencial(residencial.id, hoy, ('CUOTAS',))
+        segunda = procesar_residencial(residencial.id, hoy, ('CUOTAS',))
+
+        self.assertEqual((primera['estado'], primera['cuotas_generadas']), ('OK', 3))
+        self.assertEqual((segunda['estado'], segunda['cuotas_generadas']), ('OK', 0))
+        self.assertEqual(Factura.objects.filter(residencial=residencial, tipo='CUOTA').count(), 3)
+        # El reintento del mismo día actualiza la fila del ledger en vez de duplicarla
+        fila = EjecucionRobot.objects.get(residencial=residencial, fecha_corrida=hoy, fase='CUOTAS')
+        self.assertEqual((fila.estado, fila.filas_afectadas), ('COMPLETADO', 0))
+
+    def test_residencial_bloqueado_por_otra_corrida_se_omite_sin_ledger(self):
+        from datetime import date
+        residencial, _ = crear_residencial(aptos=2, dia_corte=10)
+
+        # SKIP LOCKED no devuelve la fila que otra transacción tiene bloqueada
+        with mock.patch('core.services_facturacion.Residencial.objects.select_for_update',
+                        return_value=Residencial.objects.none()) as bloqueo:
+            resultado = procesar_residencial(residencial.id, date(2026, 3, 10), ('CUOTAS', 'MORAS'))
+        bloqueo.assert_called_once_with(skip_locked=True)
+
+        self.assertEqual(resultado['estado'], 'OMITIDO')
+        self.assertIsNone(resultado['cuotas_generadas'])
+        self.assertFalse(Factura.objects.filter(residencial=residencial).exists())
+        self.assertFalse(EjecucionRobot.objects.filter(residencial=residencial).exists())
+
+    def test_ejecutar_en_serie_registra_cada_residencial_y_fase(self):
+        from datetime import date
+        hoy = date(2026, 3, 10)
+        uno, _ = crear_residencial(aptos=2, dia_corte=10)
+        dos, duenos = crear_residencial(aptos=1, dia_corte=10, porcentaje_mora=Decimal('5.00'))
+        Factura.objects.create(
+            residencial=dos, usuario=duenos[0], tipo='CUOTA', concepto="Mantenimiento Enero",
+            monto=Decimal('1000.00'), saldo_pendiente=Decimal('1000.00'), fecha_vencimiento=date(2026, 1, 20)
+        )
+
+        tareas = [(uno.id, ('CUOTAS',)), (dos.id, ('CUOTAS', 'MORAS'))]
+        resultados = {r['residencial_id']: r for r in ejecutar_residenciales(tareas, hoy, workers=1)}
+
+        self.assertEqual(resultados[uno.id]['cuotas_generadas'], 2)
+        self.assertIsNone(resultados[uno.id]['moras_aplicadas'])
+        self.assertEqual((resultados[dos.id]['cuotas_generadas'], resultados[dos.id]['moras_aplicadas']), (1, 1))
+        self.assertEqual(
+            set(EjecucionRobot.objects.filter(fecha_corrida=hoy).values_list('residencial_id', 'fase', 'filas_afectadas')),
+            {(uno.id, 'CUOTAS', 2), (dos.id, 'CUOTAS', 1), (dos.id, 'MORAS', 1)}
+        )
+        # Ya facturados, ninguno vuelve a pedir la fase de cuotas
+        self.assertEqual(tareas_del_dia(hoy, fases=('CUOTAS',), atrasados=True), [])
+
+
+    def test_ejecutar_con_pool_registra_errores_por_residencial(self):
+        from concurrent.futures import Future
+        from datetime import date
+        from . import services_facturacion
+        hoy = date(2026, 3, 10)
+        uno, _ = crear_residencial(aptos=2, dia_corte=10)
+        dos, _ = crear_residencial(aptos=1, dia_corte=10)
+
+        class PoolEnProceso:
+            """Pool falso: corre cada tarea aquí mismo (la base de pruebas no se ve desde otro proceso)."""
+            creados = []
+
+            def __init__(self, max_workers, initializer=None):
+                self.max_workers = max_workers
+                self.creados.append(self)
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def submit(self, funcion, *args):
+                futuro = Future()
+                try:
+                    futuro.set_result(funcion(*args))
+                except Exception as e:
+                    futuro.set_exception(e)
+                return futuro
+
+        generar = services_facturacion.generar_cuotas_mensuales
+
+        def falla_en_dos(residencial, *args, **kwargs):
+            if residencial.id == dos.id:
+                raise RuntimeError("Se cayó la base de datos")
+            return generar(residencial, *args, **kwargs)
+
+        tareas = [(uno.id, ('CUOTAS',)), (dos.id, ('CUOTAS',))]
+        with mock.patch('core.services_facturacion.ProcessPoolExecutor', PoolEnProceso), \
+                mock.patch.object(services_facturacion.connections, 'close_all') as cerrar, \
+                mock.patch('core.services_facturacion.generar_cuotas_mensuales', side_effect=falla_en_dos):
+            resultados = {r['residencial_id']: r for r in ejecutar_residenciales(tareas, hoy, workers=4)}
+
+        self.assertEqual(PoolEnProceso.creados[0].max_workers, 4)
+        cerrar.assert_called_once_with()
+        self.assertEqual((resultados[uno.id]['estado'], resultados[uno.id]['cuotas_generadas']), ('OK', 2))
+        self.assertEqual(resultados[dos.id]['estado'], 'ERROR')
+        self.assertFalse(Factura.objects.filter(residencial=dos).exists())
+
+        ok = EjecucionRobot.objects.get(residencial=uno, fecha_corrida=hoy, fase='CUOTAS')
+        self.assertEqual((ok.estado, ok.filas_afectadas), ('COMPLETADO', 2))
+        error = EjecucionRobot.objects.get(residencial=dos, fecha_corrida=hoy, fase='CUOTAS')
+        self.assertEqual(error.estado, 'ERROR')
+        self.assertIn("Se cayó la base de datos", error.mensaje_error)
+
+class PronosticoRobotTests(TestCase):
+
+    def test_pronostico_coincide_con_la_corrida_real_sin_escribir(self):
+        from datetime import date
+        hoy = date(2026, 4, 10)
+        residencial, duenos = crear_residencial(aptos=3, dia_corte=10, porcentaje_mora=Decimal('5.00'))
+        duenos[0].saldo_favor_mantenimiento = Decimal('250.00')
+        duenos[0].save()
+        Factura.objects.create(
+            residencial=residencial, usuario=duenos[1], tipo='CUOTA', concepto="Mantenimiento Marzo",
+            monto=Decimal('1000.00'), saldo_pendiente=Decimal('333.33'), fecha_vencimiento=date(2026, 3, 25)
+        )
+
+        with CaptureQueriesContext(connection) as consultas:
+            p = pronosticar_corridas([residencial], hoy)[residencial.id]
+        self.assertLessEqual(len(consultas), 3)
+        self.assertFalse(any(q['sql'].startswith(('INSERT', 'UPDATE')) for q in consultas))
+
+        self.assertEqual(p['cuotas'], 3)
+        self.assertEqual(p['monto_cuotas'], Decimal('3000.00'))
+        self.assertEqual(p['saldo_favor_consumido'], Decimal('250.00'))
+        self.assertEqual(p['moras'], 1)
+        self.assertEqual(p['monto_moras'], Decimal('16.67'))
+        self.assertEqual(Factura.objects.count(), 1)
+
+        # La corrida real hace exactamente lo pronosticado
+        self.assertEqual(generar_cuotas_mensuales(residencial, hoy)['generadas'], p['cuotas'])
+        self.assertEqual(aplicar_moras(residencial, hoy), p['moras'])
+        morosa = Factura.objects.get(concepto__startswith="Mantenimiento Marzo")
+        self.assertEqual(morosa.saldo_pendiente - Decimal('333.33'), p['monto_moras'])
+
+
+class ProgramacionRobotTests(TestCase):
+
+    def test_solo_devuelve_residenciales_con_trabajo_y_maneja_meses_cortos(self):
+        from datetime import date
+        febrero = date(2026, 2, 28)
+        corte_31, duenos = crear_residencial(aptos=1, dia_corte=31)
+        corte_hoy, _ = crear_residencial(aptos=1, dia_corte=28)
+        corte_15, _ = crear_residencial(aptos=1, dia_corte=15, porcentaje_mora=Decimal('0.00'))
+        con_mora, otros = crear_residencial(aptos=1, dia_corte=5)
+        Factura.objects.create(
+            residencial=con_mora, usuario=otros[0], tipo='CUOTA', concepto="Mantenimiento Enero",
+            monto=Decimal('1000.00'), fecha_vencimiento=date(2026, 1, 20)
+        )
+
+        with self.assertNumQueries(1):
+            tareas = dict(tareas_del_dia(febrero))
+        self.assertEqual(tareas, {corte_31.id: ('CUOTAS',), corte_hoy.id: ('CUOTAS',), con_mora.id: ('MORAS',)})
+
+        # El 15 no es fin de mes: solo el de corte 15 (sin mora) y el que debe moras
+        tareas = dict(tareas_del_dia(date(2026, 2, 15)))
+        self.assertEqual(tareas, {corte_15.id: ('CUOTAS',), con_mora.id: ('MORAS',)})
+
+        # Una vez que el robot facturó el mes, el de corte atrasado deja de aparecer
+        procesar_residencial(corte_31.id, febrero, ('CUOTAS',))
+        tareas = dict(tareas_del_dia(febrero, fases=('CUOTAS',), atrasados=True))
+        self.assertNotIn(corte_31.id, tareas)
+        self.assertIn(corte_15.id, tareas)
+
+
+class BenchmarkCobrosTests(TestCase):
+
+    def test_escribe_json_con_todas_las_rutas_y_revierte_los_datos(self):
+        import json
+        import os
+        import tempfile
+
+        salida = os.path.join(tempfile.mkdtemp(), 'benchmark.json')
+        call_command(
+            'benchmark_cobros', '--residenciales', '2', '--apartamentos', '3', '--meses', '2',
+            '--pagos', '2', '--salida', salida, stdout=StringIO()
+        )
+
+        with open(salida, encoding='utf-8') as archivo:
+            resultados = json.load(archivo)
+        self.assertEqual(
+            set(resultados['rutas']),
+            {'tareas_del_dia', 'pronosticar_corridas', 'robot_cobrador', 'cron_cuotas', 'aplicar_moras', 'procesar_pago_fifo'}
+        )
+        self.assertGreater(resultados['rutas']['cron_cuotas']['consultas'], 0)
+        self.assertEqual(Residencial.objects.count(), 0)
+        self.assertEqual(Factura.objects.count(), 0)
+
+
+class ProcesarPagoFifoTests(TestCase):
+
+    def test_saldar_atrasos_cuesta_consultas_constantes(self):
+        from datetime import date
+        residencial, duenos = crear_residencial(aptos=2)
+
+        def atrasos(usuario, meses):
+            for m in range(meses):
+                Factura.objects.create(
+                    residencial=residencial, usuario=usuario, tipo='CUOTA', concepto=f"Mes {m}",
+                    monto=Decimal('1000.00'), saldo_pendiente=Decimal('1000.00'),
+                    fecha_vencimiento=date(2024, 1, 15) + timedelta(days=31 * m)
+                )
+
+        atrasos(duenos[0], 1)
+        atrasos(duenos[1], 24)
+
+        with CaptureQueriesContext(connection) as un_mes:
+            procesar_pago_fifo(duenos[0], Decimal('1500.00'), 'MANTENIMIENTO')
+        with CaptureQueriesContext(connection) as veinticuatro:
+            resultado = procesar_pago_fifo(duenos[1], Decimal('24500.00'), 'MANTENIMIENTO')
+
+        self.assertEqual(len(veinticuatro), len(un_mes))
+        self.assertEqual(resultado['facturas_pagadas'], 24)
+        self.assertEqual(resultado['sobrante'], Decimal('500.00'))
+        self.assertFalse(Factura.objects.filter(usuario=duenos[1], estado='PENDIENTE').exists())
+        self.assertEqual(duenos[1].saldo_favor_mantenimiento, Decimal('500.00'))
+
+    def test_sobrante_se_suma_sobre_el_valor_de_la_base_de_datos(self):
+        residencial, duenos = crear_residencial(aptos=1)
+        copia_vieja = Usuario.objects.get(pk=duenos[0].pk)
+
+        # Otro worker abonó mientras tanto; la copia en memoria quedó desactualizada
+        procesar_pago_fifo(duenos[0], Decimal('200.00'), 'GAS')
+        procesar_pago_fifo(copia_vieja, Decimal('300.00'), 'GAS')
+
+        duenos[0].refresh_from_db()
+        self.assertEqual(duenos[0].saldo_favor_gas, Decimal('500.00'))
+
+
+class ProcesarPagosLoteTests(TestCase):
+
+    def test_lote_aplica_en_orden_con_consultas_constantes(self):
+        from datetime import date
+        residencial, duenos = crear_residencial(aptos=30)
+        for dueno in duenos:
+            for mes in (1, 2):
+                Factura.objects.create(
+                    residencial=residencial, usuario=dueno, tipo='CUOTA', concepto=f"Mes {mes}",
+                    monto=Decimal('1000.00'), saldo_pendiente=Decimal('1000.00'), fecha_vencimiento=date(2026, mes, 15)
+                )
+
+        # El primer vecino aparece dos veces: la segunda línea sigue donde quedó la primera
+        pagos = [(duenos[0], Decimal('1500.00'), 'MANTENIMIENTO'), (duenos[0], Decimal('800.00'), 'MANTENIMIENTO')]
+        pagos += [(dueno, Decimal('2500.00'), 'MANTENIMIENTO') for dueno in duenos[1:]]
+
+        with CaptureQueriesContext(connection) as consultas:
+            resultados = procesar_pagos_lote(pagos)
+        # Incluye la agregación y el upsert del ResumenDeuda de los vecinos tocados
+        self.assertLessEqual(len(consultas), 10)
+
+        self.assertEqual([r['facturas_pagadas'] for r in resultados[:2]], [1, 1])
+        self.assertEqual(resultados[1]['sobrante'], Decimal('300.00'))
+        self.assertTrue(all(r['sobrante'] == Decimal('500.00') for r in resultados[2:]))
+        self.assertFalse(Factura.objects.filter(estado='PENDIENTE').exists())
+
+        duenos[0].refresh_from_db()
+        duenos[5].refresh_from_db()
+        self.assertEqual(duenos[0].saldo_favor_mantenimiento, Decimal('300.00'))
+        self.assertEqual(duenos[5].saldo_favor_mantenimiento, Decimal('500.00'))
+
+
+    def test_vista_rechaza_montos_no_finitos_o_fuera_de_rango(self):
+        residencial, duenos = crear_residencial(aptos=1)
+        admin = Usuario.objects.create(username="admin_lote", residencial=residencial, rol='ADMIN_RESIDENCIAL')
+        self.client.force_login(admin)
+
+        respuesta = self.client.post('/registrar-abono/lote/', {
+            'lineas': "A-1, nan\nA-1, Infinity\nA-1, -Infinity\nA-1, 100000000\nA-1, 250.00"
+        })
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(len(respuesta.context['errores']), 4)
+        self.assertIn("máximo", respuesta.context['errores'][3])
+        self.assertEqual(Pago.objects.get().monto, Decimal('250.00'))
+
+class ImportarEstadoCuentaTests(TestCase):
+
+    def test_concilia_por_apartamento_y_reporte_y_encola_lo_ambiguo(self):
+        residencial, duenos = crear_residencial(aptos=4)
+        reporte = ReportePago.objects.create(residencial=residencial, usuario=duenos[2], monto=Decimal('1750.00'))
+        ReportePago.objects.create(residencial=residencial, usuario=duenos[0], monto=Decimal('900.00'))
+        ReportePago.objects.create(residencial=residencial, usuario=duenos[1], monto=Decimal('900.00'))
+        ReportePago.objects.create(residencial=residencial, usuario=duenos[3], monto=Decimal('640.00'))
+        # Un apartamento cuyo número aparece en fechas y referencias
+        apto_15 = Apartamento.objects.create(residencial=residencial, numero="15", monto_cuota=Decimal('1000.00'))
+        Usuario.objects.create(username="vecino_15", residencial=residencial, apartamento=apto_15)
+
+        csv_banco = StringIO(
+            "Fecha,Descripcion,Referencia,Monto\n"
+            "01/03/2026,DEP APTO A-2 MARZO,REF001,\"1,000.00\"\n"
+            "02/03/2026,TRANSF APT. A-3,REF002,1750.00\n"
+            "03/03/2026,TRANSFERENCIA,REF003,900.00\n"
+            "04/03/2026,PAGO A-1 Y A-3,REF004,2000.00\n"
+            "05/03/2026,COMISION,REF005,-25.00\n"
+            "06/03/2026,TRANSFERENCIA 15/03,15,1000.00\n"
+            "07/03/2026,DEP APTO A-1,REF007,1234.00\n"
+            "08/03/2026,TRANSFERENCIA,REF008,640.00\n"
+        )
+        with CaptureQueriesContext(connection) as consultas:
+            resumen = importar_estado_cuenta(residencial, csv_banco)
+        self.assertLess(len(consultas), 16)
+
+        self.assertEqual(resumen['aplicadas'], 2)
+        self.assertEqual(resumen['en_revision'], 5)
+        self.assertEqual(resumen['ignoradas'], 1)
+        self.assertEqual(resumen['monto_aplicado'], Decimal('2750.00'))
+
+        duenos[1].refresh_from_db()
+        self.assertEqual(duenos[1].saldo_favor_mantenimiento, Decimal('1000.00'))
+        reporte.refresh_from_db()
+        self.assertEqual(reporte.estado, 'APROBADO')
+        revision = MovimientoBancario.objects.filter(estado='REVISION')
+        self.assertEqual(revision.count(), 5)
+        # Sin marca de apartamento, el número suelto o el monto de un reporte solo quedan como pista
+        self.assertFalse(revision.exclude(usuario=None).exists())
+        self.assertIn(duenos[3].username, revision.get(referencia='REF008').motivo)
+        self.assertEqual(ReportePago.objects.filter(usuario=duenos[3], estado='PENDIENTE').count(), 1)
+
+        # Reimportar el mismo archivo no vuelve a aplicar nada
+        csv_banco.seek(0)
+        resumen = importar_estado_cuenta(residencial, csv_banco)
+        self.assertEqual(resumen['duplicadas'], 7)
+        self.assertEqual(resumen['aplicadas'], 0)
+
+    def test_reimportar_depositos_sin_referencia_no_los_duplica(self):
+        residencial, duenos = crear_residencial(aptos=2)
+        csv_banco = StringIO(
+            "Fecha,Descripcion,Monto\n"
+            "01/03/2026,DEP APTO A-1,1000.00\n"
+            "01/03/2026,DEP APTO A-1,1000.00\n"
+            "02/03/2026,DEP APTO A-2,1000.00\n"
+        )
+        # Dos depósitos idénticos del mismo día son dos depósitos, aunque caigan en bloques distintos
+        resumen = importar_estado_cuenta(residencial, csv_banco, tamano_bloque=1)
+        self.assertEqual((resumen['aplicadas'], resumen['duplicadas']), (3, 0))
+        duenos[0].refresh_from_db()
+        self.assertEqual(duenos[0].saldo_favor_mantenimiento, Decimal('2000.00'))
+
+        csv_banco.seek(0)
+        resumen = importar_estado_cuenta(residencial, csv_banco)
+        self.assertEqual((resumen['aplicadas'], resumen['duplicadas']), (0, 3))
+        self.assertEqual(MovimientoBancario.objects.count(), 3)
+
+        # Un estado de cuenta que trae un tercer depósito igual solo aplica ese
+        csv_banco = StringIO(csv_banco.getvalue() + "01/03/2026,DEP APTO A-1,1000.00\n")
+        resumen = importar_estado_cuenta(residencial, csv_banco)
+        self.assertEqual((resumen['aplicadas'], resumen['duplicadas']), (1, 3))
+
+    def test_montos_no_finitos_se_ignoran(self):
+        residencial, _ = crear_residencial(aptos=1)
+        csv_banco = StringIO(
+            "Fecha,Descripcion,Referencia,Monto\n"
+            "01/03/2026,DEP APTO A-1,REF1,nan\n"
+            "02/03/2026,DEP APTO A-1,REF2,Infinity\n"
+            "03/03/2026,DEP APTO A-1,REF3,1000.00\n"
+        )
+        resumen = importar_estado_cuenta(residencial, csv_banco)
+        self.assertEqual((resumen['ignoradas'], resumen['aplicadas']), (2, 1))
+
+    def test_csv_malformado_muestra_error_en_la_vista(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        residencial, _ = crear_residencial(aptos=1)
+        admin = Usuario.objects.create(username="admin_banco", residencial=residencial, rol='ADMIN_RESIDENCIAL')
+        self.client.force_login(admin)
+
+        archivo = SimpleUploadedFile("banco.csv", b"Fecha,Monto\n01/03/2026," + b"9" * 200000 + b"\n", content_type="text/csv")
+        respuesta = self.client.post('/finanzas/banco/', {'accion': 'importar', 'archivo': archivo}, follow=True)
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIn("No se pudo leer el archivo", [str(m) for m in respuesta.context['messages']][0])
+        self.assertFalse(MovimientoBancario.objects.exists())
+
+    def test_reporte_aprobado_durante_la_importacion_va_a_revision(self):
+        residencial, duenos = crear_residencial(aptos=1)
+        reporte = ReportePago.objects.create(residencial=residencial, usuario=duenos[0], monto=Decimal('700.00'))
+        indice = IndiceConciliacion(residencial)
+
+        # El admin lo aprueba por su lado después de armado el índice
+        resolver_reportes_pago(residencial, [reporte.id], 'aprobar')
+        duenos[0].refresh_from_db()
+        saldo = duenos[0].saldo_favor_mantenimiento
+
+        resumen = {"aplicadas": 0, "en_revision": 0, "duplicadas": 0, "monto_aplicado": Decimal('0.00')}
+        linea = {"fecha": date(2026, 3, 1), "monto": Decimal('700.00'), "referencia": "REF1", "descripcion": "APTO A-1"}
+        _importar_bloque(residencial, [linea], indice, resumen)
+
+        self.assertEqual((resumen['aplicadas'], resumen['en_revision']), (0, 1))
+        duenos[0].refresh_from_db()
+        self.assertEqual(duenos[0].saldo_favor_mantenimiento, saldo)
+        self.assertEqual(MovimientoBancario.objects.get().estado, 'REVISION')
+
+
+class ResolverReportesPagoTests(TestCase):
+
+    def test_aprobacion_en_lote_agrupa_por_vecino(self):
+        from datetime import date
+        residencial, duenos = crear_residencial(aptos=20)
+        for dueno in duenos:
+            Factura.objects.create(
+                residencial=residencial, usuario=dueno, tipo='CUOTA', concepto="Mantenimiento",
+                monto=Decimal('1000.00'), saldo_pendiente=Decimal('1000.00'), fecha_vencimiento=date(2026, 1, 15)
+            )
+        reportes = [ReportePago.objects.create(residencial=residencial, usuario=d, monto=Decimal('600.00')) for d in duenos]
+        # Un vecino mandó dos comprobantes: entre ambos saldan la cuota y sobran 200
+        reportes.append(ReportePago.objects.create(residencial=residencial, usuario=duenos[0], monto=Decimal('600.00')))
+        ya_rechazado = ReportePago.objects.create(residencial=residencial, usuario=duenos[1], monto=Decimal('5.00'), estado='RECHAZADO')
+
+        with CaptureQueriesContext(connection) as consultas:
+            resultado = resolver_reportes_pago(residencial, [r.id for r in reportes] + [ya_rechazado.id], 'aprobar')
+        self.assertLessEqual(len(consultas), 14)
+
+        self.assertEqual(len(resultado['procesados']), 21)
+        self.assertEqual(resultado['omitidos'], 1)
+        self.assertEqual(resultado['facturas_pagadas'], 1)
+        self.assertFalse(ReportePago.objects.filter(estado='PENDIENTE').exists())
+        self.assertEqual(Bitacora.objects.filter(residencial=residencial).count(), 21)
+
+        duenos[0].refresh_from_db()
+        self.assertEqual(duenos[0].saldo_favor_mantenimiento, Decimal('200.00'))
+        self.assertEqual(Factura.objects.get(usuario=duenos[5]).saldo_pendiente, Decimal('400.00'))
+
+
+class AnularPagoRegistradoTests(TestCase):
+
+    def crear_cuotas(self, usuario, meses):
+        from datetime import date
+        return [
+            Factura.objects.create(
+                residencial=usuario.residencial, usuario=usuario, tipo='CUOTA', concepto=f"Mes {m}",
+                monto=Decimal('1000.00'), saldo_pendiente=Decimal('1000.00'), fecha_vencimiento=date(2026, m, 15)
+            )
+            for m in range(1, meses + 1)
+        ]
+
+    def test_anular_deshace_exactamente_las_asignaciones_y_el_credito(self):
+        residencial, duenos = crear_residencial(aptos=1)
+        vecino = duenos[0]
+        facturas = self.crear_cuotas(vecino, 3)
+        procesar_pago_fifo(vecino, Decimal('500.00'), 'MANTENIMIENTO')
+        procesar_pago_fifo(vecino, Decimal('3000.00'), 'MANTENIMIENTO')
+
+        pago = Pago.objects.get(monto=Decimal('3000.00'))
+        self.assertEqual(pago.credito_generado, Decimal('500.00'))
+        self.assertEqual(pago.asignaciones.count(), 3)
+        for factura in monto_pagado_por_factura(Factura.objects.filter(usuario=vecino)):
+            self.assertEqual(factura.pagado_ledger, factura.monto_pagado)
+
+        resultado = anular_pago_registrado(pago)
+        self.assertEqual(resultado['facturas_reabiertas'], 3)
+        self.assertEqual(resultado['monto_revertido'], Decimal('2500.00'))
+
+        # Queda como antes del segundo pago: la primera cuota con el abono de 500
+        primera, segunda, _ = [Factura.objects.get(pk=f.pk) for f in facturas]
+        self.assertEqual(primera.estado, 'PENDIENTE')
+        self.assertEqual(primera.monto_pagado, Decimal('500.00'))
+        self.assertEqual(primera.saldo_pendiente, Decimal('500.00'))
+        self.assertEqual(segunda.saldo_pendiente, Decimal('1000.00'))
+        vecino.refresh_from_db()
+        self.assertEqual(vecino.saldo_favor_mantenimiento, Decimal('0.00'))
+
+        with self.assertRaises(ValueError):
+            anular_pago_registrado(pago)
+
+    def test_anular_reabre_tambien_lo_que_pago_su_credito(self):
+        residencial, duenos = crear_residencial(aptos=1)
+        vecino = duenos[0]
+        factura = self.crear_cuotas(vecino, 1)[0]
+        procesar_pago_fifo(vecino, Decimal('1500.00'), 'MANTENIMIENTO')
+        generar_cuotas_mensuales(residencial, timezone.now().date())
+
+        # El sobrante de 500 pagó media cuota nueva y quedó como asignación del mismo pago
+        pago = Pago.objects.get()
+        cuota = Factura.objects.exclude(pk=factura.pk).get()
+        self.assertEqual(pago.credito_disponible, Decimal('0.00'))
+        self.assertEqual(pago.asignaciones.get(factura=cuota).monto, Decimal('500.00'))
+        for f in monto_pagado_por_factura(Factura.objects.filter(usuario=vecino)):
+            self.assertEqual(f.pagado_ledger, f.monto_pagado)
+
+        resultado = anular_pago_registrado(pago)
+        self.assertEqual(resultado['facturas_reabiertas'], 2)
+        self.assertEqual(resultado['monto_revertido'], Decimal('1500.00'))
+        self.assertEqual(resultado['credito_revertido'], Decimal('0.00'))
+        factura.refresh_from_db()
+        cuota.refresh_from_db()
+        self.assertEqual(factura.saldo_pendiente, Decimal('1000.00'))
+        self.assertEqual(cuota.monto_pagado, Decimal('0.00'))
+        self.assertEqual(cuota.saldo_pendiente, Decimal('1000.00'))
+        vecino.refresh_from_db()
+        self.assertEqual(vecino.saldo_favor_mantenimiento, Decimal('0.00'))
+
+    def test_saldo_sin_pago_registrado_queda_en_el_ledger(self):
+        hoy = timezone.now().date()
+        residencial, duenos = crear_residencial(aptos=2)
+        Usuario.objects.filter(pk=duenos[0].pk).update(saldo_favor_mantenimiento=Decimal('1200.00'))
+        procesar_pago_fifo(duenos[1], Decimal('300.00'), 'MANTENIMIENTO')
+        generar_cuotas_mensuales(residencial, hoy)
+
+        previo = Pago.objects.get(usuario=duenos[0])
+        self.assertEqual(previo.origen, 'SALDO_PREVIO')
+        self.assertEqual(previo.monto, Decimal('1000.00'))
+        self.assertEqual(Pago.objects.get(usuario=duenos[1]).credito_disponible, Decimal('0.00'))
+        for factura in monto_pagado_por_factura(Factura.objects.filter(residencial=residencial)):
+            self.assertEqual(factura.pagado_ledger, factura.monto_pagado)
+
+    def test_saldo_de_gas_aplicado_en_la_lectura_queda_en_el_ledger(self):
+        residencial, duenos = crear_residencial(aptos=1)
+        vecino = duenos[0]
+        procesar_pago_fifo(vecino, Decimal('5000.00'), 'GAS')
+        admin = Usuario.objects.create(username="admin_gas", residencial=residencial, rol='ADMIN_RESIDENCIAL')
+        self.client.force_login(admin)
+
+        self.client.post('/facturacion/gas/', {
+            'apartamento': vecino.apartamento_id, 'lectura_anterior': '10.000', 'lectura_actual': '12.000',
+            'precio_galon_mes': '200.00', 'fecha_lectura': timezone.now().date().isoformat()
+        })
+
+        factura = monto_pagado_por_factura(Factura.objects.filter(usuario=vecino, tipo='GAS')).get()
+        self.assertEqual(factura.estado, 'PAGADO')
+        self.assertEqual(factura.pagado_ledger, factura.monto_pagado)
+        pago = Pago.objects.get()
+        vecino.refresh_from_db()
+        self.assertEqual(pago.credito_disponible, vecino.saldo_favor_gas)
+
+
+class ResumenDeudaTests(TestCase):
+
+    def assertResumenCuadra(self, usuario):
+        """El resumen incremental debe ser igual a recalcularlo desde cero."""
+        resumen = ResumenDeuda.objects.get(usuario=usuario)
+        recalcular_resumen_deuda(usuario_ids=[usuario.id])
+        desde_cero = ResumenDeuda.objects.get(usuario=usuario)
+        for campo in ('deuda_mantenimiento', 'deuda_gas', 'deuda_vencida', 'facturas_pendientes', 'vencimiento_mas_antiguo'):
+            self.assertEqual(getattr(resumen, campo), getattr(desde_cero, campo), campo)
+        return resumen
+
+    def test_se_mantiene_al_facturar_pagar_recargar_y_anular(self):
+        hoy = timezone.now().date()
+        residencial, duenos = crear_residencial(aptos=2, dia_corte=hoy.day, porcentaje_mora=Decimal('10.00'))
+        vecino = duenos[0]
+
+        # Factura suelta (señal) y cuotas del robot (servicio masivo)
+        Factura.objects.create(
+            residencial=residencial, usuario=vecino, tipo='GAS', concepto="Gas",
+            monto=Decimal('300.00'), saldo_pendiente=Decimal('300.00'), fecha_vencimiento=hoy - timedelta(days=10)
+        )
+        generar_cuotas_mensuales(residencial, hoy)
+        resumen = self.assertResumenCuadra(vecino)
+        self.assertEqual(resumen.deuda_mantenimiento, Decimal('1000.00'))
+        self.assertEqual(resumen.deuda_gas, Decimal('300.00'))
+        self.assertEqual(resumen.deuda_vencida, Decimal('300.00'))
+        self.assertEqual(resumen.facturas_pendientes, 2)
+        self.assertEqual(resumen.vencimiento_mas_antiguo, hoy - timedelta(days=10))
+
+        # Mora sobre la cuota vencida
+        Factura.objects.filter(usuario=vecino, tipo='CUOTA').update(fecha_proxima_mora=hoy)
+        aplicar_moras(residencial, hoy)
+        self.assertEqual(self.assertResumenCuadra(vecino).deuda_mantenimiento, Decimal('1100.00'))
+
+        # Pago y su anulación
+        procesar_pago_fifo(vecino, Decimal('1100.00'), 'MANTENIMIENTO')
+        self.assertEqual(self.assertResumenCuadra(vecino).deuda_mantenimiento, Decimal('0.00'))
+        anular_pago_registrado(Pago.objects.get())
+        self.assertEqual(self.assertResumenCuadra(vecino).deuda_mantenimiento, Decimal('1100.00'))
+
+        # Los demás vecinos también tienen su fila (sin deuda de gas)
+        self.assertEqual(ResumenDeuda.objects.get(usuario=duenos[1]).deuda_gas, Decimal('0.00'))
+
+    def test_refrescar_vencimientos_mueve_la_deuda_a_vencida(self):
+        hoy = timezone.now().date()
+        residencial, duenos = crear_residencial(aptos=1)
+        Factura.objects.create(
+            residencial=residencial, usuario=duenos[0], tipo='CUOTA', concepto="Mes",
+            monto=Decimal('1000.00'), saldo_pendiente=Decimal('1000.00'), fecha_vencimiento=hoy
+        )
+        self.assertEqual(ResumenDeuda.objects.get(usuario=duenos[0]).deuda_vencida, Decimal('0.00'))
+
+        self.assertEqual(refrescar_vencimientos(hoy + timedelta(days=1)), 1)
+        resumen = ResumenDeuda.objects.get(usuario=duenos[0])
+        self.assertEqual(resumen.deuda_vencida, Decimal('1000.00'))
+        self.assertIsNone(resumen.proximo_vencimiento)
+
+    def test_borrar_un_vecino_con_facturas(self):
+        residencial, duenos = crear_residencial(aptos=1)
+        Factura.objects.create(
+            residencial=residencial, usuario=duenos[0], tipo='CUOTA', concepto="Mes",
+            monto=Decimal('1000.00'), saldo_pendiente=Decimal('1000.00'), fecha_vencimiento=timezone.now().date()
+        )
+        duenos[0].delete()
+        self.assertFalse(ResumenDeuda.objects.exists())
+
+    def test_reconstruir_resumen_deuda(self):
+        residencial, duenos = crear_residencial(aptos=3)
+        Factura.objects.bulk_create([
+            Factura(
+                residencial=residencial, usuario=d, tipo='CUOTA', concepto="Mes", monto=Decimal('1000.00'),
+                saldo_pendiente=Decimal('1000.00'), fecha_vencimiento=timezone.now().date()
+            )
+            for d in duenos
+        ])
+        self.assertFalse(ResumenDeuda.objects.exists())
+
+        call_command('reconstruir_resumen_deuda', stdout=StringIO())
+        self.assertEqual(ResumenDeuda.objects.filter(deuda_mantenimiento=Decimal('1000.00')).count(), 3)
+
+
+class ApiNotificarPagoTests(TestCase):
+
+    def setUp(self):
+        self.residencial, self.duenos = crear_residencial(aptos=2, token_pasarela='secreto-123')
+        self.factura = Factura.objects.create(
+            residencial=self.residencial, usuario=self.duenos[0], tipo='CUOTA', concepto="Mes",
+            monto=Decimal('1000.00'), saldo_pendiente=Decimal('1000.00'), fecha_vencimiento=timezone.now().date()
+        )
+
+    def notificar(self, token='secreto-123', **datos):
+        return self.client.post(
+            '/api/pagos/notificar/', data=json.dumps(datos), content_type='application/json',
+            HTTP_AUTHORIZATION=f'Bearer {token}'
+        )
+
+    def test_encola_sin_aplicar_y_los_reenvios_no_cobran_doble(self):
+        respuesta = self.notificar(clave='tx-1', apartamento='a-1', monto='1200.00')
+        self.assertEqual(respuesta.status_code, 202)
+        self.assertEqual(respuesta.json()['estado'], 'PENDIENTE')
+        self.factura.refresh_from_db()
+        self.assertEqual(self.factura.estado, 'PENDIENTE')
+
+        repetida = self.notificar(clave='tx-1', apartamento='a-1', monto='1200.00')
+        self.assertEqual(repetida.status_code, 200)
+        self.assertTrue(repetida.json()['duplicada'])
+        self.assertEqual(NotificacionPago.objects.count(), 1)
+
+        call_command('procesar_notificaciones_pago', stdout=StringIO())
+        self.notificar(clave='tx-1', apartamento='a-1', monto='1200.00')
+        call_command('procesar_notificaciones_pago', stdout=StringIO())
+
+        self.factura.refresh_from_db()
+        self.assertEqual(self.factura.estado, 'PAGADO')
+        self.duenos[0].refresh_from_db()
+        self.assertEqual(self.duenos[0].saldo_favor_mantenimiento, Decimal('200.00'))
+        notificacion = NotificacionPago.objects.get()
+        self.assertEqual(notificacion.estado, 'APLICADO')
+        self.assertEqual(notificacion.pago, Pago.objects.get())
+
+    def test_rechaza_token_y_datos_invalidos(self):
+        self.assertEqual(self.notificar(token='otro', clave='x', apartamento='A-1', monto='10').status_code, 401)
+        self.assertEqual(self.notificar(clave='x', apartamento='A-1', monto='-5').status_code, 400)
+        self.assertEqual(self.notificar(apartamento='A-1', monto='10').status_code, 400)
+        self.assertFalse(NotificacionPago.objects.exists())
+
+    def test_mensajes_de_monto_invalido(self):
+        casos = {
+            '0': "El monto debe ser mayor que cero.",
+            '100000000': "El monto excede el máximo permitido.",
+            '99999999.99': None,
+            'nan': "El monto no es un número válido.",
+            'Infinity': "El monto no es un número válido.",
+        }
+        for i, (monto, error) in enumerate(casos.items()):
+            respuesta = self.notificar(clave=f'm-{i}', apartamento='A-1', monto=monto)
+            if error is None:
+                self.assertEqual(respuesta.status_code, 202, monto)
+            else:
+                self.assertEqual((respuesta.status_code, respuesta.json()['error']), (400, error), monto)
+        self.assertEqual(NotificacionPago.objects.get().monto, Decimal('99999999.99'))
+
+    def test_worker_aplica_en_lote_y_rechaza_apartamentos_sin_dueno(self):
+        for i in range(30):
+            self.notificar(clave=f'tx-{i}', apartamento='A-2', monto='10.00', tipo_pago='gas')
+        self.notificar(clave='tx-x', apartamento='Z-9', monto='10.00')
+
+        with CaptureQueriesContext(connection) as consultas:
+            procesar_notificaciones(limite=100)
+        self.assertLessEqual(len(consultas), 12)
+
+        self.assertEqual(NotificacionPago.objects.filter(estado='APLICADO').count(), 30)
+        self.assertEqual(NotificacionPago.objects.get(clave_idempotencia='tx-x').estado, 'RECHAZADO')
+        self.duenos[1].refresh_from_db()
+        self.assertEqual(self.duenos[1].saldo_favor_gas, Decimal('300.00'))
+
+
+class CierreMensualTests(TestCase):
+
+    def setUp(self):
+        self.residencial, self.duenos = crear_residencial(aptos=1, saldo_inicial=Decimal('1000.00'))
+        self.hoy = timezone.now().date()
+        self.mes_pasado = (self.hoy.replace(day=1) - timedelta(days=1)).replace(day=15)
+        self.hace_dos_meses = (self.mes_pasado.replace(day=1) - timedelta(days=1)).replace(day=15)
+
+    def gasto(self, monto, fecha):
+        return Gasto.objects.create(residencial=self.residencial, descripcion="Luz", monto=Decimal(monto), fecha_gasto=fecha)
+
+    def pagada(self, monto, fecha):
+        return Factura.objects.create(
+            residencial=self.residencial, usuario=self.duenos[0], tipo='CUOTA', concepto="Mes", monto=Decimal(monto),
+            estado='PAGADO', saldo_pendiente=0, fecha_pago=fecha, fecha_vencimiento=fecha
+        )
+
+    def test_saldo_historico_sale_del_cierre_y_cuadra_con_la_historia(self):
+        self.pagada('500.00', self.hace_dos_meses)
+        self.gasto('200.00', self.mes_pasado)
+        self.pagada('300.00', self.hoy)
+
+        call_command('cierre_mensual', stdout=StringIO())
+        cierre = CierreMensual.objects.get(mes=self.mes_pasado.replace(day=1))
+        self.assertEqual(cierre.saldo_apertura, Decimal('1500.00'))
+        self.assertEqual(cierre.saldo_cierre, Decimal('1300.00'))
+        self.assertEqual(cierre.gastos_por_categoria, {'IMPREVISTOS': '200.00'})
+        self.assertEqual(cerrar_meses(self.residencial), 0)
+
+        fin_mes_pasado = self.hoy.replace(day=1) - timedelta(days=1)
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(saldo_banco_al(self.residencial, fin_mes_pasado), Decimal('1300.00'))
+        self.assertEqual(len(consultas), 1)
+        self.assertEqual(saldo_banco_al(self.residencial, self.hoy), Decimal('1600.00'))
+
+    def test_movimiento_atrasado_invalida_y_se_reconstruye(self):
+        self.pagada('500.00', self.hace_dos_meses)
+        cerrar_meses(self.residencial)
+        self.assertEqual(CierreMensual.objects.count(), 2)
+
+        # Un gasto con fecha del mes pasado borra ese cierre, no el anterior
+        gasto = self.gasto('100.00', self.mes_pasado)
+        self.assertEqual(CierreMensual.objects.count(), 1)
+        self.assertEqual(saldo_banco_al(self.residencial, self.hoy), Decimal('1400.00'))
+        cerrar_meses(self.residencial)
+        self.assertEqual(CierreMensual.objects.order_by('-mes').first().saldo_cierre, Decimal('1400.00'))
+
+        gasto.delete()
+        self.assertEqual(saldo_banco_al(self.residencial, self.hoy), Decimal('1500.00'))
+
+        # Cuadrar el banco corre todos los cierres sin reconstruirlos
+        cerrar_meses(self.residencial)
+        self.residencial.saldo_inicial = Decimal('1100.00')
+        self.residencial.save()
+        self.assertEqual(CierreMensual.objects.order_by('-mes').first().saldo_cierre, Decimal('1600.00'))
+
+
+class LibroBancoTests(TestCase):
+
+    def test_saldo_corrido_y_paginas_en_una_consulta(self):
+        residencial, duenos = crear_residencial(aptos=1, saldo_inicial=Decimal('100.00'))
+        hoy = timezone.now().date()
+        inicio = hoy.replace(day=1)
+        for i in range(5):
+            Factura.objects.create(
+                residencial=residencial, usuario=duenos[0], tipo='CUOTA', concepto=f"Mes {i}", monto=Decimal('50.00'),
+                estado='PAGADO', saldo_pendiente=0, fecha_pago=inicio, fecha_vencimiento=inicio
+            )
+        Gasto.objects.create(residencial=residencial, descripcion="Luz", monto=Decimal('30.00'), fecha_gasto=inicio)
+        IngresoExtraordinario.objects.create(Apartamento=duenos[0].apartamento, concepto_detalle="Control", monto=Decimal('10.50'))
+
+        with CaptureQueriesContext(connection) as consultas:
+            primera = libro_banco(residencial, inicio, hoy, Decimal('100.00'), pagina=1, por_pagina=4)
+        self.assertEqual(len(consultas), 1)
+        self.assertEqual(primera['total'], 7)
+        self.assertEqual(primera['paginas'], 2)
+        self.assertEqual(primera['saldo_final'], Decimal('330.50'))
+        self.assertEqual([m['saldo'] for m in primera['movimientos']], [Decimal(v) for v in ('150', '200', '250', '300')])
+
+        segunda = libro_banco(residencial, inicio, hoy, Decimal('100.00'), pagina=2, por_pagina=4)
+        self.assertEqual(segunda['saldo_arrastre'], Decimal('300.00'))
+        fechas = [m['fecha'] for m in primera['movimientos'] + segunda['movimientos']]
+        self.assertEqual(fechas, sorted(fechas))
+        self.assertEqual(segunda['movimientos'][-1]['saldo'], segunda['saldo_final'])
+        extra = next(m for m in segunda['movimientos'] if m['concepto'].startswith('💰'))
+        self.assertEqual(extra['usuario'], duenos[0].username)
+
+
+class ResumenAnualTests(TestCase):
+
+    def test_series_del_anio_con_una_consulta_por_tabla(self):
+        residencial, duenos = crear_residencial(aptos=1, saldo_inicial=Decimal('100.00'))
+        anio = timezone.now().year - 1
+        for mes, tipo, monto in ((3, 'CUOTA', '1000.00'), (3, 'GAS', '250.00'), (11, 'CUOTA', '1000.00')):
+            fecha = timezone.datetime(anio, mes, 10).date()
+            Factura.objects.create(
+                residencial=residencial, usuario=duenos[0], tipo=tipo, concepto="Mes", monto=Decimal(monto),
+                estado='PAGADO', saldo_pendiente=0, fecha_pago=fecha, fecha_vencimiento=fecha
+            )
+        Gasto.objects.create(
+            residencial=residencial, descripcion="Luz", monto=Decimal('400.00'),
+            fecha_gasto=timezone.datetime(anio, 1, 5).date(), categoria='SERV_ELECTRICIDAD'
+        )
+        Gasto.objects.create(
+            residencial=residencial, descripcion="Viejo", monto=Decimal('50.00'),
+            fecha_gasto=timezone.datetime(anio - 1, 6, 1).date()
+        )
+
+        with CaptureQueriesContext(connection) as consultas:
+            resumen = resumen_anual(residencial, anio, con_saldo_apertura=False)
+        self.assertEqual(len(consultas), 3)
+
+        self.assertEqual(resumen.ingresos_por_mes[2], Decimal('1250.00'))
+        self.assertEqual(resumen.ingresos_por_mes[10], Decimal('1000.00'))
+        self.assertEqual(resumen.gastos_por_mes[0], Decimal('400.00'))
+        self.assertEqual(resumen.ingresos_por_tipo, {'CUOTA': Decimal('2000.00'), 'GAS': Decimal('250.00')})
+        self.assertEqual(resumen.gastos_por_categoria, {'SERV_ELECTRICIDAD': Decimal('400.00')})
+        self.assertEqual(resumen.balance, Decimal('1850.00'))
+
+        self.assertEqual(resumen_anual(residencial, anio).saldo_apertura, Decimal('50.00'))
+
+
+class ExportarReportesTests(TestCase):
+
+    def setUp(self):
+        self.residencial, self.duenos = crear_residencial(aptos=2)
+        self.admin = Usuario.objects.create(username="admin_export", residencial=self.residencial, rol='ADMIN_RESIDENCIAL')
+        self.client.force_login(self.admin)
+        vencida = timezone.now().date() - timedelta(days=45)
+        for dueno in self.duenos:
+            Factura.objects.create(
+                residencial=self.residencial, usuario=dueno, tipo='CUOTA', concepto="Mes, atrasado", monto=Decimal('1000.00'),
+                saldo_pendiente=Decimal('1000.00'), fecha_vencimiento=vencida
+            )
+
+    def test_csv_en_streaming(self):
+        tomar_foto_morosidad(self.residencial)
+        respuesta = self.client.get('/reportes/morosidad/?exportar=csv')
+        self.assertTrue(respuesta.streaming)
+        self.assertIn('attachment; filename="morosidad_', respuesta['Content-Disposition'])
+
+        lineas = b''.join(respuesta.streaming_content).decode('utf-8').lstrip('\ufeff').splitlines()
+        self.assertEqual(lineas[0], 'Apto,Residente,Al Día,1-30 días,31-60 días,61-90 días,+90 días,Total')
+        self.assertEqual(len(lineas), 3)
+        self.assertIn(',0.00,0.00,1000.00,0.00,0.00,1000.00', lineas[1])
+
+        cuentas = b''.join(self.client.get('/finanzas/cobros/?exportar=csv').streaming_content).decode('utf-8')
+        self.assertIn('"Mes, atrasado"', cuentas)
+
+        libro = b''.join(self.client.get('/finanzas/reporte/?exportar=csv').streaming_content).decode('utf-8')
+        self.assertTrue(libro.startswith('\ufeffFecha,Tipo,Concepto,Residente,Monto,Balance'))
+
+    def test_xlsx_es_un_libro_valido(self):
+        respuesta = self.client.get(f'/reportes/estado-cuenta/?usuario_id={self.duenos[0].id}&exportar=xlsx')
+        libro = zipfile.ZipFile(BytesIO(b''.join(respuesta.streaming_content)))
+        self.assertIsNone(libro.testzip())
+        hoja = libro.read('xl/worksheets/sheet1.xml').decode('utf-8')
+        self.assertEqual(hoja.count('<row>'), 2)
+        self.assertIn('Mes, atrasado', hoja)
+
+
+    def test_morosidad_exporta_la_misma_foto_que_la_pantalla(self):
+        tomar_foto_morosidad(self.residencial)
+        # Un pago después de la foto no cambia lo que se ve hasta "Actualizar"
+        procesar_pago_fifo(self.duenos[0], Decimal('1000.00'), 'MANTENIMIENTO')
+
+        pantalla = self.client.get('/reportes/morosidad/').context['datos_morosidad']
+        lineas = b''.join(self.client.get('/reportes/morosidad/?exportar=csv').streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(len(lineas) - 1, len(pantalla))
+        self.assertEqual([linea.split(',')[1] for linea in lineas[1:]], [fila.usuario.username for fila in pantalla])
+
+    def test_libro_banco_columnas_coinciden_con_los_datos(self):
+        hoy = timezone.now().date()
+        Factura.objects.filter(usuario=self.duenos[0]).update(estado='PAGADO', saldo_pendiente=0, fecha_pago=hoy)
+        Gasto.objects.create(residencial=self.residencial, descripcion="Luz", monto=Decimal('30.00'), fecha_gasto=hoy)
+
+        respuesta = self.client.get('/finanzas/reporte/?exportar=csv')
+        lineas = [
+            linea.split(',') for linea in
+            b''.join(respuesta.streaming_content).decode('utf-8').lstrip('\ufeff').replace('"Mes, atrasado"', 'Mes atrasado').splitlines()
+        ]
+        encabezados = lineas[0]
+        self.assertEqual(encabezados, ['Fecha', 'Tipo', 'Concepto', 'Residente', 'Monto', 'Balance'])
+        self.assertTrue(all(len(linea) == len(encabezados) for linea in lineas[1:]))
+        filas = [dict(zip(encabezados, linea)) for linea in lineas[1:]]
+        ingreso = next(f for f in filas if f['Tipo'] == 'INGRESO')
+        self.assertEqual(ingreso['Residente'], self.duenos[0].username)
+        self.assertEqual(ingreso['Concepto'], 'Mes atrasado')
+        self.assertEqual(ingreso['Monto'], '1000.00')
+
+@override_settings(PDF_CACHE_DIR=tempfile.mkdtemp(prefix='cache_pdf_'))
+class PdfTests(TestCase):
+
+    def setUp(self):
+        self.residencial, self.duenos = crear_residencial(aptos=2)
+        hoy = timezone.now().date()
+        self.facturas = [
+            Factura.objects.create(
+                residencial=self.residencial, usuario=dueno, tipo='CUOTA', concepto="Mes", monto=Decimal('1000.00'),
+                estado='PAGADO', saldo_pendiente=0, fecha_pago=hoy, fecha_vencimiento=hoy
+            ) for dueno in self.duenos
+        ]
+
+    @skipUnless(HAY_WEASYPRINT, "WeasyPrint no está instalado")
+    def test_recibo_en_cache_por_version_y_lote_en_zip(self):
+        ruta = pdf_recibo(self.facturas[0])
+        self.assertTrue(ruta.read_bytes().startswith(b'%PDF'))
+        self.assertEqual(pdf_recibo(self.facturas[0]), ruta)
+
+        self.facturas[0].concepto = "Mes corregido"
+        self.facturas[0].save()
+        nueva = pdf_recibo(self.facturas[0])
+        self.assertNotEqual(nueva, ruta)
+        self.assertFalse(ruta.exists())
+
+        hoy = timezone.now().date()
+        resultado = lote_pdf(self.residencial, 'recibos', hoy.year, hoy.month, procesos=1)
+        self.assertEqual(resultado['documentos'], 2)
+        self.assertEqual(len(zipfile.ZipFile(resultado['zip']).namelist()), 2)
+
+    def test_cache_invalidacion_y_lote_con_weasyprint_simulado(self):
+        # WeasyPrint falso: la caché, su invalidación y el lote se prueban aunque no esté instalado
+        generados = []
+
+        class HTML:
+            def __init__(self, string, url_fetcher=None):
+                self.html = string
+
+            def write_pdf(self):
+                generados.append(self.html)
+                return b'%PDF-1.7 ' + str(len(generados)).encode()
+
+        weasyprint = types.ModuleType('weasyprint')
+        weasyprint.HTML = HTML
+        weasyprint.default_url_fetcher = lambda url: {'string': b''}
+
+        hoy = timezone.now().date()
+        with mock.patch.dict(sys.modules, {'weasyprint': weasyprint}), self.settings(PDF_CACHE_DIR=tempfile.mkdtemp()):
+            ruta = pdf_recibo(self.facturas[0])
+            self.assertEqual(ruta.read_bytes(), b'%PDF-1.7 1')
+            self.assertEqual(pdf_recibo(self.facturas[0]), ruta)
+            self.assertEqual(len(generados), 1)
+
+            # Otro dato en la factura es otro HTML: nueva versión y la vieja se borra
+            self.facturas[0].concepto = "Mes corregido"
+            self.facturas[0].save()
+            nueva = pdf_recibo(self.facturas[0])
+            self.assertNotEqual(nueva, ruta)
+            self.assertFalse(ruta.exists())
+            self.assertIn("Mes corregido", generados[-1])
+
+            # El lote solo genera lo que no está en la caché y mete todo en el zip
+            resultado = lote_pdf(self.residencial, 'recibos', hoy.year, hoy.month, procesos=1)
+            self.assertEqual(len(generados), 3)
+            self.assertEqual(resultado['documentos'], 2)
+            with zipfile.ZipFile(resultado['zip']) as lote:
+                self.assertEqual(sorted(lote.namelist()), sorted(
+                    f'{f.usuario.apartamento.numero}_recibo_{f.id:06d}.pdf' for f in self.facturas
+                ))
+                self.assertEqual(lote.read(f'A-1_recibo_{self.facturas[0].id:06d}.pdf'), nueva.read_bytes())
+            lote_pdf(self.residencial, 'recibos', hoy.year, hoy.month, procesos=1)
+            self.assertEqual(len(generados), 3)
+
+    @skipIf(HAY_WEASYPRINT, "WeasyPrint está instalado")
+    def test_sin_weasyprint_el_recibo_avisa_y_vuelve_a_la_pagina(self):
+        self.client.force_login(self.duenos[0])
+        respuesta = self.client.get(f'/finanzas/recibo/{self.facturas[0].id}/?exportar=pdf')
+        self.assertRedirects(respuesta, f'/finanzas/recibo/{self.facturas[0].id}/')
+
+
+class CacheReportesTests(TestCase):
+
+    def setUp(self):
+        caches['reportes'].clear()
+        self.residencial, self.duenos = crear_residencial(aptos=2)
+        self.admin = Usuario.objects.create(username="admin_cache", residencial=self.residencial, rol='ADMIN_RESIDENCIAL')
+        self.client.force_login(self.admin)
+        self.residencial.refresh_from_db()
+
+    def deuda_total(self):
+        return self.client.get('/balance-general/').context['total_deuda']
+
+    def test_segunda_visita_sale_de_la_cache_y_un_cambio_la_invalida(self):
+        version = self.residencial.version_datos
+        self.assertEqual(self.deuda_total(), 0)
+        self.assertEqual(self.deuda_total(), 0)
+        fila = next(e for e in estadisticas_cache() if e['reporte'] == 'balance')
+        self.assertEqual((fila['aciertos'], fila['fallos']), (1, 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Factura.objects.create(
+                residencial=self.residencial, usuario=self.duenos[0], tipo='CUOTA', concepto="Mes", monto=Decimal('1000.00'),
+                saldo_pendiente=Decimal('1000.00'), fecha_vencimiento=timezone.now().date()
+            )
+        self.residencial.refresh_from_db()
+        self.assertNotEqual(self.residencial.version_datos, version)
+        self.assertEqual(self.deuda_total(), Decimal('1000.00'))
+
+        reiniciar_contadores()
+        self.assertEqual(sum(e['fallos'] for e in estadisticas_cache()), 0)
+
+    def test_el_login_no_invalida_los_reportes(self):
+        version = self.residencial.version_datos
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_login(self.duenos[0])
+        self.residencial.refresh_from_db()
+        self.assertEqual(self.residencial.version_datos, version)
+
+    def test_guardar_una_instancia_vieja_no_revive_la_version(self):
+        vieja = Residencial.objects.get(pk=self.residencial.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            Gasto.objects.create(residencial=self.residencial, descripcion="Luz", monto=Decimal('10.00'), fecha_gasto=timezone.now().date())
+        nueva = Residencial.objects.values_list('version_datos', flat=True).get(pk=self.residencial.pk)
+        self.assertNotEqual(nueva, vieja.version_datos)
+
+        # Ej: la pantalla de configuración guarda el residencial que leyó antes del gasto
+        with self.captureOnCommitCallbacks(execute=True):
+            vieja.dias_gracia = 10
+            vieja.save()
+        self.residencial.refresh_from_db()
+        self.assertEqual(self.residencial.dias_gracia, 10)
+        self.assertNotIn(self.residencial.version_datos, (vieja.version_datos, nueva))
+
+    def test_cambiar_un_apartamento_invalida_los_reportes(self):
+        version = self.residencial.version_datos
+        apartamento = self.duenos[0].apartamento
+        with self.captureOnCommitCallbacks(execute=True):
+            apartamento.monto_cuota = Decimal('1500.00')
+            apartamento.save()
+        self.residencial.refresh_from_db()
+        self.assertNotEqual(self.residencial.version_datos, version)
+
+        version = self.residencial.version_datos
+        with self.captureOnCommitCallbacks(execute=True):
+            Apartamento.objects.create(residencial=self.residencial, numero="B-1", monto_cuota=Decimal('900.00'))
+        self.residencial.refresh_from_db()
+        self.assertNotEqual(self.residencial.version_datos, version)
+
+    def test_cambiar_el_saldo_inicial_invalida_los_reportes(self):
+        version = self.residencial.version_datos
+        with self.captureOnCommitCallbacks(execute=True):
+            residencial = Residencial.objects.get(pk=self.residencial.pk)
+            residencial.saldo_inicial = Decimal('500.00')
+            residencial.save(update_fields=['saldo_inicial'])
+        self.residencial.refresh_from_db()
+        self.assertNotEqual(self.residencial.version_datos, version)
+
+
+class MorosidadHistorialTests(TestCase):
+
+    def setUp(self):
+        self.residencial, self.duenos = crear_residencial(aptos=2)
+        self.hoy = timezone.now().date()
+        for dias, monto in ((10, '100.00'), (45, '200.00'), (120, '300.00')):
+            Factura.objects.create(
+                residencial=self.residencial, usuario=self.duenos[0], tipo='CUOTA', concepto="Mes", monto=Decimal(monto),
+                saldo_pendiente=Decimal(monto), fecha_vencimiento=self.hoy - timedelta(days=dias)
+            )
+
+    def test_foto_por_tramos_y_poda_de_meses_viejos(self):
+        foto = tomar_foto_morosidad(self.residencial, self.hoy)
+        self.assertEqual(
+            (foto.dias_30, foto.dias_60, foto.mas_90, foto.total, foto.vecinos_con_deuda),
+            (Decimal('100.00'), Decimal('200.00'), Decimal('300.00'), Decimal('600.00'), 1)
+        )
+
+        # Dos fotos del mes pasado: solo queda la última
+        mes_pasado = self.hoy.replace(day=1) - timedelta(days=1)
+        tomar_foto_morosidad(self.residencial, mes_pasado - timedelta(days=5))
+        tomar_foto_morosidad(self.residencial, mes_pasado)
+        tomar_foto_morosidad(self.residencial, self.hoy)
+        fechas = set(MorosidadVecino.objects.values_list('fecha', flat=True))
+        self.assertEqual(fechas, {mes_pasado, self.hoy})
+        self.assertEqual(MorosidadResidencial.objects.count(), 3)
+
+        tendencia = tendencia_morosidad(self.residencial, self.hoy)
+        self.assertEqual(len(json.loads(tendencia['etiquetas'])), 24)
+        self.assertEqual(json.loads(tendencia['series']['total'])[-1], 600.0)
+        vecino = tendencia_morosidad(self.residencial, self.hoy, usuario=self.duenos[1])
+        self.assertEqual(set(json.loads(vecino['series']['total'])), {0.0})
+
+    def test_la_pagina_lee_la_foto_sin_sumar_facturas(self):
+        admin = Usuario.objects.create(username="admin_moro", residencial=self.residencial, rol='ADMIN_RESIDENCIAL')
+        self.client.force_login(admin)
+        tomar_foto_morosidad(self.residencial, self.hoy)
+
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(f'/reportes/morosidad/?vecino={self.duenos[0].id}')
+        self.assertEqual(respuesta.context['totales_globales'].total, Decimal('600.00'))
+        tabla_facturas = Factura._meta.db_table
+        self.assertFalse([q for q in consultas.captured_queries if tabla_facturas in q['sql']])
+
+        # Un vecino que no es un número, o de otro residencial, es un 404 y no un error
+        self.assertEqual(self.client.get('/reportes/morosidad/?vecino=abc').status_code, 404)
+        _, ajenos = crear_residencial(aptos=1)
+        self.assertEqual(self.client.get(f'/reportes/morosidad/?vecino={ajenos[0].id}').status_code, 404)
+
+
+    def test_la_pagina_no_toma_la_foto_y_avisa_si_es_vieja(self):
+        admin = Usuario.objects.create(username="admin_moro", residencial=self.residencial, rol='ADMIN_RESIDENCIAL')
+        self.client.force_login(admin)
+
+        respuesta = self.client.get('/reportes/morosidad/')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIsNone(respuesta.context['foto'])
+        self.assertTrue(respuesta.context['foto_desactualizada'])
+        self.assertFalse(MorosidadResidencial.objects.exists())
+
+        # Sin la foto de hoy se muestra la de ayer, marcada como desactualizada
+        ayer = self.hoy - timedelta(days=1)
+        tomar_foto_morosidad(self.residencial, ayer)
+        respuesta = self.client.get('/reportes/morosidad/')
+        self.assertEqual(respuesta.context['foto'].fecha, ayer)
+        self.assertTrue(respuesta.context['foto_desactualizada'])
+        self.assertEqual(len(respuesta.context['datos_morosidad']), 1)
+        self.assertEqual(MorosidadResidencial.objects.count(), 1)
+
+        self.client.post('/reportes/morosidad/')
+        respuesta = self.client.get('/reportes/morosidad/')
+        self.assertEqual(respuesta.context['foto'].fecha, self.hoy)
+        self.assertFalse(respuesta.context['foto_desactualizada'])
+
+class EstadoCuentaPaginadoTests(TestCase):
+
+    def setUp(self):
+        self.residencial, self.duenos = crear_residencial(aptos=2)
+        self.admin = Usuario.objects.create(username="admin_ec", residencial=self.residencial, rol='ADMIN_RESIDENCIAL')
+        self.client.force_login(self.admin)
+        inicio = date(2025, 1, 1)
+        # 5 facturas de 100 (la del segundo mes pagada) y dos el mismo día para probar el desempate por id
+        for dias in (0, 31, 59, 90, 90):
+            pagada = dias == 31
+            Factura.objects.create(
+                residencial=self.residencial, usuario=self.duenos[0], tipo='EXTRA', concepto=f"Cargo {dias}",
+                monto=Decimal('100.00'), saldo_pendiente=Decimal('0.00') if pagada else Decimal('100.00'),
+                estado='PAGADO' if pagada else 'PENDIENTE',
+                fecha_emision=inicio + timedelta(days=dias), fecha_vencimiento=inicio + timedelta(days=dias)
+            )
+
+    def test_paginas_por_cursor_con_saldo_acumulado(self):
+        vecino = self.duenos[0]
+        primera = estado_cuenta(vecino, por_pagina=2)
+        self.assertEqual([f.saldo_acumulado for f in primera['facturas']], [Decimal('400.00'), Decimal('300.00')])
+        self.assertEqual(primera['saldo_inicial'], Decimal('400.00'))
+
+        segunda = estado_cuenta(vecino, antes=cursor_estado_cuenta(primera['siguiente']), por_pagina=2)
+        self.assertEqual(segunda['saldo_inicial'], Decimal('200.00'))
+        self.assertEqual([f.saldo_acumulado for f in segunda['facturas']], [Decimal('200.00'), Decimal('100.00')])
+
+        tercera = estado_cuenta(vecino, antes=cursor_estado_cuenta(segunda['siguiente']), por_pagina=2)
+        self.assertEqual([f.concepto for f in tercera['facturas']], ["Cargo 0"])
+        self.assertIsNone(tercera['siguiente'])
+
+        vistas = [f.id for p in (primera, segunda, tercera) for f in p['facturas']]
+        self.assertEqual(len(set(vistas)), 5)
+
+    def test_vista_y_buscador(self):
+        respuesta = self.client.get(f'/reportes/estado-cuenta/?usuario_id={self.duenos[0].id}&antes=basura')
+        self.assertEqual(len(respuesta.context['facturas']), 5)
+
+        apto = self.duenos[1].apartamento.numero
+        encontrados = self.client.get('/reportes/estado-cuenta/buscar/', {'q': apto}).json()['vecinos']
+        self.assertIn(self.duenos[1].id, [v['id'] for v in encontrados])
+        self.assertEqual(self.client.get('/reportes/estado-cuenta/buscar/').json()['vecinos'], [])
+
+
+@skipUnless(connection.vendor == 'postgresql', "El plan de consultas se verifica sobre PostgreSQL")
+class PlanConsultasTests(TestCase):
+    """Las consultas frecuentes (rangos de fechas, sin __month) encuentran su índice."""
+
+    def setUp(self):
+        self.residencial, self.duenos = crear_residencial(aptos=20)
+        self.hoy = timezone.now().date()
+        area = AreaSocial.objects.create(residencial=self.residencial, nombre="Gazebo")
+        facturas, gastos, lecturas, reservas, visitas, bitacora = [], [], [], [], [], []
+        for dia in range(365):
+            fecha = self.hoy - timedelta(days=dia)
+            dueno = self.duenos[dia % 20]
+            pagada = dia % 3 == 0
+            facturas.append(Factura(
+                residencial=self.residencial, usuario=dueno, tipo='CUOTA' if dia % 2 else 'GAS', concepto="Cargo",
+                monto=Decimal('100.00'), saldo_pendiente=Decimal('0.00') if pagada else Decimal('100.00'),
+                estado='PAGADO' if pagada else 'PENDIENTE', fecha_pago=fecha if pagada else None,
+                fecha_emision=fecha, fecha_vencimiento=fecha + timedelta(days=10)
+            ))
+            gastos.append(Gasto(residencial=self.residencial, descripcion="Gasto", monto=Decimal('50.00'), fecha_gasto=fecha))
+            lecturas.append(LecturaGas(
+                residencial=self.residencial, apartamento=dueno.apartamento, fecha_lectura=fecha,
+                lectura_anterior=0, lectura_actual=1, precio_galon_mes=Decimal('200.00')
+            ))
+            reservas.append(Reserva(
+                residencial=self.residencial, usuario=dueno, area_social=area, fecha_solicitud=fecha,
+                estado=('PENDIENTE', 'APROBADA', 'RECHAZADA')[dia % 3]
+            ))
+            visitas.append(Visita(
+                residencial=self.residencial, apartamento=dueno.apartamento, residente=dueno,
+                nombre_visitante="Visita", fecha_esperada=fecha
+            ))
+            bitacora.append(Bitacora(residencial=self.residencial, modulo='FINANZAS', accion="Movimiento"))
+        for modelo, filas in ((Factura, facturas), (Gasto, gastos), (LecturaGas, lecturas),
+                              (Reserva, reservas), (Visita, visitas), (Bitacora, bitacora)):
+            modelo.objects.bulk_create(filas)
+
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+            # Con tan pocas filas un recorrido secuencial siempre gana: se descarta para ver qué índice elige
+            cursor.execute("SET LOCAL enable_seqscan = off")
+
+    def assertUsaIndice(self, consulta, indice):
+        plan = consulta.explain()
+        self.assertIn(indice, plan, plan)
+
+    def test_indices_de_las_consultas_frecuentes(self):
+        mes = rango_mes(self.hoy.year, self.hoy.month)
+        casos = [
+            (Factura.objects.filter(residencial=self.residencial, estado='PAGADO', fecha_pago__range=mes), 'factura_pagada_idx'),
+            (Factura.objects.filter(
+                usuario=self.duenos[0], tipo='CUOTA', estado='PENDIENTE', fecha_vencimiento__lt=self.hoy
+            ), 'factura_pendiente_fifo_idx'),
+            (Factura.objects.filter(
+                residencial=self.residencial, tipo='CUOTA', estado='PENDIENTE', fecha_vencimiento__lt=self.hoy
+            ), 'factura_pendiente_idx'),
+            (Factura.objects.filter(residencial=self.residencial, tipo='CUOTA', fecha_emision__range=mes), 'factura_emision_idx'),
+            (Gasto.objects.filter(residencial=self.residencial, fecha_gasto__range=mes), 'gasto_fecha_idx'),
+            (LecturaGas.objects.filter(residencial=self.residencial, fecha_lectura__range=mes), 'lectura_gas_fecha_idx'),
+            (Reserva.objects.filter(
+                residencial=self.residencial, estado='APROBADA', fecha_solicitud__gte=self.hoy
+            ), 'reserva_estado_fecha_idx'),
+            (Visita.objects.filter(residencial=self.residencial, fecha_esperada=self.hoy), 'visita_fecha_idx'),
+            (Bitacora.objects.filter(residencial=self.residencial).order_by('-fecha')[:200], 'bitacora_fecha_idx'),
+        ]
+        for consulta, indice in casos:
+            with self.subTest(indice=indice):
+                self.assertUsaIndice(consulta, indice)
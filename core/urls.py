@@ -62,6 +62,9 @@ urlpatterns = [
     path('aplicar-moras/', views.aplicar_moras, name='aplicar_moras'),
 
     path('registrar-abono/', views.registrar_abono, name='registrar_abono'),
+    path('registrar-abono/lote/', views.aplicar_pagos_lote, name='aplicar_pagos_lote'),
+    path('finanzas/banco/', views.conciliacion_bancaria, name='conciliacion_bancaria'),
+    path('api/pagos/notificar/', views.api_notificar_pago, name='api_notificar_pago'),
 
     path('reportar-pago/', views.reportar_pago, name='reportar_pago'),
 
@@ -82,6 +85,7 @@ urlpatterns = [
     path('reportes/mensual/', views.reporte_mensual_dinamico, name='reporte_mensual_dinamico'),
     
     path('reportes/estado-cuenta/', views.reporte_estado_cuenta, name='reporte_estado_cuenta'),
+    path('reportes/estado-cuenta/buscar/', views.buscar_vecinos_estado_cuenta, name='buscar_vecinos_estado_cuenta'),
 
     path('reportes/morosidad/', views.reporte_morosidad, name='reporte_morosidad'),
 
@@ -126,4 +130,6 @@ urlpatterns = [
     path('saas/facturacion/', views_saas.facturacion_b2b, name='facturacion_b2b'),
     path('saas/usuarios/', views_saas.directorio_global_usuarios, name='directorio_global_usuarios'),
     path('saas/usuarios/reset-clave/<int:usuario_id>/', views_saas.resetear_clave_superadmin, name='resetear_clave_superadmin'),
+    path('saas/robot/', views_saas.ejecuciones_robot, name='ejecuciones_robot'),
+    path('saas/cache-reportes/', views_saas.cache_reportes, name='cache_reportes'),
 ]
\ No newline at end of file
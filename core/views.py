@@ -3,9 +3,14 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth import update_session_auth_hash
 from django.contrib import messages 
 from django.core.exceptions import ValidationError
+import csv
+import io
 import json 
 from django.core.serializers.json import DjangoJSONEncoder
-from django.http import JsonResponse
+from django.http import JsonResponse, Http404
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from django.core.paginator import Paginator
 from django.utils import timezone   
 from datetime import datetime, timedelta 
 from decimal import Decimal
@@ -30,14 +35,26 @@ from .forms import (
     PagoNominaForm
 )
 
-from .models import Residencial, Reserva, Apartamento, Usuario, BloqueoFecha, Factura, LecturaGas, Gasto, Aviso, Incidencia, ReportePago, IngresoExtraordinario, Bitacora, ProductoMarketplace, CategoriaMarketplace, Empleado, PagoNomina
+from .models import Residencial, Reserva, Apartamento, Usuario, BloqueoFecha, Factura, LecturaGas, Gasto, Aviso, Incidencia, ReportePago, IngresoExtraordinario, Bitacora, ProductoMarketplace, CategoriaMarketplace, Empleado, PagoNomina, MovimientoBancario, Pago, MorosidadVecino
 from django.db import transaction
-from django.db.models import Sum, Max, Count, Q, F, Case, When, Value
+from django.db.models import Sum, Max, Count, Q, F, Case, When, Value, DecimalField
 from django.db.models.functions import TruncMonth, Coalesce
-from itertools import chain
-from operator import attrgetter
 
-from .services import procesar_pago_fifo
+from .services import procesar_pago_fifo, procesar_pagos_lote, resolver_reportes_pago, anular_pago_registrado, registrar_credito_aplicado
+from .services_banco import importar_estado_cuenta, aplicar_movimiento
+from .services_facturacion import generar_cuotas_mensuales, aplicar_moras as aplicar_moras_residencial, pronosticar_corridas, proxima_fecha_corte
+from .services_deuda import duenos_por_apartamento, resumen_de
+from .services_pasarela import registrar_notificacion
+from .services_cierre import saldo_banco_al, rango_mes
+from .services_reportes import (
+    libro_banco, resumen_anual, ResumenAnual, datos_reporte_mensual, datos_transparencia, datos_balance_residencial,
+    exportacion_cuentas_por_cobrar, exportacion_estado_cuenta, exportacion_morosidad, exportacion_libro_banco,
+    estado_cuenta, cursor_estado_cuenta, buscar_vecinos
+)
+from .exportar import FORMATOS, respuesta_exportacion, respuesta_pdf
+from .services_pdf import pdf_recibo, pdf_estado_cuenta, pdf_reporte_mensual
+from .services_cache import reporte_en_cache
+from .services_morosidad import tomar_foto_morosidad, ultima_foto, tendencia_morosidad
 
 
 # ---------------------------------------------
@@ -81,6 +98,11 @@ def dashboard(request):
                 fecha_solicitud__gte=timezone.now().date()
             ).order_by('fecha_solicitud')
 
+            # C. Pronóstico del próximo corte (qué hará el robot, sin escribir nada)
+            fecha_corte = proxima_fecha_corte(user.residencial, timezone.now().date())
+            context['proximo_corte'] = fecha_corte
+            context['pronostico_corte'] = pronosticar_corridas([user.residencial], fecha_corte)[user.residencial.id]
+
         if user.apartamento:
             context['mi_apartamento'] = user.apartamento
         
@@ -90,11 +112,8 @@ def dashboard(request):
         # MÓDULO DE FINANZAS
         mis_facturas = Factura.objects.filter(usuario=user).order_by('-fecha_emision')
         context['mis_facturas'] = mis_facturas
-        context['total_pendiente'] = Factura.objects.filter(
-            usuario=user, estado='PENDIENTE'
-        ).aggregate(
-            suma=Coalesce(Sum(Coalesce('saldo_pendiente', 'monto')), Decimal('0.00'))
-        )['suma']
+        # La deuda ya viene sumada en su ResumenDeuda (una fila por vecino)
+        context['total_pendiente'] = resumen_de(user).deuda_total
 
         # NUEVO: Marketplace items (últimos 3 días)
         hace_3_dias = timezone.now() - timedelta(days=3)
@@ -331,15 +350,13 @@ def registrar_lectura_gas(request):
         form = LecturaGasForm(request.user, request.POST)
         if form.is_valid():
             apartamento = form.cleaned_data['apartamento']
-            mes_actual = timezone.now().month
-            anio_actual = timezone.now().year
+            hoy = timezone.now().date()
             
             # 1. Validar duplicados
             existe = LecturaGas.objects.filter(
                 residencial=request.user.residencial,
                 apartamento=apartamento,
-                fecha_lectura__month=mes_actual,
-                fecha_lectura__year=anio_actual
+                fecha_lectura__range=rango_mes(hoy.year, hoy.month)
             ).exists()
             
             if existe:
@@ -375,6 +392,7 @@ def registrar_lectura_gas(request):
                         # CAMBIO IMPORTANTE AQUÍ: Usamos saldo_favor_gas
                         if residente.saldo_favor_gas > 0:
                             if residente.saldo_favor_gas >= nueva_factura.monto:
+                                abono = nueva_factura.monto
                                 residente.saldo_favor_gas -= nueva_factura.monto
                                 nueva_factura.monto_pagado = nueva_factura.monto
                                 nueva_factura.saldo_pendiente = 0
@@ -388,8 +406,11 @@ def registrar_lectura_gas(request):
                                 nueva_factura.saldo_pendiente = nueva_factura.monto - abono
                                 msg_extra = f" (💰 Se descontaron ${abono} de su saldo de Gas)"
         
-                            residente.save()
-                            nueva_factura.save()
+                            with transaction.atomic():
+                                residente.save()
+                                nueva_factura.save()
+                                # El saldo usado queda en el ledger como parte del pago que lo generó
+                                registrar_credito_aplicado([(nueva_factura, abono)], 'GAS')
 
                         lectura.factura_generada = nueva_factura
                         lectura.save()
@@ -439,62 +460,10 @@ def generar_cuotas_masivas(request):
         return redirect('dashboard')
 
     residencial = request.user.residencial
-    mes_actual = timezone.now().month
-    anio_actual = timezone.now().year
-    
-    apartamentos = Apartamento.objects.filter(residencial=residencial, monto_cuota__gt=0)
-    
-    contador = 0
-    
-    for apto in apartamentos:
-        dueno = apto.habitantes.first()
-        
-        if dueno:
-            existe = Factura.objects.filter(
-                residencial=residencial,
-                usuario=dueno,
-                tipo='CUOTA',
-                fecha_emision__month=mes_actual,
-                fecha_emision__year=anio_actual
-            ).exists()
-            
-            if not existe:
-                # 1. Creamos la factura normalmente (PENDIENTE por defecto)
-                nueva_factura = Factura.objects.create(
-                    residencial=residencial,
-                    usuario=dueno,
-                    tipo='CUOTA',
-                    concepto=f"Mantenimiento {timezone.now().strftime('%B %Y')}",
-                    monto=apto.monto_cuota,
-                    fecha_vencimiento=timezone.now().date() + timedelta(days=residencial.dias_gracia),
-                    estado='PENDIENTE',
-                    saldo_pendiente=apto.monto_cuota # Inicialmente debe todo
-                )
-                
-                # 2. LÓGICA AUTOMÁTICA DE SALDO A FAVOR (CORREGIDA: SOLO MANTENIMIENTO)
-                if dueno.saldo_favor_mantenimiento > 0:
-                    
-                    # CASO A: El saldo cubre toda la factura
-                    if dueno.saldo_favor_mantenimiento >= nueva_factura.monto:
-                        dueno.saldo_favor_mantenimiento -= nueva_factura.monto
-                        nueva_factura.monto_pagado = nueva_factura.monto
-                        nueva_factura.saldo_pendiente = 0
-                        nueva_factura.estado = 'PAGADO'
-                        nueva_factura.fecha_pago = timezone.now().date()
-                        
-                    # CASO B: El saldo es menor a la factura (Abono parcial)
-                    else:
-                        abono = dueno.saldo_favor_mantenimiento
-                        dueno.saldo_favor_mantenimiento = 0 # Se gastó todo su saldo de mantenimiento
-                        nueva_factura.monto_pagado = abono
-                        nueva_factura.saldo_pendiente = nueva_factura.monto - abono
-                        # Sigue en estado PENDIENTE, pero con menos deuda
-                    
-                    # Guardamos los cambios
-                    dueno.save()
-                    nueva_factura.save()
 
-                contador += 1
+    # ---> DELEGAMOS LA LÓGICA AL SERVICIO DE FACTURACIÓN (idempotente) <---
+    resultado = generar_cuotas_mensuales(residencial, timezone.now().date(), usuario=request.user)
+    contador = resultado['generadas']
     
     if contador > 0:
         messages.success(request, f"✅ Se generaron {contador} facturas (aplicando saldos de mantenimiento automáticamente).")
@@ -507,6 +476,11 @@ def generar_cuotas_masivas(request):
 def cuentas_por_cobrar(request):
     if request.user.rol not in ['ADMIN_RESIDENCIAL', 'SUPERADMIN']:
         return redirect('dashboard')
+
+    # ?exportar=csv|xlsx: el listado completo en streaming
+    formato = request.GET.get('exportar')
+    if formato in FORMATOS:
+        return respuesta_exportacion(formato, 'cuentas_por_cobrar', *exportacion_cuentas_por_cobrar(request.user.residencial))
     
     deudas = Factura.objects.filter(
         residencial=request.user.residencial,
@@ -538,6 +512,28 @@ def anular_pago(request, factura_id):
         messages.error(request, "Esta factura no está pagada.")
         return redirect('cuentas_por_cobrar')
 
+    # Si la factura se pagó con el ledger de pagos, se deshacen exactamente esos
+    # pagos (todas sus facturas, también las que pagó su sobrante, y el saldo
+    # a favor que les queda)
+    pagos = list(Pago.objects.filter(asignaciones__factura=factura, estado='APLICADO').distinct())
+    if pagos:
+        try:
+            with transaction.atomic():
+                resultados = [anular_pago_registrado(pago, admin=request.user) for pago in pagos]
+        except ValueError as e:
+            messages.error(request, f"⚠️ {e}")
+            return redirect('cuentas_por_cobrar')
+
+        reabiertas = sum(r['facturas_reabiertas'] for r in resultados)
+        credito = sum(r['credito_revertido'] for r in resultados)
+        messages.success(
+            request,
+            f"Pago de '{factura.concepto}' anulado correctamente. Se reabrieron {reabiertas} facturas"
+            + (f" y se descontaron ${credito} del saldo a favor." if credito else ".")
+        )
+        return redirect('cuentas_por_cobrar')
+
+    # Factura marcada pagada fuera del ledger (ej: desde el admin): solo se puede reabrir esta
     monto_anulado = factura.monto_pagado
     
     factura.estado = 'PENDIENTE'
@@ -617,10 +613,10 @@ def registrar_gasto(request):
 
     ultimos_gastos = Gasto.objects.filter(residencial=request.user.residencial).order_by('-fecha_gasto')[:10]
     
-    mes_actual = timezone.now().month
+    hoy = timezone.now().date()
     total_mes = Gasto.objects.filter(
         residencial=request.user.residencial, 
-        fecha_gasto__month=mes_actual
+        fecha_gasto__range=rango_mes(hoy.year, hoy.month)
     ).aggregate(Sum('monto'))['monto__sum'] or 0
 
     return render(request, 'core/registrar_gasto.html', {
@@ -639,178 +635,43 @@ def reporte_financiero(request):
     anio_actual = timezone.now().year
     mes_actual = timezone.now().month
 
-    # 1. TOTALES ANUALES
-    ingresos_facturas = Factura.objects.filter(
-        residencial=residencial, 
-        estado='PAGADO', 
-        fecha_pago__year=anio_actual
-    ).aggregate(Sum('monto'))['monto__sum'] or 0
-
-    # CORRECCIÓN AQUÍ: Usamos 'Apartamento__residencial' y 'fecha_pago'
-    ingresos_extra_anual = IngresoExtraordinario.objects.filter(
-        Apartamento__residencial=residencial, # <--- CAMBIO CLAVE
-        fecha_pago__year=anio_actual
-    ).aggregate(Sum('monto'))['monto__sum'] or 0
-
-    total_ingresos = ingresos_facturas + ingresos_extra_anual
-
-    total_gastos = Gasto.objects.filter(
-        residencial=residencial, 
-        fecha_gasto__year=anio_actual
-    ).aggregate(Sum('monto'))['monto__sum'] or 0
-
-    balance = total_ingresos - total_gastos
-
-    # 2. DATOS PARA GRÁFICOS
-    ingresos_qs = Factura.objects.filter(
-        residencial=residencial,
-        estado='PAGADO',
-        fecha_pago__year=anio_actual
-    ).annotate(mes=TruncMonth('fecha_pago')).values('mes').annotate(total=Sum('monto')).order_by('mes')
-
-    # CORRECCIÓN AQUÍ TAMBIÉN
-    ingresos_extra_qs = IngresoExtraordinario.objects.filter(
-        Apartamento__residencial=residencial, # <--- CAMBIO CLAVE
-        fecha_pago__year=anio_actual
-    ).annotate(mes=TruncMonth('fecha_pago')).values('mes').annotate(total=Sum('monto')).order_by('mes')
+    # Saldo con el que arrancó el mes: el cierre del mes pasado (CierreMensual)
+    inicio_mes = timezone.datetime(anio_actual, mes_actual, 1).date()
+    saldo_inicial_mes = saldo_banco_al(residencial, inicio_mes - timedelta(days=1))
+    fin_mes = (inicio_mes + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+
+    # ?exportar=csv|xlsx: el libro del mes completo, sin paginar
+    formato = request.GET.get('exportar')
+    if formato in FORMATOS:
+        return respuesta_exportacion(
+            formato, f'libro_banco_{inicio_mes:%Y_%m}',
+            *exportacion_libro_banco(residencial, inicio_mes, fin_mes, saldo_inicial_mes)
+        )
 
-    gastos_qs = Gasto.objects.filter(
-        residencial=residencial,
-        fecha_gasto__year=anio_actual
-    ).annotate(mes=TruncMonth('fecha_gasto')).values('mes').annotate(total=Sum('monto')).order_by('mes')
+    # 1. TOTALES Y SERIES DEL AÑO (una consulta por tabla, ver services_reportes)
+    resumen = resumen_anual(residencial, anio_actual)
 
-    datos_por_mes = {}
-    
-    for i in ingresos_qs:
-        mes_str = i['mes'].strftime('%B') 
-        if mes_str not in datos_por_mes: datos_por_mes[mes_str] = {'ingreso': 0, 'gasto': 0}
-        datos_por_mes[mes_str]['ingreso'] += float(i['total'])
-
-    for ie in ingresos_extra_qs:
-        mes_str = ie['mes'].strftime('%B')
-        if mes_str not in datos_por_mes: datos_por_mes[mes_str] = {'ingreso': 0, 'gasto': 0}
-        datos_por_mes[mes_str]['ingreso'] += float(ie['total'])
-
-    for g in gastos_qs:
-        mes_str = g['mes'].strftime('%B')
-        if mes_str not in datos_por_mes: datos_por_mes[mes_str] = {'ingreso': 0, 'gasto': 0}
-        datos_por_mes[mes_str]['gasto'] = float(g['total'])
-
-    bar_labels = list(datos_por_mes.keys())
-    bar_ingresos = [d['ingreso'] for d in datos_por_mes.values()]
-    bar_gastos = [d['gasto'] for d in datos_por_mes.values()]
-
-    ingresos_tipo = list(Factura.objects.filter(
-        residencial=residencial,
-        estado='PAGADO',
-        fecha_pago__year=anio_actual
-    ).values('tipo').annotate(total=Sum('monto')))
+    # 2. DATOS PARA GRÁFICOS (enero a este mes, siempre en orden)
+    bar_labels = ResumenAnual.nombres_meses(mes_actual)
+    bar_ingresos = [float(total) for total in resumen.ingresos_por_mes[:mes_actual]]
+    bar_gastos = [float(total) for total in resumen.gastos_por_mes[:mes_actual]]
 
-    pie_labels = [item['tipo'] for item in ingresos_tipo]
-    pie_data = [float(item['total']) for item in ingresos_tipo]
+    pie_labels = list(resumen.ingresos_por_tipo)
+    pie_data = [float(total) for total in resumen.ingresos_por_tipo.values()]
     
-    if ingresos_extra_anual > 0:
+    if resumen.ingresos_extraordinarios > 0:
         pie_labels.append("Extraordinarios")
-        pie_data.append(float(ingresos_extra_anual))
-
-    # 3. DATOS PARA LIBRO DIARIO
-    ingresos_historicos = Factura.objects.filter(
-        residencial=residencial, 
-        estado='PAGADO', 
-        fecha_pago__lt=timezone.datetime(anio_actual, mes_actual, 1)
-    ).aggregate(Sum('monto'))['monto__sum'] or 0
-
-    # CORRECCIÓN AQUÍ
-    ingresos_extra_historicos = IngresoExtraordinario.objects.filter(
-        Apartamento__residencial=residencial, # <--- CAMBIO CLAVE
-        fecha_pago__lt=timezone.datetime(anio_actual, mes_actual, 1)
-    ).aggregate(Sum('monto'))['monto__sum'] or 0
-    
-    gastos_historicos = Gasto.objects.filter(
-        residencial=residencial, 
-        fecha_gasto__lt=timezone.datetime(anio_actual, mes_actual, 1)
-    ).aggregate(Sum('monto'))['monto__sum'] or 0
-
-    saldo_inicial_mes = residencial.saldo_inicial + ingresos_historicos + ingresos_extra_historicos - gastos_historicos
-    saldo_acumulado = saldo_inicial_mes 
-
-    mov_ingresos = Factura.objects.filter(
-        residencial=residencial, 
-        estado='PAGADO', 
-        fecha_pago__year=anio_actual, 
-        fecha_pago__month=mes_actual
-    )
-
-    # CORRECCIÓN AQUÍ
-    mov_extras = IngresoExtraordinario.objects.filter(
-        Apartamento__residencial=residencial, # <--- CAMBIO CLAVE
-        fecha_pago__year=anio_actual,
-        fecha_pago__month=mes_actual
-    )
-
-    mov_gastos = Gasto.objects.filter(
-        residencial=residencial, 
-        fecha_gasto__year=anio_actual, 
-        fecha_gasto__month=mes_actual
-    )
-
-    # Normalización para la tabla
-    for i in mov_ingresos: 
-        i.tipo_mov = 'INGRESO'
-        i.fecha_mov = i.fecha_pago
-        i.concepto_tabla = i.concepto
-
-    for e in mov_extras:
-        e.tipo_mov = 'INGRESO'
-        e.fecha_mov = e.fecha_pago
-        e.concepto_tabla = f"💰 EXTRA: {e.concepto_detalle}"
-        e.monto = e.monto 
-        # Como el modelo no tiene 'usuario', usamos el dueño del apartamento si existe
-        if e.Apartamento and e.Apartamento.habitantes.exists():
-             e.usuario_display = e.Apartamento.habitantes.first().username
-        else:
-             e.usuario_display = "Externo/Admin"
-
-    for g in mov_gastos: 
-        g.tipo_mov = 'GASTO'
-        g.fecha_mov = g.fecha_gasto
-        g.concepto_tabla = g.descripcion
-
-    lista_movimientos = sorted(
-        chain(mov_ingresos, mov_extras, mov_gastos), 
-        key=attrgetter('fecha_mov')
-    )
+        pie_data.append(float(resumen.ingresos_extraordinarios))
 
-    tabla_movimientos = []
-    for mov in lista_movimientos:
-        if mov.tipo_mov == 'INGRESO':
-            saldo_acumulado += mov.monto
-        else:
-            saldo_acumulado -= mov.monto
-        
-        # Determinamos qué nombre de usuario mostrar
-        if hasattr(mov, 'usuario_display'):
-            user_show = mov.usuario_display
-        elif hasattr(mov, 'usuario') and mov.usuario:
-            user_show = mov.usuario.username
-        else:
-            user_show = 'Admin'
-
-        tabla_movimientos.append({
-            'fecha': mov.fecha_mov,
-            'concepto': mov.concepto_tabla,
-            'tipo': mov.tipo_mov,
-            'monto': mov.monto,
-            'saldo': saldo_acumulado,
-            'usuario': user_show
-        })
+    # 3. LIBRO DIARIO: el mes con saldo corrido, armado y paginado por la base de datos (una consulta por página)
+    libro = libro_banco(residencial, inicio_mes, fin_mes, saldo_inicial_mes, pagina=request.GET.get('page') or 1)
 
     context = {
         'anio': anio_actual,
         'mes_nombre': timezone.now().strftime('%B'),
-        'total_ingresos': total_ingresos,
-        'total_gastos': total_gastos,
-        'balance': balance,
+        'total_ingresos': resumen.total_ingresos,
+        'total_gastos': resumen.total_gastos,
+        'balance': resumen.balance,
         'bar_labels': json.dumps(bar_labels),
         'bar_ingresos': json.dumps(bar_ingresos),
         'bar_gastos': json.dumps(bar_gastos),
@@ -818,8 +679,9 @@ def reporte_financiero(request):
         'pie_data': json.dumps(pie_data),
         'saldo_inicial_banco': residencial.saldo_inicial,
         'saldo_arranque_mes': saldo_inicial_mes,
-        'tabla_movimientos': tabla_movimientos,
-        'saldo_final_mes': saldo_acumulado
+        'tabla_movimientos': libro['movimientos'],
+        'libro': libro,
+        'saldo_final_mes': libro['saldo_final']
     }
 
     return render(request, 'core/reporte_financiero.html', context)
@@ -865,6 +727,14 @@ def ver_recibo(request, factura_id):
         messages.warning(request, "Esta factura aún no ha sido pagada, no tiene recibo.")
         return redirect('dashboard')
 
+    # ?exportar=pdf: el recibo ya en PDF (generado una vez y guardado en caché)
+    if request.GET.get('exportar') == 'pdf':
+        try:
+            return respuesta_pdf(pdf_recibo(factura))
+        except ValueError as e:
+            messages.error(request, f"❌ {e}")
+            return redirect('ver_recibo', factura_id=factura.id)
+
     return render(request, 'core/recibo_print.html', {'factura': factura})
 
 
@@ -875,22 +745,13 @@ def lista_vecinos(request):
     if request.user.rol not in ['ADMIN_RESIDENCIAL', 'SUPERADMIN']:
         return redirect('dashboard')
     
-    vecinos = Usuario.objects.filter(residencial=request.user.residencial).order_by('apartamento__numero')
-    
-    # --- LÓGICA NUEVA: CALCULAR DEUDA POR VECINO ---
-    for vecino in vecinos:
-        # Buscamos sus facturas pendientes
-        deudas = Factura.objects.filter(usuario=vecino, estado='PENDIENTE')
-        
-        # Sumamos: Si tiene saldo_pendiente usamos eso, si no, usamos el monto total
-        total_deuda = sum(
-            (f.saldo_pendiente if f.saldo_pendiente is not None else f.monto) 
-            for f in deudas
+    # La deuda de cada vecino sale de su fila en ResumenDeuda (un solo JOIN, sin recorrer facturas)
+    vecinos = Usuario.objects.filter(residencial=request.user.residencial).annotate(
+        deuda_calculada=Coalesce(
+            F('resumen_deuda__deuda_mantenimiento') + F('resumen_deuda__deuda_gas'), Decimal('0.00'),
+            output_field=DecimalField(max_digits=12, decimal_places=2)
         )
-        
-        # "Pegamos" este dato temporalmente al vecino para usarlo en el HTML
-        vecino.deuda_calculada = total_deuda
-    # -----------------------------------------------
+    ).order_by('apartamento__numero')
     
     return render(request, 'core/lista_vecinos.html', {'vecinos': vecinos})
 
@@ -1049,57 +910,17 @@ def aplicar_moras(request):
         messages.warning(request, "⚠️ No tienes configurado el porcentaje de mora en la configuración del Residencial.")
         return redirect('dashboard')
 
-    # 1. Buscar TODAS las facturas vencidas de Mantenimiento
-    facturas_pendientes = Factura.objects.filter(
-        residencial=residencial,
-        tipo='CUOTA',
-        estado='PENDIENTE',
-        fecha_vencimiento__lt=hoy
-    )
-    
-    contador_aplicadas = 0
-    total_vencidas = facturas_pendientes.count()
+    # ---> DELEGAMOS EL CÁLCULO A LA BASE DE DATOS (un solo UPDATE) <---
+    contador_aplicadas = aplicar_moras_residencial(residencial, hoy, usuario=request.user)
 
-    for factura in facturas_pendientes:
-        aplicar = False
-        
-        # CASO A: Es la primera vez que se le aplica mora
-        if factura.fecha_ultima_mora is None:
-            aplicar = True
-            
-        # CASO B: Ya tiene mora, verificamos si YA SE LE COBRÓ ESTE MES
-        else:
-            # Si estamos en un mes diferente al de su última mora
-            if factura.fecha_ultima_mora.month != hoy.month or factura.fecha_ultima_mora.year != hoy.year:
-                # Salvaguarda: Que hayan pasado al menos 20 días desde la última vez.
-                # Esto evita que un administrador le dé al botón el 31 de marzo y luego el 1 de abril por error.
-                dias_pasados = (hoy - factura.fecha_ultima_mora).days
-                if dias_pasados >= 20: 
-                    aplicar = True
-
-        # --- APLICAMOS EL CASTIGO (Interés Compuesto) ---
-        if aplicar:
-            # El cálculo se hace sobre el saldo pendiente actual (incluye moras viejas)
-            recargo = factura.saldo_pendiente * (porcentaje / Decimal('100'))
-            
-            factura.monto += recargo
-            factura.saldo_pendiente += recargo
-            factura.concepto += f" (+{porcentaje}% Mora)"
-            factura.fecha_ultima_mora = hoy 
-            
-            factura.save()
-            
-            # ---> 👁️ BITÁCORA: REGISTRO DE CASTIGO AUTOMÁTICO <---
-            Bitacora.objects.create(
-                residencial=residencial,
-                usuario=request.user,
-                modulo='FINANZAS/MORAS',
-                accion=f"Aplicó mora de ${recargo:,.2f} a la cuota vencida de {factura.usuario.first_name} (Apto {factura.usuario.apartamento.numero if factura.usuario.apartamento else 'S/A'}).",
-                nivel='WARNING'
-            )
-            # ----------------------------------------------------
-            
-            contador_aplicadas += 1
+    total_vencidas = 0
+    if contador_aplicadas == 0:
+        total_vencidas = Factura.objects.filter(
+            residencial=residencial,
+            tipo='CUOTA',
+            estado='PENDIENTE',
+            fecha_vencimiento__lt=hoy
+        ).count()
 
     # --- MENSAJES DE RESPUESTA ---
     if contador_aplicadas > 0:
@@ -1148,6 +969,174 @@ def registrar_abono(request):
     return render(request, 'core/registrar_abono.html', {'form': form})
 
 
+@login_required
+def aplicar_pagos_lote(request):
+    """
+    Aplica de una vez los depósitos del estado de cuenta del banco.
+    Cada línea: apartamento, monto[, GAS|MANTENIMIENTO]. El pago se aplica al dueño del apto.
+    """
+    if request.user.rol not in ['ADMIN_RESIDENCIAL', 'SUPERADMIN']:
+        return redirect('dashboard')
+
+    resultados = []
+    errores = []
+    texto = ""
+
+    if request.method == 'POST':
+        texto = request.POST.get('lineas', '')
+
+        # 1. Interpretar las líneas
+        lineas = []
+        for numero_linea, linea in enumerate(texto.splitlines(), start=1):
+            partes = [p.strip() for p in linea.replace(';', ',').split(',')]
+            if not partes[0]:
+                continue
+            try:
+                monto = Decimal(partes[1].replace('$', ''))
+            except Exception:
+                errores.append(f"Línea {numero_linea}: monto inválido ({linea.strip()}).")
+                continue
+            if not monto.is_finite():
+                errores.append(f"Línea {numero_linea}: monto inválido ({linea.strip()}).")
+                continue
+            if monto <= 0:
+                errores.append(f"Línea {numero_linea}: el monto debe ser mayor a 0.")
+                continue
+            # Mismo tope que la pasarela: lo máximo que cabe en el DecimalField de los pagos
+            if monto >= Decimal('100000000'):
+                errores.append(f"Línea {numero_linea}: el monto excede el máximo permitido.")
+                continue
+            tipo_pago = 'GAS' if len(partes) > 2 and partes[2].upper() == 'GAS' else 'MANTENIMIENTO'
+            lineas.append((numero_linea, partes[0], monto, tipo_pago))
+
+        # 2. Dueños de los apartamentos mencionados, en una sola consulta
+        duenos = {}
+        for habitante in Usuario.objects.filter(
+            residencial=request.user.residencial,
+            apartamento__numero__in={apto for _, apto, _, _ in lineas}
+        ).select_related('apartamento').order_by('apartamento_id', 'id'):
+            duenos.setdefault(habitante.apartamento.numero, habitante)
+
+        pagos = []
+        for numero_linea, apto, monto, tipo_pago in lineas:
+            if apto not in duenos:
+                errores.append(f"Línea {numero_linea}: no existe el apartamento {apto} o no tiene residentes.")
+                continue
+            pagos.append((duenos[apto], monto, tipo_pago))
+
+        # 3. Un solo lote: una transacción y escrituras masivas
+        if pagos:
+            resultados = procesar_pagos_lote(pagos)
+            total = sum(r['monto'] for r in resultados)
+
+            Bitacora.objects.create(
+                residencial=request.user.residencial,
+                usuario=request.user,
+                modulo='FINANZAS',
+                accion=f"Aplicó en lote {len(resultados)} pagos del estado de cuenta por ${total:,.2f}.",
+                nivel='INFO'
+            )
+            messages.success(request, f"✅ Se aplicaron {len(resultados)} pagos por ${total:,.2f}.")
+            texto = ""
+
+        if errores:
+            messages.warning(request, f"⚠️ {len(errores)} líneas no se aplicaron. Revísalas abajo.")
+
+    return render(request, 'core/aplicar_pagos_lote.html', {
+        'resultados': resultados,
+        'errores': errores,
+        'texto': texto
+    })
+
+
+@login_required
+def conciliacion_bancaria(request):
+    """Carga del estado de cuenta del banco y cola de depósitos por revisar."""
+    if request.user.rol not in ['ADMIN_RESIDENCIAL', 'SUPERADMIN']:
+        return redirect('dashboard')
+
+    residencial = request.user.residencial
+
+    if request.method == 'POST':
+        accion = request.POST.get('accion')
+
+        if accion == 'importar' and request.FILES.get('archivo'):
+            # Se lee como flujo de texto: el CSV nunca se carga completo en memoria
+            archivo = io.TextIOWrapper(request.FILES['archivo'].file, encoding='utf-8-sig', newline='')
+            try:
+                resumen = importar_estado_cuenta(residencial, archivo, usuario=request.user)
+            except (ValueError, UnicodeDecodeError, csv.Error) as e:
+                messages.error(request, f"⚠️ No se pudo leer el archivo: {e}")
+            else:
+                messages.success(
+                    request,
+                    f"✅ {resumen['aplicadas']} depósitos aplicados (${resumen['monto_aplicado']:,.2f}). "
+                    f"{resumen['en_revision']} en revisión, {resumen['duplicadas']} duplicados, {resumen['ignoradas']} líneas ignoradas."
+                )
+
+        elif accion == 'aplicar':
+            movimiento = get_object_or_404(MovimientoBancario, pk=request.POST.get('movimiento_id'), residencial=residencial)
+            vecino = get_object_or_404(Usuario, pk=request.POST.get('usuario_id'), residencial=residencial)
+            tipo_pago = 'GAS' if request.POST.get('tipo_pago') == 'GAS' else 'MANTENIMIENTO'
+            try:
+                resultado = aplicar_movimiento(movimiento, vecino, tipo_pago, admin=request.user)
+                messages.success(request, f"✅ Depósito aplicado a {vecino}. Se pagaron {resultado['facturas_pagadas']} facturas.")
+            except ValueError as e:
+                messages.warning(request, f"⚠️ {e}")
+
+        elif accion == 'descartar':
+            movimiento = get_object_or_404(MovimientoBancario, pk=request.POST.get('movimiento_id'), residencial=residencial)
+            if movimiento.estado == 'REVISION':
+                movimiento.estado = 'DESCARTADO'
+                movimiento.motivo = f"Descartado por {request.user.username}."
+                movimiento.save()
+                messages.warning(request, "Depósito descartado.")
+
+        return redirect('conciliacion_bancaria')
+
+    en_revision = MovimientoBancario.objects.filter(residencial=residencial, estado='REVISION').order_by('fecha', 'id')
+    recientes = MovimientoBancario.objects.filter(residencial=residencial, estado='APLICADO').select_related(
+        'usuario__apartamento'
+    ).order_by('-fecha_registro')[:50]
+    vecinos = Usuario.objects.filter(residencial=residencial, apartamento__isnull=False).select_related(
+        'apartamento'
+    ).order_by('apartamento__numero')
+
+    return render(request, 'core/conciliacion_bancaria.html', {
+        'en_revision': en_revision,
+        'recientes': recientes,
+        'vecinos': vecinos
+    })
+
+
+# API DE PAGOS (pasarela / webhook del banco)
+@csrf_exempt
+@require_POST
+def api_notificar_pago(request):
+    """
+    Recibe un aviso de pago en JSON y lo deja en cola (202). No aplica nada aquí:
+    el comando `procesar_notificaciones_pago` lo reparte después con el FIFO.
+    Reenviar la misma `clave` responde 200 con el estado del aviso original.
+    """
+    token = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+    residencial = Residencial.objects.filter(token_pasarela=token).first() if token else None
+    if residencial is None:
+        return JsonResponse({'error': 'Token inválido.'}, status=401)
+
+    try:
+        datos = json.loads(request.body)
+        notificacion, creada = registrar_notificacion(residencial, datos)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    return JsonResponse({
+        'id': notificacion.id,
+        'clave': notificacion.clave_idempotencia,
+        'estado': notificacion.estado,
+        'duplicada': not creada
+    }, status=202 if creada else 200)
+
+
 # 1. VISTA PARA EL VECINO (SUBIR PAGO)
 @login_required
 def reportar_pago(request):
@@ -1172,62 +1161,49 @@ def gestionar_reportes_pago(request):
         return redirect('dashboard')
 
     if request.method == 'POST':
-        reporte_id = request.POST.get('reporte_id')
-        accion = request.POST.get('accion') 
-        
-        reporte = get_object_or_404(ReportePago, pk=reporte_id, residencial=request.user.residencial)
-        
-        if reporte.estado == 'PENDIENTE':
-            if accion == 'aprobar':
-                vecino = reporte.usuario
-                monto_disponible = reporte.monto
-                tipo_pago = reporte.tipo_pago  # ¿Qué está pagando?
-
-                # ---> DELEGAMOS LA LÓGICA AL SERVICIO FIFO <---
-                resultado = procesar_pago_fifo(usuario=vecino, monto=monto_disponible, tipo_pago=tipo_pago)
-
-                msg_extra = ""
-                if resultado['sobrante'] > 0:
-                    msg_extra = f"y sobraron ${resultado['sobrante']} al saldo de {resultado['bolsillo_afectado']}."
+        accion = request.POST.get('accion')
+        # Un solo reporte (botón de la tarjeta) o varios marcados (acción en lote)
+        reporte_ids = request.POST.getlist('reporte_ids') or [request.POST.get('reporte_id')]
+        reporte_ids = [int(rid) for rid in reporte_ids if rid and rid.isdigit()]
+
+        if accion in ('aprobar', 'rechazar') and reporte_ids:
+            # ---> DELEGAMOS LA LÓGICA AL SERVICIO (FIFO + BITÁCORA EN LOTE) <---
+            resultado = resolver_reportes_pago(request.user.residencial, reporte_ids, accion, admin=request.user)
+            procesados = resultado['procesados']
+
+            if len(procesados) == 1 and accion == 'aprobar':
+                reporte, fifo = procesados[0]
+                if fifo['sobrante'] > 0:
+                    msg_extra = f"y sobraron ${fifo['sobrante']} al saldo de {fifo['bolsillo_afectado']}."
                 else:
                     msg_extra = "cubriendo deuda pendiente."
-
-                reporte.estado = 'APROBADO'
-                reporte.comentario_admin = f"Pago aplicado a {tipo_pago}. Se pagaron {resultado['facturas_pagadas']} facturas."
-                reporte.save()
-
-                # ---> 👁️ BITÁCORA: REGISTRO DE APROBACIÓN <---
-                Bitacora.objects.create(
-                    residencial=request.user.residencial,
-                    usuario=request.user,
-                    modulo='FINANZAS',
-                    accion=f"Aprobó un pago de ${reporte.monto} reportado por {vecino.first_name} {vecino.last_name}.",
-                    nivel='INFO'
+                messages.success(request, f"Pago de {reporte.usuario.first_name} aplicado exitosamente {msg_extra}")
+            elif len(procesados) == 1:
+                messages.warning(request, "Reporte de pago rechazado.")
+            elif procesados and accion == 'aprobar':
+                messages.success(
+                    request,
+                    f"✅ {len(procesados)} pagos aprobados por ${resultado['monto_total']:,.2f}. "
+                    f"Se pagaron {resultado['facturas_pagadas']} facturas."
                 )
-                # ----------------------------------------------
+            elif procesados:
+                messages.warning(request, f"{len(procesados)} reportes de pago rechazados.")
 
-                messages.success(request, f"Pago de {vecino.first_name} aplicado exitosamente {msg_extra}")
-                
-            elif accion == 'rechazar':
-                reporte.estado = 'RECHAZADO'
-                reporte.save()
-                
-                # ---> 👁️ BITÁCORA: REGISTRO DE RECHAZO <---
-                Bitacora.objects.create(
-                    residencial=request.user.residencial,
-                    usuario=request.user,
-                    modulo='FINANZAS',
-                    accion=f"Rechazó un comprobante de pago de ${reporte.monto} enviado por {reporte.usuario.first_name}.",
-                    nivel='WARNING'
-                )
-                # ----------------------------------------------
-                
-                messages.warning(request, "Reporte de pago rechazado.")
-            
-            return redirect('gestionar_reportes_pago')
+            if resultado['omitidos']:
+                messages.info(request, f"ℹ️ {resultado['omitidos']} reportes ya habían sido procesados y se omitieron.")
+
+        return redirect('gestionar_reportes_pago')
+
+    reportes = ReportePago.objects.filter(residencial=request.user.residencial).select_related(
+        'usuario__apartamento'
+    ).order_by('estado', '-fecha_reporte')
+    pagina = Paginator(reportes, 25).get_page(request.GET.get('page'))
+    pendientes_count = ReportePago.objects.filter(residencial=request.user.residencial, estado='PENDIENTE').count()
 
-    reportes = ReportePago.objects.filter(residencial=request.user.residencial).order_by('estado', '-fecha_reporte')
-    return render(request, 'core/gestionar_reportes.html', {'reportes': reportes})
+    return render(request, 'core/gestionar_reportes.html', {
+        'reportes': pagina,
+        'pendientes_count': pendientes_count
+    })
 
 # 3. VISTA "MATRIZ FINANCIERA" (LO QUE PEDISTE)
 @login_required
@@ -1235,55 +1211,11 @@ def balance_residencial(request):
     if request.user.rol not in ['ADMIN_RESIDENCIAL', 'SUPERADMIN']:
         return redirect('dashboard')
 
-    apartamentos = Apartamento.objects.filter(residencial=request.user.residencial).order_by('numero')
-    
-    data_financiera = []
-    
-    # Acumuladores globales
-    total_deuda_global = 0
-    total_favor_mant_global = 0  # Nuevo acumulador Mant.
-    total_favor_gas_global = 0   # Nuevo acumulador Gas
+    residencial = request.user.residencial
+    # Deuda y saldos a favor por apartamento (services_reportes, en caché por versión de datos)
+    datos = reporte_en_cache(residencial, 'balance', lambda: datos_balance_residencial(residencial))
 
-    for apt in apartamentos:
-        dueno = apt.habitantes.first()
-        
-        deuda = 0
-        saldo_mant = 0
-        saldo_gas = 0
-        nombre_dueno = "--- Sin Asignar ---"
-        
-        if dueno:
-            nombre_dueno = f"{dueno.first_name} {dueno.last_name}"
-            
-            # --- CORRECCIÓN CLAVE: Leemos los dos bolsillos nuevos ---
-            saldo_mant = dueno.saldo_favor_mantenimiento or 0
-            saldo_gas = dueno.saldo_favor_gas or 0
-            
-            # Calculamos deuda real (Sumando saldos pendientes)
-            facturas_pendientes = Factura.objects.filter(usuario=dueno, estado='PENDIENTE')
-            deuda = sum(f.saldo_pendiente for f in facturas_pendientes)
-
-        # Agregamos los datos desglosados a la lista
-        data_financiera.append({
-            'apto': apt.numero,
-            'dueno': nombre_dueno,
-            'deuda': deuda,
-            'saldo_mant': saldo_mant, # Columna nueva
-            'saldo_gas': saldo_gas,   # Columna nueva
-            'estado': 'Moroso' if deuda > 0 else 'Al día'
-        })
-        
-        # Sumamos a los totales globales
-        total_deuda_global += deuda
-        total_favor_mant_global += saldo_mant
-        total_favor_gas_global += saldo_gas
-
-    return render(request, 'core/balance_residencial.html', {
-        'data': data_financiera,
-        'total_deuda': total_deuda_global,
-        'total_mant': total_favor_mant_global, # Pasamos total Mant.
-        'total_gas': total_favor_gas_global    # Pasamos total Gas.
-    })
+    return render(request, 'core/balance_residencial.html', datos)
 
 @login_required
 def registrar_ingreso_extraordinario(request):
@@ -1342,6 +1274,15 @@ def reporte_gas_whatsapp(request):
     nombre_mes = f"{meses[mes_reporte]} {anio_reporte}"
     
     apartamentos = Apartamento.objects.filter(residencial=residencial).order_by('numero')
+    duenos = duenos_por_apartamento(residencial)
+    
+    # Lecturas del mes de todos los apartamentos en una sola consulta
+    lecturas_mes = {}
+    for lectura in LecturaGas.objects.filter(
+        residencial=residencial,
+        fecha_lectura__range=rango_mes(anio_reporte, mes_reporte)
+    ).order_by('id'):
+        lecturas_mes.setdefault(lectura.apartamento_id, lectura)
     
     # 2. Agrupar por edificio (Primera letra del apto, ej: "A" de "A-101")
     datos_por_edificio = {}
@@ -1357,14 +1298,10 @@ def reporte_gas_whatsapp(request):
                 'subtotal_pagar': Decimal('0.00')
             }
             
-        dueno = apt.habitantes.first()
+        dueno = duenos.get(apt.id)
         
-        # Buscar la lectura de este mes para este apto
-        lectura_mes = LecturaGas.objects.filter(
-            apartamento=apt, 
-            fecha_lectura__month=mes_reporte, 
-            fecha_lectura__year=anio_reporte
-        ).first()
+        # La lectura de este mes para este apto
+        lectura_mes = lecturas_mes.get(apt.id)
         
         galones = lectura_mes.consumo_galones if lectura_mes else Decimal('0.00')
         costo_mes = galones * precio_galon
@@ -1373,8 +1310,7 @@ def reporte_gas_whatsapp(request):
         saldo_favor = Decimal('0.00')
         
         if dueno:
-            facturas_gas = Factura.objects.filter(usuario=dueno, tipo='GAS', estado='PENDIENTE')
-            deuda_total_gas = sum((f.saldo_pendiente or f.monto) for f in facturas_gas)
+            deuda_total_gas = resumen_de(dueno).deuda_gas
             saldo_favor = dueno.saldo_favor_gas or Decimal('0.00')
             
         a_pagar = deuda_total_gas
@@ -1480,51 +1416,19 @@ def reporte_mensual_dinamico(request):
     # ----------------------------------------
     # ----------------------------------------
 
-    # 2. CÁLCULO DE INGRESOS DEL PERIODO
-    ingresos_mant = Factura.objects.filter(
-        residencial=residencial, tipo='CUOTA', estado='PAGADO', 
-        fecha_pago__year=anio_seleccionado, fecha_pago__month=mes_seleccionado
-    ).aggregate(Sum('monto'))['monto__sum'] or Decimal('0.00')
-
-    ingresos_gas = Factura.objects.filter(
-        residencial=residencial, tipo='GAS', estado='PAGADO', 
-        fecha_pago__year=anio_seleccionado, fecha_pago__month=mes_seleccionado
-    ).aggregate(Sum('monto'))['monto__sum'] or Decimal('0.00')
-
-    ingresos_extra = IngresoExtraordinario.objects.filter(
-        Apartamento__residencial=residencial, 
-        fecha_pago__year=anio_seleccionado, fecha_pago__month=mes_seleccionado
-    ).aggregate(Sum('monto'))['monto__sum'] or Decimal('0.00')
-
-    total_ingresos_periodo = ingresos_mant + ingresos_gas + ingresos_extra
+    # ?exportar=pdf: el mismo reporte en PDF (en caché mientras no cambien los datos)
+    if request.GET.get('exportar') == 'pdf':
+        try:
+            return respuesta_pdf(pdf_reporte_mensual(residencial, anio_seleccionado, mes_seleccionado))
+        except ValueError as e:
+            messages.error(request, f"❌ {e}")
+            return redirect(f"{request.path}?mes={mes_seleccionado}&anio={anio_seleccionado}")
 
-    # 3. CÁLCULO DE GASTOS DEL PERIODO
-    gastos_qs = Gasto.objects.filter(
-        residencial=residencial, 
-        fecha_gasto__year=anio_seleccionado, fecha_gasto__month=mes_seleccionado
+    # 2-4. INGRESOS, GASTOS Y BALANCE DEL BANCO DEL PERIODO (services_reportes, en caché por versión de datos)
+    datos = reporte_en_cache(
+        residencial, 'mensual', lambda: datos_reporte_mensual(residencial, anio_seleccionado, mes_seleccionado),
+        anio=anio_seleccionado, mes=mes_seleccionado
     )
-    total_gastos_periodo = gastos_qs.aggregate(Sum('monto'))['monto__sum'] or Decimal('0.00')
-
-    balance_del_periodo = total_ingresos_periodo - total_gastos_periodo
-
-    # 4. CÁLCULO DEL BALANCE GLOBAL ESPERADO EN EL BANCO (Hasta este mes)
-    import calendar
-    ultimo_dia_mes = calendar.monthrange(anio_seleccionado, mes_seleccionado)[1]
-    fecha_corte = timezone.datetime(anio_seleccionado, mes_seleccionado, ultimo_dia_mes).date()
-
-    ingresos_historicos = Factura.objects.filter(
-        residencial=residencial, estado='PAGADO', fecha_pago__lte=fecha_corte
-    ).aggregate(Sum('monto'))['monto__sum'] or Decimal('0.00')
-
-    extras_historicos = IngresoExtraordinario.objects.filter(
-        Apartamento__residencial=residencial, fecha_pago__lte=fecha_corte
-    ).aggregate(Sum('monto'))['monto__sum'] or Decimal('0.00')
-
-    gastos_historicos = Gasto.objects.filter(
-        residencial=residencial, fecha_gasto__lte=fecha_corte
-    ).aggregate(Sum('monto'))['monto__sum'] or Decimal('0.00')
-
-    balance_esperado_banco = residencial.saldo_inicial + ingresos_historicos + extras_historicos - gastos_historicos
 
     # Preparar listas de meses y años para el formulario
     lista_meses = [{'id': i, 'nombre': timezone.datetime(2000, i, 1).strftime('%B').capitalize()} for i in range(1, 13)]
@@ -1535,17 +1439,7 @@ def reporte_mensual_dinamico(request):
         'anio_seleccionado': anio_seleccionado,
         'lista_meses': lista_meses,
         'lista_anios': lista_anios,
-        
-        'ingresos_mant': ingresos_mant,
-        'ingresos_gas': ingresos_gas,
-        'ingresos_extra': ingresos_extra,
-        'total_ingresos_periodo': total_ingresos_periodo,
-        
-        'gastos_detalle': gastos_qs,
-        'total_gastos_periodo': total_gastos_periodo,
-        
-        'balance_del_periodo': balance_del_periodo,
-        'balance_esperado_banco': balance_esperado_banco
+        **datos
     }
 
     return render(request, 'core/reporte_mensual_dinamico.html', context)
@@ -1557,29 +1451,47 @@ def reporte_estado_cuenta(request):
 
     residencial = request.user.residencial
     
-    # Lista de vecinos para el selector
-    vecinos = Usuario.objects.filter(residencial=residencial).order_by('apartamento__numero')
-    
     vecino_seleccionado = None
-    facturas = []
+    pagina = {"facturas": [], "saldo_inicial": Decimal('0.00'), "siguiente": None}
     total_deuda = Decimal('0.00')
 
-    # Si se seleccionó un vecino en el formulario
+    # Si se seleccionó un vecino en el buscador
     usuario_id = request.GET.get('usuario_id')
     if usuario_id:
-        vecino_seleccionado = get_object_or_404(Usuario, id=usuario_id, residencial=residencial)
+        vecino_seleccionado = get_object_or_404(
+            Usuario.objects.select_related('apartamento'), id=usuario_id, residencial=residencial
+        )
+
+        formato = request.GET.get('exportar')
+        if formato in FORMATOS:
+            return respuesta_exportacion(
+                formato, f'estado_cuenta_{vecino_seleccionado.username}', *exportacion_estado_cuenta(vecino_seleccionado)
+            )
+        if formato == 'pdf':
+            try:
+                return respuesta_pdf(pdf_estado_cuenta(vecino_seleccionado))
+            except ValueError as e:
+                messages.error(request, f"❌ {e}")
+                return redirect(f"{request.path}?usuario_id={vecino_seleccionado.id}")
         
-        # Traemos todas sus facturas (pagadas y pendientes) ordenadas de la más nueva a la más vieja
-        facturas = Factura.objects.filter(usuario=vecino_seleccionado).order_by('-fecha_emision')
+        # Una página de sus facturas (de la más nueva a la más vieja) con el saldo acumulado de cada una
+        antes = None
+        if request.GET.get('antes'):
+            try:
+                antes = cursor_estado_cuenta(request.GET['antes'])
+            except ValueError as e:
+                messages.error(request, f"❌ {e}")
+        pagina = estado_cuenta(vecino_seleccionado, antes=antes)
         
-        # Calculamos la deuda total actual
-        deudas = facturas.filter(estado='PENDIENTE')
-        total_deuda = sum((f.saldo_pendiente if f.saldo_pendiente is not None else f.monto) for f in deudas)
+        # La deuda total actual, desde su ResumenDeuda
+        total_deuda = resumen_de(vecino_seleccionado).deuda_total
 
     context = {
-        'vecinos': vecinos,
         'vecino_seleccionado': vecino_seleccionado,
-        'facturas': facturas,
+        'facturas': pagina['facturas'],
+        'saldo_inicial': pagina['saldo_inicial'],
+        'siguiente': pagina['siguiente'],
+        'es_primera_pagina': not request.GET.get('antes'),
         'total_deuda': total_deuda,
         'hoy': timezone.now().date(),
         'residencial': residencial
@@ -1587,6 +1499,13 @@ def reporte_estado_cuenta(request):
     
     return render(request, 'core/reporte_estado_cuenta.html', context)
 
+@login_required
+def buscar_vecinos_estado_cuenta(request):
+    """Buscador del estado de cuenta: hasta 20 vecinos del residencial por apartamento o nombre (JSON)."""
+    if request.user.rol not in ['ADMIN_RESIDENCIAL', 'SUPERADMIN']:
+        return JsonResponse({'error': 'No autorizado.'}, status=403)
+    return JsonResponse({'vecinos': buscar_vecinos(request.user.residencial, request.GET.get('q'))})
+
 @login_required
 def reporte_morosidad(request):
     if request.user.rol not in ['ADMIN_RESIDENCIAL', 'SUPERADMIN']:
@@ -1594,56 +1513,41 @@ def reporte_morosidad(request):
 
     residencial = request.user.residencial
     hoy = timezone.now().date()
-    hace_30 = hoy - timedelta(days=30)
-    hace_60 = hoy - timedelta(days=60)
-    hace_90 = hoy - timedelta(days=90)
-    
-    # 1. ORM Mágico: Expresión para determinar deuda (saldo_pendiente si existe, sino monto)
-    deuda_expr = Coalesce('facturas__saldo_pendiente', 'facturas__monto')
-
-    # 2. Consultamos vecinos y anotamos (agrupamos) todas sus deudas directo en Base de Datos
-    vecinos_anotados = Usuario.objects.filter(
-        residencial=residencial, 
-        facturas__estado='PENDIENTE'
-    ).annotate(
-        deuda_total_calc=Coalesce(Sum(deuda_expr), Decimal('0.00')),
-        al_dia_calc=Coalesce(Sum(deuda_expr, filter=Q(facturas__fecha_vencimiento__gte=hoy)), Decimal('0.00')),
-        dias_30_calc=Coalesce(Sum(deuda_expr, filter=Q(facturas__fecha_vencimiento__lt=hoy, facturas__fecha_vencimiento__gte=hace_30)), Decimal('0.00')),
-        dias_60_calc=Coalesce(Sum(deuda_expr, filter=Q(facturas__fecha_vencimiento__lt=hace_30, facturas__fecha_vencimiento__gte=hace_60)), Decimal('0.00')),
-        dias_90_calc=Coalesce(Sum(deuda_expr, filter=Q(facturas__fecha_vencimiento__lt=hace_60, facturas__fecha_vencimiento__gte=hace_90)), Decimal('0.00')),
-        mas_90_calc=Coalesce(Sum(deuda_expr, filter=Q(facturas__fecha_vencimiento__lt=hace_90)), Decimal('0.00'))
-    ).filter(deuda_total_calc__gt=0).order_by('-deuda_total_calc')
-
-    datos_morosidad = []
-    totales_globales = {
-        'al_dia': Decimal('0.00'), 'dias_30': Decimal('0.00'), 'dias_60': Decimal('0.00'),
-        'dias_90': Decimal('0.00'), 'mas_90': Decimal('0.00'), 'total': Decimal('0.00')
-    }
 
-    # 3. Ensamblamos el diccionario en un solo bucle rápido para el frontend
-    for v in vecinos_anotados:
-        vecino_data = {
-            'usuario': v,
-            'apto': v.apartamento.numero if v.apartamento else 'S/A',
-            'al_dia': v.al_dia_calc,
-            'dias_30': v.dias_30_calc,
-            'dias_60': v.dias_60_calc,
-            'dias_90': v.dias_90_calc,
-            'mas_90': v.mas_90_calc,
-            'total': v.deuda_total_calc
-        }
-        datos_morosidad.append(vecino_data)
-        
-        totales_globales['al_dia'] += v.al_dia_calc
-        totales_globales['dias_30'] += v.dias_30_calc
-        totales_globales['dias_60'] += v.dias_60_calc
-        totales_globales['dias_90'] += v.dias_90_calc
-        totales_globales['mas_90'] += v.mas_90_calc
-        totales_globales['total'] += v.deuda_total_calc
-    
+    # "Actualizar": vuelve a tomar la foto de hoy con los pagos que entraron después del comando nocturno
+    if request.method == 'POST':
+        tomar_foto_morosidad(residencial, hoy)
+        messages.success(request, "✅ Reporte de morosidad actualizado.")
+        return redirect('reporte_morosidad')
+
+    # La última foto (MorosidadResidencial + MorosidadVecino): abrir la página no suma facturas
+    # ni la toma; si es de otro día se avisa que está desactualizada
+    foto = ultima_foto(residencial, hoy)
+    fecha_foto = foto.fecha if foto else hoy
+
+    # ?exportar=csv|xlsx: las mismas filas de la foto que se ven en pantalla
+    formato = request.GET.get('exportar')
+    if formato in FORMATOS:
+        return respuesta_exportacion(formato, f'morosidad_{fecha_foto:%Y_%m_%d}', *exportacion_morosidad(residencial, fecha_foto))
+    filas = MorosidadVecino.objects.filter(
+        residencial=residencial, fecha=fecha_foto
+    ).select_related('usuario__apartamento').order_by('-total')
+
+    # Tendencia de 24 meses del residencial, o de un vecino al hacer clic en su fila
+    vecino = None
+    vecino_id = request.GET.get('vecino', '')
+    if vecino_id:
+        if not vecino_id.isdigit():
+            raise Http404("Vecino no válido.")
+        vecino = get_object_or_404(Usuario, pk=int(vecino_id), residencial=residencial)
+
     context = {
-        'datos_morosidad': datos_morosidad,
-        'totales_globales': totales_globales,
+        'datos_morosidad': filas,
+        'totales_globales': foto,
+        'foto': foto,
+        'foto_desactualizada': foto is None or foto.fecha < hoy,
+        'vecino': vecino,
+        'tendencia': tendencia_morosidad(residencial, hoy, usuario=vecino),
         'hoy': hoy,
         'residencial': residencial
     }
@@ -1661,62 +1565,11 @@ def reporte_transparencia(request):
     anio_raw = str(request.GET.get('anio', hoy.year)).replace('\xa0', '').replace(' ', '').replace(',', '')
     anio_seleccionado = int(anio_raw)
 
-    # 1. PROYECCIÓN VS RECAUDACIÓN (Eficiencia de Cobro)
-    # Buscamos las cuotas generadas en ESTE mes
-    facturas_mes = Factura.objects.filter(
-        residencial=residencial,
-        tipo='CUOTA',
-        fecha_emision__year=anio_seleccionado,
-        fecha_emision__month=mes_seleccionado
+    # 1-2. EFICIENCIA DE COBRO Y GASTOS POR CATEGORÍA (services_reportes, en caché por versión de datos)
+    datos = reporte_en_cache(
+        residencial, 'transparencia', lambda: datos_transparencia(residencial, anio_seleccionado, mes_seleccionado),
+        anio=anio_seleccionado, mes=mes_seleccionado
     )
-    
-    proyectado = facturas_mes.aggregate(Sum('monto'))['monto__sum'] or Decimal('0.00')
-    
-    # Calculamos cuánto de ese monto facturado ya entró al banco
-    recaudado_pendientes = facturas_mes.filter(estado='PENDIENTE').aggregate(
-        suma=Coalesce(Sum(F('monto') - Coalesce('saldo_pendiente', 'monto')), Decimal('0.00'))
-    )['suma']
-    recaudado_pagados = facturas_mes.filter(estado='PAGADO').aggregate(
-        suma=Coalesce(Sum('monto'), Decimal('0.00'))
-    )['suma']
-    recaudado = recaudado_pendientes + recaudado_pagados
-
-    eficiencia = 0
-    if proyectado > 0:
-        eficiencia = (recaudado / proyectado) * 100
-
-    # 2. GASTOS POR CATEGORÍA
-    gastos_mes = Gasto.objects.filter(
-        residencial=residencial,
-        fecha_gasto__year=anio_seleccionado,
-        fecha_gasto__month=mes_seleccionado
-    )
-    total_gastos = gastos_mes.aggregate(Sum('monto'))['monto__sum'] or Decimal('0.00')
-
-    # Agrupamos los gastos por categoría en la base de datos
-    gastos_por_categoria = gastos_mes.values('categoria').annotate(total=Sum('monto')).order_by('-total')
-    
-    # --- CORRECCIÓN AQUÍ: Usamos TUS categorías exactas ---
-    cat_dict = dict(Gasto.CATEGORIAS)
-    
-    # Preparamos las listas para el gráfico de Chart.js
-    chart_labels = []
-    chart_data = []
-    lista_gastos_tabla = []
-    
-    for g in gastos_por_categoria:
-        # Busca el nombre bonito ('Compra de Gas (Camión)') basado en el código ('GAS')
-        nombre = cat_dict.get(g['categoria'], g['categoria'])
-        total_cat = float(g['total'])
-        porcentaje = (total_cat / float(total_gastos) * 100) if total_gastos > 0 else 0
-        
-        chart_labels.append(nombre)
-        chart_data.append(total_cat)
-        lista_gastos_tabla.append({
-            'nombre': nombre,
-            'monto': total_cat,
-            'porcentaje': porcentaje
-        })
 
     lista_meses = [{'id': i, 'nombre': timezone.datetime(2000, i, 1).strftime('%B').capitalize()} for i in range(1, 13)]
     lista_anios = range(2024, hoy.year + 2)
@@ -1727,15 +1580,7 @@ def reporte_transparencia(request):
         'lista_meses': lista_meses,
         'lista_anios': lista_anios,
         
-        'proyectado': proyectado,
-        'recaudado': float(recaudado),
-        'eficiencia': float(eficiencia),
-        'faltante': float(proyectado) - float(recaudado),
-        
-        'total_gastos': total_gastos,
-        'lista_gastos_tabla': lista_gastos_tabla,
-        'chart_labels': json.dumps(chart_labels),
-        'chart_data': json.dumps(chart_data),
+        **datos,
         'residencial': residencial
     }
     
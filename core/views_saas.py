@@ -3,12 +3,14 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
 from django.utils import timezone
 from datetime import timedelta
-from django.db.models import Sum, Count
+from django.db.models import Sum, Count, Avg, Max
 from django.db import transaction
+from django.conf import settings
 
-from .models import Residencial, SuscripcionResidencial, PlanSuscripcion, Usuario, FacturaSaaS
+from .models import Residencial, SuscripcionResidencial, PlanSuscripcion, Usuario, FacturaSaaS, EjecucionRobot
 from .forms import ResidencialOnboardingForm
 from .services import AnaliticaSaaSService
+from .services_cache import estadisticas_cache, reiniciar_contadores
 
 def is_superadmin(user):
     return user.is_superuser
@@ -269,3 +271,53 @@ def toggle_modulo_seguridad(request, residencial_id):
     messages.success(request, f"Módulo de Seguridad {estado} para {residencial.nombre}.")
     return redirect('detalle_cliente', residencial_id=residencial.id)
 
+
+@user_passes_test(is_superadmin, login_url='/dashboard/')
+def ejecuciones_robot(request):
+    """Corridas recientes de los robots de cobro y los residenciales que más tiempo consumen."""
+    desde = timezone.now().date() - timedelta(days=30)
+
+    ejecuciones = EjecucionRobot.objects.select_related('residencial').order_by('-fecha_corrida', '-duracion_ms')[:200]
+
+    # Residenciales que dominan la ventana de facturación (últimos 30 días)
+    mas_lentos = EjecucionRobot.objects.filter(fecha_corrida__gte=desde).values(
+        'residencial__id', 'residencial__nombre'
+    ).annotate(
+        total_ms=Sum('duracion_ms'),
+        promedio_ms=Avg('duracion_ms'),
+        maximo_ms=Max('duracion_ms'),
+        filas=Sum('filas_afectadas'),
+        corridas=Count('id')
+    ).order_by('-total_ms')[:10]
+
+    errores_recientes = EjecucionRobot.objects.filter(fecha_corrida__gte=desde, estado='ERROR').count()
+
+    context = {
+        'ejecuciones': ejecuciones,
+        'mas_lentos': mas_lentos,
+        'errores_recientes': errores_recientes,
+        'desde': desde
+    }
+    return render(request, 'core/saas/ejecuciones_robot.html', context)
+
+
+@user_passes_test(is_superadmin, login_url='/dashboard/')
+def cache_reportes(request):
+    """Aciertos y fallos de la caché de reportes (services_cache), con opción de reiniciar los contadores."""
+    if request.method == 'POST':
+        reiniciar_contadores()
+        messages.success(request, "Contadores de la caché reiniciados.")
+        return redirect('cache_reportes')
+
+    estadisticas = estadisticas_cache()
+    aciertos = sum(e['aciertos'] for e in estadisticas)
+    total = aciertos + sum(e['fallos'] for e in estadisticas)
+
+    context = {
+        'estadisticas': estadisticas,
+        'aciertos': aciertos,
+        'total': total,
+        'porcentaje': (aciertos * 100 / total) if total else 0,
+        'backend': settings.CACHES['reportes']['BACKEND'].rsplit('.', 1)[-1]
+    }
+    return render(request, 'core/saas/cache_reportes.html', context)